@@ -0,0 +1,471 @@
+# standard imports
+import os
+import re
+import time
+import logging
+
+# external imports
+from hexathon import strip_0x
+from chainlib.hash import keccak256
+from chainqueue.error import (
+        DuplicateTxError,
+        NotLocalTxError,
+        )
+from chainqueue.store.base import from_key
+from chaind.adapters.fs import ChaindFsAdapter
+from chaind.adapters.base import ChaindAdapter
+from chainqueue import Status
+from chainqueue.store.fs import (
+        IndexStore,
+        CounterStore,
+        )
+from shep.store.base import re_processedname
+from shep.error import StateInvalid
+
+# local imports
+from chaind.eth.cache import EthCacheTx
+from chaind.eth.error import QueueBusyError
+from chaind.eth.snapshot import (
+        snapshot_read,
+        snapshot_write,
+        )
+from chaind.eth.store.sqlite import (
+        shared_factory,
+        SqliteIndexStore,
+        SqliteCounterStore,
+        )
+from chaind.eth.store.log import shared_factory as shared_log_factory
+from chaind.eth.store.fs import (
+        SyncSet,
+        SyncFileStoreFactory,
+        SyncIndexStore,
+        SyncCounterStore,
+        )
+from chaind.eth.track import load_index_file
+
+logg = logging.getLogger(__name__)
+
+# state listings modified less than this long before the last view of the queue are listed again, to allow for coarse modification times
+VIEW_SLACK_NS = 2000000000
+
+
+class EthFsAdapter(ChaindFsAdapter):
+    """Filesystem queue adapter for the eth queuer.
+
+    Writes to the filesystem store are not synced to disk individually.
+
+    If deferred_commit is set, the adapter is used for group commit. Transactions added by put, and their enqueue, are only validated and kept in memory until commit. Commit writes them all to the store, and then syncs only the files and directories written since the last commit. Clients should only be acknowledged after commit returns, and buffered transactions cannot be read back before it.
+
+    If a known hash index is given, it is seeded from the store hash index, and duplicate transactions are rejected by put before the store is accessed.
+
+    If admission control is given, put raises chaind.eth.error.QueueBusyError instead of adding a transaction when a queue depth limit has been reached.
+
+    If a snapshot path is given, the view of transactions in the queue is seeded from the snapshot at startup, and reconciled with the states changed in the store since the snapshot was taken. Keeping the view costs a decode of every transaction added, so the queuer only gives a snapshot path together with admission control.
+
+    :param known_index: Index of transaction hashes in the queue
+    :type known_index: chaind.eth.index.KnownHashIndex
+    :param admission: Queue depth limits
+    :type admission: chaind.eth.admission.AdmissionControl
+    :param snapshot_path: Path of queue state snapshot to start from and to save to
+    :type snapshot_path: str
+    :param deferred_commit: If set, transactions are only written to the store and synced by commit
+    :type deferred_commit: bool
+    """
+
+    # record sender and nonce in the hash index on put
+    index_senders = False
+
+    def __init__(self, chain_spec, path, cache_adapter, dispatcher, known_index=None, admission=None, snapshot_path=None, digest_bytes=32, deferred_commit=False, event_callback=None, **kwargs):
+        if deferred_commit:
+            self.sync_set = SyncSet()
+            factory = SyncFileStoreFactory(path, use_lock=True, sync_set=self.sync_set)
+            state_store = Status(factory.add, allow_invalid=True, event_callback=event_callback)
+            index_store = SyncIndexStore(os.path.join(path, 'tx'), digest_bytes=digest_bytes, sync_set=self.sync_set)
+            counter_store = SyncCounterStore(path, sync_set=self.sync_set)
+            ChaindAdapter.__init__(self, chain_spec, state_store, index_store, counter_store, cache_adapter, dispatcher, **kwargs)
+        else:
+            super(EthFsAdapter, self).__init__(chain_spec, path, cache_adapter, dispatcher, digest_bytes=digest_bytes, event_callback=event_callback, **kwargs)
+        self.setup(chain_spec, path, cache_adapter, known_index=known_index, admission=admission, snapshot_path=snapshot_path, digest_bytes=digest_bytes)
+        if deferred_commit:
+            self.buffer = {}
+
+
+    def setup(self, chain_spec, path, cache_adapter, known_index=None, admission=None, snapshot_path=None, digest_bytes=32):
+        self.chain_spec = chain_spec
+        self.path = path
+        self.cache_adapter = cache_adapter
+        self.commits = 0
+        self.buffer = None
+        self.admission = admission
+        self.entries = {}
+        self.view_time = None
+        self.snapshot_path = snapshot_path
+        if self.snapshot_path != None:
+            try:
+                snapshot = snapshot_read(self.snapshot_path)
+            except ValueError as e:
+                logg.warning('ignoring queue snapshot: {}'.format(e))
+                snapshot = None
+            if snapshot != None:
+                (self.entries, self.view_time) = snapshot
+            self.refresh()
+        self.known_index = known_index
+        if self.known_index != None:
+            self.load_known(digest_bytes=digest_bytes)
+
+
+    def load_known(self, digest_bytes=32):
+        self.known_index.load(self.store.index_store.store.master_file, digest_bytes=digest_bytes)
+
+
+    def load_since(self, cursor, digest_bytes=32):
+        """Load the hashes added to the store hash index after the given cursor.
+
+        :param cursor: Position in the hash index to load from
+        :type cursor: int
+        :rtype: tuple
+        :returns: Hashes, as bytes, and the next cursor
+        """
+        return load_index_file(self.store.index_store.store.master_file, cursor, digest_bytes=digest_bytes)
+
+
+    def put(self, signed_tx):
+        k = None
+        if self.known_index != None:
+            k = keccak256(bytes.fromhex(strip_0x(signed_tx)))
+            known = self.known_index.have(k)
+            if known == True:
+                raise DuplicateTxError(k.hex())
+            elif known == None:
+                logg.debug('tx {} possibly known, checking store'.format(k.hex()))
+
+        tx = None
+        if self.admission != None or self.snapshot_path != None or self.buffer != None or self.index_senders:
+            tx = self.cache_adapter(self.chain_spec)
+            tx.deserialize(signed_tx)
+        if self.admission != None:
+            if self.admission.due():
+                self.refresh()
+            if not self.admission.admit(tx.sender):
+                raise QueueBusyError('queue depth limit reached for tx {}'.format(tx.hash), retry_after=self.admission.retry_after)
+
+        if self.buffer != None:
+            tx_hash = self.__buffer_put(tx)
+        else:
+            tx_hash = super(EthFsAdapter, self).put(signed_tx)
+        if self.index_senders:
+            self.store.index_store.set_sender(tx_hash, tx.sender, tx.nonce)
+
+        if k != None:
+            self.known_index.add(k)
+        if tx != None:
+            self.entries[tx_hash] = (0, tx.nonce, tx.sender,)
+        if self.admission != None:
+            self.admission.add(tx_hash, tx.sender)
+        return tx_hash
+
+
+    def __buffer_put(self, tx):
+        if self.buffer.get(tx.hash) != None:
+            raise DuplicateTxError(tx.hash)
+        try:
+            self.store.index_store.get(tx.hash)
+            raise DuplicateTxError(tx.hash)
+        except NotLocalTxError:
+            pass
+        self.buffer[tx.hash] = [tx.src, False]
+        return tx.hash
+
+
+    def enqueue(self, tx_hash):
+        if self.buffer != None:
+            v = self.buffer.get(tx_hash)
+            if v != None:
+                v[1] = True
+                return
+        return super(EthFsAdapter, self).enqueue(tx_hash)
+
+
+    def __state(self, name):
+        try:
+            return self.store.state_store.from_name(name)
+        except AttributeError:
+            pass
+        try:
+            return self.store.state_store.from_elements(name)
+        except (ValueError, StateInvalid):
+            pass
+        return None
+
+
+    def state_names(self):
+        """List the state names in the store, with the time their listing was last modified.
+
+        :rtype: generator
+        :returns: State name and modification time in nanoseconds
+        """
+        for d in os.listdir(self.path):
+            if not re.match(re_processedname, d):
+                continue
+            fp = os.path.join(self.path, d)
+            try:
+                st = os.stat(fp)
+            except FileNotFoundError:
+                continue
+            if not os.path.isdir(fp):
+                continue
+            yield (d, st.st_mtime_ns,)
+
+
+    def state_keys_for(self, name):
+        """List the state store keys in the given state, without reading their contents.
+
+        :param name: State name
+        :type name: str
+        :rtype: generator
+        :returns: State store key
+        """
+        try:
+            for k in os.listdir(os.path.join(self.path, name)):
+                yield k
+        except FileNotFoundError:
+            pass
+
+
+    def state_keys(self):
+        """List all state store keys, without reading their contents.
+
+        :rtype: generator
+        :returns: State name and key
+        """
+        for (name, mtime) in self.state_names():
+            for k in self.state_keys_for(name):
+                yield (name, k,)
+
+
+    def state_contents(self, name, k):
+        f = open(os.path.join(self.path, name, k), 'r')
+        v = f.read()
+        f.close()
+        return v
+
+
+    def __states(self, since=None):
+        for (name, mtime) in self.state_names():
+            state = self.__state(name)
+            if state == None:
+                logg.warning('unknown state {} in queue store'.format(name))
+                continue
+            if state & self.store.FINAL > 0:
+                continue
+            changed = True
+            if since != None and mtime != None:
+                changed = mtime >= since - VIEW_SLACK_NS
+            yield (name, state, changed,)
+
+
+    def __keys(self, name):
+        for k in self.state_keys_for(name):
+            try:
+                (t, n, tx_hash) = from_key(k)
+            except ValueError:
+                continue
+            yield (tx_hash, k,)
+
+
+    def active(self):
+        """List transactions in the queue which are not final.
+
+        :rtype: dict
+        :returns: State name, state and state store key, by transaction hash
+        """
+        r = {}
+        for (name, state, changed) in self.__states():
+            for (tx_hash, k) in self.__keys(name):
+                r[tx_hash] = (name, state, k,)
+        return r
+
+
+    def refresh(self):
+        """Refresh the view of transactions in the queue from the store, and update admission control with it.
+
+        Only the listings of states changed since the previous view are read again, and for those only the store keys are listed. Transactions in states not changed since are kept as they were. The stored signed transactions are read only for transactions which are neither known from the previous view, nor added by put.
+        """
+        view_time = time.time_ns()
+        entries = {}
+        missing = []
+        signed_txs = []
+        for (name, state, changed) in self.__states(since=self.view_time):
+            if not changed:
+                for (tx_hash, v) in self.entries.items():
+                    if v[0] == state:
+                        entries[tx_hash] = v
+                continue
+            for (tx_hash, k) in self.__keys(name):
+                v = self.entries.get(tx_hash)
+                if v != None:
+                    entries[tx_hash] = (state, v[1], v[2],)
+                    continue
+                try:
+                    v = self.state_contents(name, k)
+                except FileNotFoundError:
+                    continue
+                if v == None or len(v) == 0:
+                    continue
+                missing.append((tx_hash, state,))
+                signed_txs.append(v)
+
+        if len(signed_txs) > 0:
+            logg.info('recovering {} txs not in queue view'.format(len(signed_txs)))
+            for ((tx_hash, state), tx) in zip(missing, EthCacheTx.deserialize_many(self.chain_spec, signed_txs)):
+                entries[tx_hash] = (state, tx.nonce, tx.sender,)
+
+        self.entries = entries
+        self.view_time = view_time
+        if self.admission != None:
+            senders = {}
+            for (tx_hash, v) in entries.items():
+                senders[tx_hash] = v[2]
+            self.admission.refresh(senders)
+
+
+    def save_snapshot(self):
+        """Save the view of transactions in the queue to the snapshot path.
+
+        The view is saved as of the last refresh, with the transactions added by put since. Changes made in the store after the last refresh are picked up when the snapshot is loaded.
+        """
+        if self.snapshot_path == None or self.view_time == None:
+            return
+        snapshot_write(self.snapshot_path, self.entries, self.view_time)
+
+
+    def commit(self):
+        """Write the transactions buffered since the last commit to the store, and sync the files and directories written to disk.
+
+        A buffered transaction which turns out to be in the store already is skipped.
+        """
+        if self.buffer == None:
+            return
+        c = 0
+        for (tx_hash, (signed_tx, enqueue)) in self.buffer.items():
+            try:
+                ChaindFsAdapter.put(self, signed_tx)
+            except DuplicateTxError as e:
+                logg.error('buffered tx {} already in store: {}'.format(tx_hash, e))
+                continue
+            if enqueue:
+                ChaindFsAdapter.enqueue(self, tx_hash)
+            c += 1
+        self.buffer = {}
+        self.store.counter.sync()
+        r = self.sync_set.sync()
+        self.commits += 1
+        logg.debug('commit {} wrote {} txs and synced {} paths'.format(self.commits, c, r))
+
+
+class EthSqliteAdapter(EthFsAdapter):
+    """Queue adapter for the eth queuer which keeps states, hash index and counter in a single SQLite database file in the queue directory, instead of one file per entry.
+
+    The sender and nonce of each transaction are recorded in the hash index, for lookup with by_sender.
+
+    If deferred_commit is set, writes are only committed by commit, in a single transaction. This relies on the queuer calling commit for each group of submissions before acknowledging them, as it does when COMMIT_BATCH_SIZE is set.
+
+    All adapters in a process share a single database connection, see chaind.eth.store.sqlite.shared_factory. Once one of them defers its writes, the writes of the others are only committed by commit too, and the dispatch processor commits after changing states.
+
+    See chaind.eth.adapter.EthFsAdapter
+    """
+
+    index_senders = True
+    # the dispatch processor commits its state changes
+    dispatch_commit = True
+
+    def __init__(self, chain_spec, path, cache_adapter, dispatcher, known_index=None, admission=None, snapshot_path=None, digest_bytes=32, deferred_commit=False, event_callback=None, **kwargs):
+        self.factory = shared_factory(os.path.join(path, 'queue.sqlite'), deferred=deferred_commit)
+        state_store = Status(self.factory.add, allow_invalid=True, event_callback=event_callback)
+        index_store = SqliteIndexStore(self.factory)
+        counter_store = SqliteCounterStore(self.factory)
+        ChaindAdapter.__init__(self, chain_spec, state_store, index_store, counter_store, cache_adapter, dispatcher, **kwargs)
+        self.setup(chain_spec, path, cache_adapter, known_index=known_index, admission=admission, snapshot_path=snapshot_path, digest_bytes=digest_bytes)
+
+
+    def load_known(self, digest_bytes=32):
+        c = 0
+        for k in self.store.index_store.hashes():
+            self.known_index.add(bytes.fromhex(k))
+            c += 1
+        logg.info('known hash index loaded {} hashes from {}'.format(c, self.factory.path))
+
+
+    def load_since(self, cursor, digest_bytes=32):
+        return self.store.index_store.load_since(cursor)
+
+
+    def by_sender(self, sender):
+        return self.store.index_store.by_sender(sender)
+
+
+    def state_names(self):
+        for name in self.factory.ls():
+            yield (name, None,)
+
+
+    def state_keys_for(self, name):
+        for (k,) in self.factory.read('SELECT k FROM state WHERE ns = ?', (name,)):
+            yield k
+
+
+    def state_contents(self, name, k):
+        return self.factory.add(name).get(k)
+
+
+    def commit(self):
+        self.factory.commit()
+        self.commits += 1
+
+
+class EthLogAdapter(EthFsAdapter):
+    """Queue adapter for the eth queuer which appends signed transactions and state transitions to a segmented log in the queue directory, instead of writing one file per entry.
+
+    The hash index and counter are kept in the filesystem, as with EthFsAdapter.
+
+    As with EthFsAdapter, appends are only synced to disk by commit. If deferred_commit is set, commit also syncs the hash index and counter files written since the last commit. Segments of superseded records are reclaimed by the compaction done on commit.
+
+    All adapters in a process share a single log factory, see chaind.eth.store.log.shared_factory.
+
+    See chaind.eth.store.log.LogStoreFactory
+    """
+
+    def __init__(self, chain_spec, path, cache_adapter, dispatcher, known_index=None, admission=None, snapshot_path=None, digest_bytes=32, deferred_commit=False, event_callback=None, segment_size=67108864, **kwargs):
+        self.factory = shared_log_factory(os.path.join(path, 'log'), segment_size=segment_size)
+        state_store = Status(self.factory.add, allow_invalid=True, event_callback=event_callback)
+        self.sync_set = None
+        if deferred_commit:
+            self.sync_set = SyncSet()
+            index_store = SyncIndexStore(os.path.join(path, 'tx'), digest_bytes=digest_bytes, sync_set=self.sync_set)
+        else:
+            index_store = IndexStore(os.path.join(path, 'tx'), digest_bytes=digest_bytes)
+        counter_store = CounterStore(path)
+        ChaindAdapter.__init__(self, chain_spec, state_store, index_store, counter_store, cache_adapter, dispatcher, **kwargs)
+        self.setup(chain_spec, path, cache_adapter, known_index=known_index, admission=admission, snapshot_path=snapshot_path, digest_bytes=digest_bytes)
+
+
+    def state_names(self):
+        for name in self.factory.ls():
+            yield (name, None,)
+
+
+    def state_keys_for(self, name):
+        for (k, v) in self.factory.items(name):
+            yield k
+
+
+    def state_contents(self, name, k):
+        return self.factory.add(name).get(k)
+
+
+    def commit(self):
+        self.factory.commit()
+        if self.sync_set != None:
+            self.sync_set.add_file(os.path.join(self.path, '.counter'))
+            self.sync_set.sync()
+        self.commits += 1
@@ -0,0 +1,107 @@
+# standard imports
+import time
+import random
+import logging
+
+logg = logging.getLogger(__name__)
+
+# result code returned to queuer clients for transactions not admitted
+RESULT_BUSY = 3
+
+
+def backoff_delay(attempt, retry_after=1.0, limit=30.0):
+    """Calculate how long a client should wait before retrying a transaction the queuer was too busy to admit.
+
+    The delay doubles with every attempt, starting at the delay advised by the queuer, with up to 10% random jitter.
+
+    :param attempt: Number of attempts already rejected, starting at 1
+    :type attempt: int
+    :param retry_after: Delay advised by the queuer
+    :type retry_after: float
+    :param limit: Maximum delay
+    :type limit: float
+    :rtype: float
+    :returns: Delay in seconds
+    """
+    v = min(limit, retry_after * (2 ** (attempt - 1)))
+    return v + v * random.random() * 0.1
+
+
+class AdmissionControl:
+    """Tracks the depth of the queue, overall and per sender, to decide whether new transactions may be admitted.
+
+    Transactions added through the queuer are counted immediately. Transactions leaving the queue, by becoming final, are only discovered when the view is refreshed from the store, which is due every refresh_interval seconds.
+
+    A limit of 0 disables that limit.
+
+    :param max_depth: Maximum number of transactions in the queue
+    :type max_depth: int
+    :param max_sender_depth: Maximum number of transactions in the queue for one sender
+    :type max_sender_depth: int
+    :param retry_after: Seconds a client is told to wait before retrying a rejected transaction
+    :type retry_after: float
+    :param refresh_interval: Seconds between refreshes from the store
+    :type refresh_interval: float
+    """
+
+    def __init__(self, max_depth=0, max_sender_depth=0, retry_after=1.0, refresh_interval=5.0):
+        self.max_depth = max_depth
+        self.max_sender_depth = max_sender_depth
+        self.retry_after = retry_after
+        self.refresh_interval = refresh_interval
+        self.senders = {}
+        self.counts = {}
+        self.refreshed = None
+
+
+    def due(self):
+        if self.refreshed == None:
+            return True
+        return time.monotonic() - self.refreshed >= self.refresh_interval
+
+
+    def admit(self, sender):
+        """Check whether a transaction from the given sender may be added.
+
+        :param sender: Sender address
+        :type sender: str
+        :rtype: bool
+        :returns: True if admitted
+        """
+        if self.max_depth > 0 and len(self.senders) >= self.max_depth:
+            logg.warning('queue depth limit {} reached'.format(self.max_depth))
+            return False
+        if self.max_sender_depth > 0 and self.counts.get(sender, 0) >= self.max_sender_depth:
+            logg.warning('queue depth limit {} reached for sender {}'.format(self.max_sender_depth, sender))
+            return False
+        return True
+
+
+    def have(self, tx_hash):
+        return tx_hash in self.senders
+
+
+    def add(self, tx_hash, sender):
+        if tx_hash in self.senders:
+            return
+        self.senders[tx_hash] = sender
+        self.counts[sender] = self.counts.get(sender, 0) + 1
+
+
+    def refresh(self, senders):
+        """Replace the view of the queue.
+
+        :param senders: Senders of all transactions in the queue, by transaction hash
+        :type senders: dict
+        """
+        counts = {}
+        for sender in senders.values():
+            counts[sender] = counts.get(sender, 0) + 1
+        logg.debug('admission queue depth {} -> {} in {} senders'.format(len(self.senders), len(senders), len(counts)))
+        self.senders = senders
+        self.counts = counts
+        self.refreshed = time.monotonic()
+
+
+    def __len__(self):
+        return len(self.senders)
@@ -0,0 +1,151 @@
+# standard imports
+import os
+import json
+import logging
+import tempfile
+
+# external imports
+from hexathon import strip_0x
+
+logg = logging.getLogger(__name__)
+
+
+class BlockCache:
+    """Filesystem cache of blocks and receipts retrieved by the syncer, shared by all sessions of a chain.
+
+    Blocks are stored by block hash, and receipts by block hash and transaction hash, which never change content. A block height only maps to a block hash once put_number has been called for it, which the caller should only do for blocks deep enough not to be reorganized. The mapping is dropped with invalidate if the parent hash of a block does not match.
+
+    When the total size of the cache exceeds max_bytes, the least recently used files are removed until it is below nine tenths of it.
+
+    :param path: Cache root directory
+    :type path: str
+    :param chain_spec: Chain spec of the cached chain
+    :type chain_spec: chainlib.chain.ChainSpec
+    :param max_bytes: Maximum total size of cache files, 0 for no limit
+    :type max_bytes: int
+    """
+
+    def __init__(self, path, chain_spec, max_bytes=1073741824):
+        self.path = os.path.join(path, str(chain_spec).replace(':', '_'))
+        self.block_path = os.path.join(self.path, 'block')
+        self.number_path = os.path.join(self.path, 'number')
+        self.receipt_path = os.path.join(self.path, 'receipt')
+        for p in [self.block_path, self.number_path, self.receipt_path]:
+            os.makedirs(p, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.size = 0
+        for (d, ds, fs) in os.walk(self.path):
+            for f in fs:
+                self.size += os.stat(os.path.join(d, f)).st_size
+        self.hits = 0
+        self.misses = 0
+
+
+    def __read(self, fp):
+        try:
+            f = open(fp, 'r')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        v = f.read()
+        f.close()
+        os.utime(fp)
+        self.hits += 1
+        return v
+
+
+    def __write(self, fp, v):
+        if os.path.exists(fp):
+            return
+        d = os.path.dirname(fp)
+        os.makedirs(d, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=d)
+        f = os.fdopen(fd, 'w')
+        f.write(v)
+        f.close()
+        os.replace(tmp, fp)
+        self.size += len(v)
+        if self.max_bytes > 0 and self.size > self.max_bytes:
+            self.evict()
+
+
+    def evict(self):
+        entries = []
+        for (d, ds, fs) in os.walk(self.path):
+            for f in fs:
+                fp = os.path.join(d, f)
+                st = os.stat(fp)
+                entries.append((st.st_mtime, st.st_size, fp,))
+        entries.sort()
+        low = self.max_bytes * 9 // 10
+        c = 0
+        for (t, l, fp) in entries:
+            if self.size <= low:
+                break
+            try:
+                os.unlink(fp)
+            except FileNotFoundError:
+                pass
+            self.size -= l
+            c += 1
+        logg.info('block cache evicted {} files, size now {}'.format(c, self.size))
+
+
+    def get_block(self, number):
+        """Get a cached block by height.
+
+        :param number: Block height
+        :type number: int
+        :rtype: dict
+        :returns: Block source, or None if not cached
+        """
+        block_hash = self.__read(os.path.join(self.number_path, str(number)))
+        if block_hash == None:
+            return None
+        v = self.__read(os.path.join(self.block_path, block_hash))
+        if v == None:
+            return None
+        return json.loads(v)
+
+
+    def put_block(self, src):
+        """Add a block to the cache by its hash.
+
+        :param src: Block source
+        :type src: dict
+        """
+        block_hash = strip_0x(src['hash']).lower()
+        self.__write(os.path.join(self.block_path, block_hash), json.dumps(src))
+
+
+    def put_number(self, number, block_hash):
+        self.__write(os.path.join(self.number_path, str(number)), strip_0x(block_hash).lower())
+
+
+    def invalidate(self, number):
+        fp = os.path.join(self.number_path, str(number))
+        try:
+            l = os.stat(fp).st_size
+            os.unlink(fp)
+            self.size -= l
+        except FileNotFoundError:
+            pass
+
+
+    def __receipt_path(self, block_hash, tx_hash):
+        return os.path.join(self.receipt_path, strip_0x(block_hash).lower(), strip_0x(tx_hash).lower())
+
+
+    def get_receipt(self, block_hash, tx_hash):
+        v = self.__read(self.__receipt_path(block_hash, tx_hash))
+        if v == None:
+            return None
+        return json.loads(v)
+
+
+    def put_receipt(self, block_hash, tx_hash, rcpt):
+        self.__write(self.__receipt_path(block_hash, tx_hash), json.dumps(rcpt))
+
+
+    def __str__(self):
+        return 'block cache {} size {} hits {} misses {}'.format(self.path, self.size, self.hits, self.misses)
@@ -1,5 +1,8 @@
 # standard imports
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 # external imports
 from hexathon import strip_0x
@@ -9,6 +12,9 @@ from chainqueue.cache import (
         )
 from chainlib.eth.tx import unpack
 from chainlib.encode import TxHexNormalizer
+from chainlib.chain import ChainSpec
+from chainlib.hash import keccak256
+from rlp import decode as rlp_decode
 
 logg = logging.getLogger(__name__)
 
@@ -28,19 +34,314 @@ class Normalizer(TxHexNormalizer, NoopNormalizer):
 eth_normalizer = Normalizer()
 
 
+class DecodeCache:
+    """Bounded LRU memo of decoded signed transactions, keyed by chain spec and signed transaction bytes.
+
+    Entries are evicted when either the entry count or the total size of the keys exceeds its limit. A limit of 0 disables that bound; an entry count of 0 disables the cache altogether.
+
+    :param capacity: Maximum number of entries
+    :type capacity: int
+    :param capacity_bytes: Maximum total size of cached signed transactions, in bytes
+    :type capacity_bytes: int
+    """
+
+    def __init__(self, capacity=4096, capacity_bytes=0):
+        self.capacity = capacity
+        self.capacity_bytes = capacity_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def get(self, chain_spec, k):
+        k = (str(chain_spec), k,)
+        with self.lock:
+            try:
+                v = self.entries[k]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(k)
+            self.hits += 1
+        return v
+
+
+    def put(self, chain_spec, k, v):
+        if self.capacity == 0:
+            return
+        k = (str(chain_spec), k,)
+        with self.lock:
+            if k in self.entries:
+                self.entries.move_to_end(k)
+                return
+            self.entries[k] = v
+            self.size += len(k[1])
+            while len(self.entries) > self.capacity or (self.capacity_bytes > 0 and self.size > self.capacity_bytes):
+                (ko, vo) = self.entries.popitem(last=False)
+                self.size -= len(ko[1])
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __str__(self):
+        return 'decode cache {} entries {} bytes hits {} misses {}'.format(len(self.entries), self.size, self.hits, self.misses)
+
+
+def decode(signed_tx_bytes, chain_spec):
+    tx = unpack(signed_tx_bytes, chain_spec)
+    logg.debug('have tx {}'.format(tx))
+    return (
+        eth_normalizer.hash(tx['hash']),
+        eth_normalizer.address(tx['from']),
+        eth_normalizer.address(tx['to']),
+        eth_normalizer.value(tx['nonce']),
+        eth_normalizer.value(tx['value']),
+        )
+
+
+def _decode_worker(args):
+    (signed_tx_bytes, chain_str) = args
+    return decode(signed_tx_bytes, ChainSpec.from_chain_str(chain_str))
+
+
 class EthCacheTx(CacheTx):
 
+    decode_cache = DecodeCache()
+    decode_processes = 1
+
     def __init__(self, chain_spec):
         super(EthCacheTx, self).__init__(chain_spec)
 
 
     def deserialize(self, signed_tx):
         signed_tx_bytes = bytes.fromhex(strip_0x(signed_tx))
-        tx = unpack(signed_tx_bytes, self.chain_spec)
-        logg.debug('have tx {}'.format(tx))
-        self.hash = eth_normalizer.hash(tx['hash'])
-        self.sender = eth_normalizer.address(tx['from'])
-        self.recipient = eth_normalizer.address(tx['to'])
-        self.nonce = eth_normalizer.value(tx['nonce'])
-        self.value = eth_normalizer.value(tx['value'])
+        v = self.decode_cache.get(self.chain_spec, signed_tx_bytes)
+        if v == None:
+            v = decode(signed_tx_bytes, self.chain_spec)
+            self.decode_cache.put(self.chain_spec, signed_tx_bytes, v)
+        self.apply_decoded(signed_tx, v)
+
+
+    def apply_decoded(self, signed_tx, v):
+        (self.hash, self.sender, self.recipient, self.nonce, self.value) = v
         self.src = signed_tx
+
+
+    @classmethod
+    def deserialize_many(cls, chain_spec, signed_txs, processes=None):
+        """Deserialize a batch of signed transactions, spreading decoding and sender recovery over a process pool.
+
+        Transactions already in the decode cache are not decoded again. Results are returned in input order.
+
+        :param chain_spec: Chain spec to decode transactions with
+        :type chain_spec: chainlib.chain.ChainSpec
+        :param signed_txs: Signed transactions, in hex
+        :type signed_txs: iterable of str
+        :param processes: Number of worker processes; if not set, the class decode_processes value is used
+        :type processes: int
+        :rtype: list of chaind.eth.cache.EthCacheTx
+        :returns: Deserialized transaction objects
+        """
+        if processes == None:
+            processes = cls.decode_processes
+
+        signed_txs = list(signed_txs)
+        keys = []
+        decoded = []
+        missing = []
+        for i, signed_tx in enumerate(signed_txs):
+            k = bytes.fromhex(strip_0x(signed_tx))
+            v = cls.decode_cache.get(chain_spec, k)
+            if v == None:
+                missing.append(i)
+            keys.append(k)
+            decoded.append(v)
+
+        if len(missing) > 0:
+            chain_str = str(chain_spec)
+            work = [(keys[i], chain_str,) for i in missing]
+            if processes > 1 and len(work) > 1:
+                chunksize = max(1, len(work) // (processes * 4))
+                logg.debug('decoding {} txs with {} processes chunk size {}'.format(len(work), processes, chunksize))
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    r = list(pool.map(_decode_worker, work, chunksize=chunksize))
+            else:
+                r = [decode(keys[i], chain_spec) for i in missing]
+            for i, v in zip(missing, r):
+                cls.decode_cache.put(chain_spec, keys[i], v)
+                decoded[i] = v
+
+        txs = []
+        for i, v in enumerate(decoded):
+            tx = cls(chain_spec)
+            tx.apply_decoded(signed_txs[i], v)
+            txs.append(tx)
+        return txs
+
+
+class EthLazyCacheTx:
+    """Compact alternative to EthCacheTx which keeps the signed transaction as bytes and decodes fields on first access.
+
+    Hash, nonce, recipient and value only require the RLP structure; the sender is recovered from the signature only when it is read, and shares the EthCacheTx decode cache.
+
+    :param chain_spec: Chain spec to decode transactions with
+    :type chain_spec: chainlib.chain.ChainSpec
+    """
+
+    __slots__ = (
+        'chain_spec',
+        'raw',
+        'block_number',
+        'tx_index',
+        'timestamp',
+        '_hash',
+        '_sender',
+        '_recipient',
+        '_nonce',
+        '_value',
+        '_fields',
+        '_extra',
+        )
+
+    normalizer = eth_normalizer
+
+    def __init__(self, chain_spec):
+        self.chain_spec = chain_spec
+        self.raw = None
+        self.block_number = None
+        self.tx_index = None
+        self.timestamp = None
+        self._hash = None
+        self._sender = None
+        self._recipient = None
+        self._nonce = None
+        self._value = None
+        self._fields = False
+        self._extra = None
+
+
+    def deserialize(self, signed_tx):
+        self.raw = bytes.fromhex(strip_0x(signed_tx))
+        if len(self.raw) == 0:
+            raise ValueError('empty signed tx')
+
+
+    def __decode_fields(self):
+        if self._fields:
+            return
+        d = rlp_decode(self.raw)
+        if self._nonce == None:
+            self._nonce = int.from_bytes(d[0], 'big')
+        if self._recipient == None and len(d[3]) > 0:
+            self._recipient = eth_normalizer.address(d[3].hex())
+        if self._value == None:
+            self._value = int.from_bytes(d[4], 'big')
+        self._fields = True
+
+
+    @property
+    def src(self):
+        if self.raw == None:
+            return None
+        return self.raw.hex()
+
+
+    @property
+    def hash(self):
+        if self._hash == None and self.raw != None:
+            self._hash = eth_normalizer.hash(keccak256(self.raw).hex())
+        return self._hash
+
+
+    @hash.setter
+    def hash(self, v):
+        self._hash = v
+
+
+    @property
+    def sender(self):
+        if self._sender == None and self.raw != None:
+            v = EthCacheTx.decode_cache.get(self.chain_spec, self.raw)
+            if v == None:
+                v = decode(self.raw, self.chain_spec)
+                EthCacheTx.decode_cache.put(self.chain_spec, self.raw, v)
+            self._sender = v[1]
+        return self._sender
+
+
+    @sender.setter
+    def sender(self, v):
+        self._sender = v
+
+
+    @property
+    def recipient(self):
+        if self.raw != None:
+            self.__decode_fields()
+        return self._recipient
+
+
+    @recipient.setter
+    def recipient(self, v):
+        self._recipient = v
+
+
+    @property
+    def nonce(self):
+        if self.raw != None:
+            self.__decode_fields()
+        return self._nonce
+
+
+    @nonce.setter
+    def nonce(self, v):
+        self._nonce = v
+
+
+    @property
+    def value(self):
+        if self.raw != None:
+            self.__decode_fields()
+        return self._value
+
+
+    @value.setter
+    def value(self, v):
+        self._value = v
+
+
+    def confirm(self, block_number, tx_index, timestamp):
+        self.block_number = block_number
+        self.tx_index = tx_index
+        self.timestamp = timestamp
+
+
+    def init(self, tx_hash, nonce, sender, recipient, value):
+        self.hash = self.normalizer.hash(tx_hash)
+        self.sender = self.normalizer.address(sender)
+        self.recipient = self.normalizer.address(recipient)
+        self.nonce = nonce
+        self.value = value
+
+
+    def set(self, k, v):
+        if self._extra == None:
+            self._extra = {}
+        self._extra['v_' + k] = v
+
+
+    def __getattr__(self, k):
+        if k[:2] == 'v_':
+            try:
+                return self._extra[k]
+            except (KeyError, TypeError):
+                pass
+        raise AttributeError(k)
+
+
+    def __str__(self):
+        return '{}: {} ({}) -> {} = {}'.format(self.hash, self.sender, self.nonce, self.recipient, self.value)
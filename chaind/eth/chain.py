@@ -1,5 +1,10 @@
+# standard imports
+import logging
+
 # external imports
 from chainlib.interface import ChainInterface
+from chainlib.jsonrpc import JSONRPCRequest
+from chainlib.error import RPCException
 from chainlib.eth.block import (
         block_by_number,
         block_latest,
@@ -9,13 +14,152 @@ from chainlib.eth.tx import (
         receipt,
         Tx,
         )
+from hexathon import (
+        add_0x,
+        strip_0x,
+        )
+
+logg = logging.getLogger(__name__)
+
+
+def block_receipts(hsh, id_generator=None):
+    """Generate json-rpc query to retrieve all transaction receipts of a block.
+
+    :param hsh: Block hash, in hex
+    :type hsh: str
+    :param id_generator: json-rpc id generator
+    :type id_generator: JSONRPCIdGenerator
+    :rtype: dict
+    :returns: rpc query object
+    """
+    j = JSONRPCRequest(id_generator=id_generator)
+    o = j.template()
+    o['method'] = 'eth_getBlockReceipts'
+    o['params'].append(add_0x(hsh))
+    return j.finalize(o)
+
+
+class EthLazyBlock(Block):
+    """Block which keeps the transactions as they were returned by the node, and only builds a transaction object for a transaction when it is asked for.
+
+    The hash, sender and recipient of a transaction can be read from the block source with tx_hash, tx_sender and tx_recipient, without building the transaction object. Transaction objects are kept once built.
+    """
+
+    def __init__(self, src=None, dialect_filter=None):
+        self.tx_cache = {}
+        super(EthLazyBlock, self).__init__(src=src, dialect_filter=dialect_filter)
+
+
+    def tx_by_index(self, idx, dialect_filter=None):
+        try:
+            return self.tx_cache[idx]
+        except KeyError:
+            pass
+        tx = super(EthLazyBlock, self).tx_by_index(idx, dialect_filter=dialect_filter)
+        self.tx_cache[idx] = tx
+        return tx
+
+
+    def __tx_field(self, idx, k):
+        src = self.txs[idx]
+        if isinstance(src, str):
+            if k == 'hash':
+                return strip_0x(src).lower()
+            return None
+        v = src.get(k)
+        if v == None:
+            return None
+        return strip_0x(v).lower()
+
+
+    def tx_hash(self, idx):
+        """Get the hash of the transaction at the given index.
+
+        :param idx: Transaction index
+        :type idx: int
+        :raises IndexError: No transaction at index
+        :rtype: str
+        :returns: Transaction hash, in lowercase hex without prefix
+        """
+        return self.__tx_field(idx, 'hash')
+
+
+    def tx_sender(self, idx):
+        """Get the sender of the transaction at the given index.
+
+        :param idx: Transaction index
+        :type idx: int
+        :raises IndexError: No transaction at index
+        :rtype: str
+        :returns: Sender address, in lowercase hex without prefix, or None if the block only has transaction hashes
+        """
+        return self.__tx_field(idx, 'from')
+
+
+    def tx_recipient(self, idx):
+        return self.__tx_field(idx, 'to')
+
 
 class EthChainInterface(ChainInterface):
+    """Ethereum chain interface for the syncer.
+
+    Blocks are built as chaind.eth.chain.EthLazyBlock.
+
+    The receipt_method decides how the syncer retrieves receipts for the transactions of a block:
+
+    - block: a single eth_getBlockReceipts query
+    - batch: JSON-RPC batches of eth_getTransactionReceipt queries, of at most batch_limit elements
+    - single: one eth_getTransactionReceipt query per transaction
+    - auto: the first of the above that the node and connection supports, as decided by probe_receipts
+
+    :param dialect_filter: Dialect filter to apply to blocks and transactions
+    :type dialect_filter: chainlib.eth.dialect.DialectFilter
+    :param receipt_method: Receipt retrieval method
+    :type receipt_method: str
+    :param batch_limit: Maximum number of receipt queries in a batch
+    :type batch_limit: int
+    """
 
-    def __init__(self, dialect_filter=None):
+    def __init__(self, dialect_filter=None, receipt_method='auto', batch_limit=100):
+        super(EthChainInterface, self).__init__(dialect_filter=dialect_filter, batch_limit=batch_limit)
         self._block_by_number = block_by_number
-        self._block_from_src = Block.from_src
+        self._block_from_src = EthLazyBlock.from_src
         self._tx_receipt = receipt
         self._src_normalize = Tx.src_normalize
         self._block_latest = block_latest
         self._dialect_filter = dialect_filter
+        self.receipt_method = receipt_method
+
+
+    def block_receipts(self, hsh, *args, **kwargs):
+        return block_receipts(hsh, *args, **kwargs)
+
+
+    def probe_receipts(self, conn, block_hash):
+        """Decide the receipt method to use for the node behind the connection, if not already decided.
+
+        :param conn: RPC connection
+        :type conn: chainlib.connection.RPCConnection
+        :param block_hash: Hash of an existing block to query receipts for
+        :type block_hash: str
+        :rtype: str
+        :returns: Receipt method
+        """
+        if self.receipt_method != 'auto':
+            return self.receipt_method
+
+        try:
+            r = conn.do(self.block_receipts(block_hash))
+            if isinstance(r, list):
+                self.receipt_method = 'block'
+        except RPCException as e:
+            logg.debug('node does not support block receipts: {}'.format(e))
+
+        if self.receipt_method == 'auto':
+            if self.batch_limit > 1 and getattr(conn, 'do_batch', None) != None:
+                self.receipt_method = 'batch'
+            else:
+                self.receipt_method = 'single'
+
+        logg.info('syncer receipt method is {}'.format(self.receipt_method))
+        return self.receipt_method
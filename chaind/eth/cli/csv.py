@@ -7,22 +7,38 @@ logg = logging.getLogger(__name__)
 class CSVProcessor:
 
     def load(self, s):
-        contents = []
+        """Open a csv source for reading.
+
+        Records are read one at a time as the returned iterator is consumed, and empty lines are skipped.
+
+        :param s: Source file path
+        :type s: str
+        :rtype: iterator
+        :returns: Line number and fields of each record, or None if the source could not be opened
+        """
         f = None
         try:
-            f = open(s, 'r')
+            f = open(s, 'r', newline='')
         except FileNotFoundError:
             return None
 
+        return self.__read(f)
+
+
+    def __read(self, f):
         import csv # only import if needed
         fr = csv.reader(f)
 
-        for r in fr:
-            contents.append(r)
-        f.close()
-        l = len(contents)
+        l = 0
+        try:
+            for r in fr:
+                if len(r) == 0:
+                    continue
+                l += 1
+                yield (fr.line_num, r,)
+        finally:
+            f.close()
         logg.info('successfully parsed source as csv, found {} records'.format(l))
-        return contents
 
 
     def __str__(self):
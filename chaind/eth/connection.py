@@ -0,0 +1,455 @@
+# standard imports
+import json
+import logging
+import threading
+import time
+import base64
+import http.client
+from concurrent.futures import (
+        ThreadPoolExecutor,
+        TimeoutError as FutureTimeoutError,
+        wait,
+        FIRST_COMPLETED,
+        )
+from urllib.parse import urlparse
+from urllib.request import (
+        Request,
+        HTTPSHandler,
+        build_opener,
+        )
+from urllib.error import URLError
+
+# external imports
+from chainlib.eth.connection import EthHTTPConnection
+from chainlib.connection import error_parser
+from chainlib.jsonrpc import jsonrpc_result
+from chainlib.http import PreemptiveBasicAuthHandler
+from chainlib.error import (
+        RPCException,
+        JSONRPCException,
+        )
+
+logg = logging.getLogger(__name__)
+
+# errors of a node connection, as opposed to JSON-RPC error responses, which fail over to the next node
+ENDPOINT_ERRORS = (RPCException, OSError, ValueError, http.client.HTTPException,)
+
+
+class EthBatchHTTPConnection(EthHTTPConnection):
+    """Ethereum HTTP JSON-RPC connection which resolves the results of a batch query element by element.
+
+    Unlike the do method, an error response for one element of a batch does not hide the results of the other elements.
+    """
+
+    def _post(self, data):
+        handlers = []
+        if not self.verify_identity:
+            import ssl
+            ssl_ctx = ssl.SSLContext()
+            ssl_ctx.verify_mode = ssl.CERT_NONE
+            handlers.append(HTTPSHandler(context=ssl_ctx))
+
+        req = Request(
+                self.location,
+                method='POST',
+                )
+        req.add_header('Content-Type', 'application/json')
+
+        if self.auth != None:
+            p = self.auth.urllib_header()
+            req.add_header(p[0], p[1])
+
+        if self.basic != None:
+            handler = PreemptiveBasicAuthHandler()
+            handler.add_password(
+                    realm=None,
+                    uri=self.location,
+                    user=self.basic[0],
+                    passwd=self.basic[1],
+                    )
+            handlers.append(handler)
+
+        logg.debug('(HTTP) send {}'.format(data))
+        opener = build_opener(*handlers)
+        try:
+            r = opener.open(req, data=data.encode('utf-8'), timeout=self.timeout)
+        except URLError as e:
+            raise RPCException(e)
+
+        resp = r.read()
+        logg.debug('(HTTP) recv {}'.format(resp.decode('utf-8')))
+        return resp
+
+
+    def do_batch(self, o, error_parser=error_parser):
+        """Execute a JSON-RPC batch query.
+
+        Response elements are matched to the query elements by id.
+
+        :param o: JSON-RPC query objects
+        :type o: list of dict
+        :param error_parser: Error parser object to process JSON-RPC error responses with.
+        :type error_parser: chainlib.jsonrpc.ErrorParser
+        :raises RPCException: Endpoint could not be reached, or rejected the batch as a whole
+        :rtype: list
+        :returns: Result value, or exception for an error response, for each query element in order
+        """
+        resp = self._post(json.dumps(o))
+        result = json.loads(resp)
+        if type(result).__name__ != 'list':
+            raise error_parser.translate(result)
+
+        responses = {}
+        for v in result:
+            responses[v.get('id')] = v
+
+        results = []
+        for q in o:
+            v = responses.get(q['id'])
+            if v == None:
+                results.append(RPCException('no response for RPC id {}'.format(q['id'])))
+                continue
+            try:
+                results.append(jsonrpc_result(v, error_parser))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class HTTPConnectionPool:
+    """Thread-safe pool of persistent HTTP connections to a single location.
+
+    At most size connections are open at any one time; callers block until one is available. Idle connections older than idle_timeout seconds are closed instead of being reused.
+
+    :param location: URL of endpoint
+    :type location: str
+    :param size: Maximum number of connections
+    :type size: int
+    :param idle_timeout: Seconds an idle connection may be kept open
+    :type idle_timeout: float
+    :param timeout: Socket timeout for connections
+    :type timeout: float
+    :param ssl_ctx: SSL context for https connections
+    :type ssl_ctx: ssl.SSLContext
+    """
+
+    def __init__(self, location, size=4, idle_timeout=30.0, timeout=1.0, ssl_ctx=None):
+        url = urlparse(location)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path
+        if self.path == '':
+            self.path = '/'
+        if url.query != '':
+            self.path += '?' + url.query
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_ctx = ssl_ctx
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+
+    def connect(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, port=self.port, timeout=self.timeout, context=self.ssl_ctx)
+        return http.client.HTTPConnection(self.host, port=self.port, timeout=self.timeout)
+
+
+    def acquire(self):
+        self.slots.acquire()
+        now = time.monotonic()
+        with self.lock:
+            while len(self.idle) > 0:
+                (conn, last_used) = self.idle.pop()
+                if now - last_used > self.idle_timeout:
+                    conn.close()
+                    continue
+                return (conn, True,)
+        return (self.connect(), False,)
+
+
+    def release(self, conn, reuse=True):
+        if reuse:
+            with self.lock:
+                self.idle.append((conn, time.monotonic(),))
+        else:
+            conn.close()
+        self.slots.release()
+
+
+    def request(self, body, headers):
+        """Send a POST request, reusing an idle connection if there is one.
+
+        If a reused connection turns out to have been closed by the server before any of the response arrived, the request is tried once more on a new connection. Other failures, including timeouts after the request was sent, are not retried, since the server may already have acted on the request.
+
+        :param body: Request body
+        :type body: bytes
+        :param headers: Request headers
+        :type headers: dict
+        :raises RPCException: Request failed, or response status is not 200
+        :rtype: bytes
+        :returns: Response body
+        """
+        while True:
+            (conn, reused) = self.acquire()
+            try:
+                conn.request('POST', self.path, body=body, headers=headers)
+                r = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                self.release(conn, reuse=False)
+                if reused:
+                    logg.debug('reused connection to {} was closed, retrying on new connection: {}'.format(self.host, e))
+                    continue
+                raise RPCException(e)
+            except (http.client.HTTPException, OSError) as e:
+                self.release(conn, reuse=False)
+                raise RPCException(e)
+            try:
+                resp = r.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.release(conn, reuse=False)
+                raise RPCException(e)
+            self.release(conn, reuse=not r.will_close)
+            if r.status != 200:
+                raise RPCException('HTTP status {} {}'.format(r.status, r.reason))
+            return resp
+
+
+    def close(self):
+        with self.lock:
+            for (conn, last_used) in self.idle:
+                conn.close()
+            self.idle = []
+
+
+class EthPoolHTTPConnection(EthBatchHTTPConnection):
+    """Ethereum HTTP JSON-RPC connection which keeps a pool of persistent connections to the node.
+
+    The connection object can be shared between threads.
+
+    :param pool_size: Maximum number of open connections
+    :type pool_size: int
+    :param idle_timeout: Seconds an idle connection may be kept open
+    :type idle_timeout: float
+    """
+
+    def __init__(self, url=None, chain_spec=None, auth=None, verify_identity=True, timeout=1.0, pool_size=4, idle_timeout=30.0):
+        super(EthPoolHTTPConnection, self).__init__(url=url, chain_spec=chain_spec, auth=auth, verify_identity=verify_identity, timeout=timeout)
+        ssl_ctx = None
+        if not self.verify_identity:
+            import ssl
+            ssl_ctx = ssl.SSLContext()
+            ssl_ctx.verify_mode = ssl.CERT_NONE
+        self.pool = HTTPConnectionPool(self.location, size=pool_size, idle_timeout=idle_timeout, timeout=timeout, ssl_ctx=ssl_ctx)
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+                }
+        if self.auth != None:
+            p = self.auth.urllib_header()
+            self.headers[p[0]] = p[1]
+        elif self.basic != None:
+            v = '{}:{}'.format(self.basic[0], self.basic[1])
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(v.encode('utf-8')).decode('utf-8')
+
+
+    def _post(self, data):
+        logg.debug('(HTTP) send {}'.format(data))
+        resp = self.pool.request(data.encode('utf-8'), self.headers)
+        logg.debug('(HTTP) recv {}'.format(resp.decode('utf-8')))
+        return resp
+
+
+    def do(self, o, error_parser=error_parser):
+        resp = self._post(json.dumps(o))
+        result = json.loads(resp)
+        if type(result).__name__ != 'list':
+            if o['id'] != result['id']:
+                raise ValueError('RPC id mismatch; sent {} received {}'.format(o['id'], result['id']))
+            return jsonrpc_result(result, error_parser)
+
+        results = []
+        for i in range(len(o)):
+            if o[i]['id'] != result[i]['id']:
+                raise ValueError('RPC id mismatch; sent {} received {}'.format(o[i]['id'], result[i]['id']))
+            results.append(jsonrpc_result(result[i], error_parser))
+        return results
+
+
+    def disconnect(self):
+        self.pool.close()
+
+
+class Endpoint:
+    """Latency and error statistics for one RPC endpoint, as exponentially weighted moving averages.
+
+    :param conn: RPC connection to endpoint
+    :type conn: chainlib.connection.RPCConnection
+    :param weight: Weight of the newest sample in the averages
+    :type weight: float
+    """
+
+    def __init__(self, conn, weight=0.2):
+        self.conn = conn
+        self.weight = weight
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.last_error = 0.0
+        self.lock = threading.Lock()
+
+
+    def record(self, latency=None):
+        with self.lock:
+            if latency == None:
+                self.error_rate += self.weight * (1.0 - self.error_rate)
+                self.last_error = time.monotonic()
+                return
+            self.error_rate -= self.weight * self.error_rate
+            if self.latency == 0.0:
+                self.latency = latency
+            else:
+                self.latency += self.weight * (latency - self.latency)
+
+
+    def rank(self):
+        # an endpoint which has only ever failed has no latency to rank by
+        if self.latency == 0.0 and self.error_rate > 0.0:
+            return float('inf')
+        return self.latency
+
+
+    def healthy(self, error_threshold, cooldown):
+        if self.error_rate < error_threshold:
+            return True
+        return time.monotonic() - self.last_error > cooldown
+
+
+    def __str__(self):
+        return '{} latency {:.4f}s error rate {:.2f}'.format(self.conn.location, self.latency, self.error_rate)
+
+
+class EthMultiConnection:
+    """Routes JSON-RPC queries over several node connections, preferring the healthy node with the lowest observed latency.
+
+    A node is unhealthy while its error rate is at or above error_threshold, until cooldown seconds have passed since its last error. Errors of the node connection fail over to the next node; these are chainlib RPC errors, socket and HTTP errors, and malformed or mismatched responses, which are raised as ValueError. JSON-RPC error responses are passed on to the caller as they are.
+
+    If hedge_delay is set, a query which has not been answered by the preferred node within that many seconds is also sent to the next node, and the first successful result is returned.
+
+    :param conns: Node connections
+    :type conns: list of chainlib.connection.RPCConnection
+    :param hedge_delay: Seconds to wait for the preferred node before hedging, 0 to disable
+    :type hedge_delay: float
+    :param error_threshold: Error rate at which a node is considered unhealthy
+    :type error_threshold: float
+    :param cooldown: Seconds before an unhealthy node is tried again
+    :type cooldown: float
+    """
+
+    def __init__(self, conns, hedge_delay=0.0, error_threshold=0.5, cooldown=10.0):
+        self.endpoints = []
+        for conn in conns:
+            self.endpoints.append(Endpoint(conn))
+        self.chain_spec = conns[0].chain_spec
+        self.location = conns[0].location
+        self.hedge_delay = hedge_delay
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.executor = None
+        if hedge_delay > 0:
+            self.executor = ThreadPoolExecutor(max_workers=len(conns) * 2)
+
+
+    def ranked(self):
+        healthy = []
+        unhealthy = []
+        for endpoint in self.endpoints:
+            if endpoint.healthy(self.error_threshold, self.cooldown):
+                healthy.append(endpoint)
+            else:
+                unhealthy.append(endpoint)
+        healthy.sort(key=lambda v: v.rank())
+        unhealthy.sort(key=lambda v: v.last_error)
+        return healthy + unhealthy
+
+
+    def __call(self, endpoint, method, o, error_parser):
+        t = time.monotonic()
+        try:
+            r = getattr(endpoint.conn, method)(o, error_parser=error_parser)
+        except JSONRPCException as e:
+            endpoint.record(time.monotonic() - t)
+            raise e
+        except ENDPOINT_ERRORS as e:
+            endpoint.record()
+            logg.warning('rpc endpoint {} failed: {}'.format(endpoint.conn.location, e))
+            raise e
+        endpoint.record(time.monotonic() - t)
+        return r
+
+
+    def __failover(self, endpoints, method, o, error_parser, err=None):
+        for endpoint in endpoints:
+            try:
+                return self.__call(endpoint, method, o, error_parser)
+            except JSONRPCException as e:
+                raise e
+            except ENDPOINT_ERRORS as e:
+                err = e
+        raise err
+
+
+    def __hedge(self, endpoints, method, o, error_parser):
+        primary = self.executor.submit(self.__call, endpoints[0], method, o, error_parser)
+        try:
+            return primary.result(timeout=self.hedge_delay)
+        except FutureTimeoutError:
+            pass
+        except JSONRPCException as e:
+            raise e
+        except ENDPOINT_ERRORS as e:
+            return self.__failover(endpoints[1:], method, o, error_parser, err=e)
+
+        logg.debug('rpc endpoint {} slower than {}s, hedging on {}'.format(endpoints[0].conn.location, self.hedge_delay, endpoints[1].conn.location))
+        secondary = self.executor.submit(self.__call, endpoints[1], method, o, error_parser)
+        futures = [primary, secondary]
+        err = None
+        while len(futures) > 0:
+            (done, futures) = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except ENDPOINT_ERRORS as e:
+                    if err == None or isinstance(e, JSONRPCException):
+                        err = e
+        if isinstance(err, JSONRPCException):
+            raise err
+        return self.__failover(endpoints[2:], method, o, error_parser, err=err)
+
+
+    def __route(self, method, o, error_parser):
+        endpoints = self.ranked()
+        if self.executor != None and len(endpoints) > 1:
+            return self.__hedge(endpoints, method, o, error_parser)
+        return self.__failover(endpoints, method, o, error_parser)
+
+
+    def do(self, o, error_parser=error_parser):
+        return self.__route('do', o, error_parser)
+
+
+    def do_batch(self, o, error_parser=error_parser):
+        return self.__route('do_batch', o, error_parser)
+
+
+    def disconnect(self):
+        for endpoint in self.endpoints:
+            endpoint.conn.disconnect()
+        if self.executor != None:
+            self.executor.shutdown(wait=False)
+
+
+    def __str__(self):
+        return 'ETH multi JSONRPC: ' + ', '.join([str(v) for v in self.endpoints])
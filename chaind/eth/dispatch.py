@@ -1,13 +1,304 @@
+# standard imports
+import logging
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 # external imports
 from chainlib.eth.tx import raw
+from chainlib.error import RPCException
+from chaind.dispatch import DispatchProcessor
+from chaind.adapters.fs import ChaindFsAdapter
+from chaind.lock import StoreLock
+from chaind.error import BackendError
+from shep.error import StateLockedKey
+
+# local imports
+from chaind.eth.cache import EthCacheTx
+from chaind.eth.error import HeldBackError
+
+logg = logging.getLogger(__name__)
 
 
 class EthDispatcher:
 
-    def __init__(self, conn):
+    def __init__(self, conn, batch_size=1):
         self.conn = conn
+        self.batch_size = batch_size
 
 
     def send(self, payload):
         o = raw(payload)
         self.conn.do(o)
+
+
+    def send_many(self, payloads):
+        """Send multiple signed transactions, packed in JSON-RPC batches of at most batch_size elements.
+
+        If the connection cannot execute batch queries, the transactions are sent one by one.
+
+        :param payloads: Signed transactions, in hex
+        :type payloads: list of str
+        :rtype: list
+        :returns: None for each accepted transaction, or the exception describing why it was rejected, in input order
+        """
+        errors = []
+        if self.batch_size < 2 or getattr(self.conn, 'do_batch', None) == None:
+            for payload in payloads:
+                try:
+                    self.send(payload)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+            return errors
+
+        for i in range(0, len(payloads), self.batch_size):
+            o = []
+            for payload in payloads[i:i+self.batch_size]:
+                o.append(raw(payload))
+            try:
+                r = self.conn.do_batch(o)
+            except Exception as e:
+                r = [e] * len(o)
+            for v in r:
+                if isinstance(v, Exception):
+                    errors.append(v)
+                else:
+                    errors.append(None)
+        return errors
+
+
+class EthAsyncDispatcher(EthDispatcher):
+    """Dispatcher which keeps up to concurrency raw transaction sends in flight at the same time.
+
+    Transactions from the same sender are sent one after the other in nonce order, while different senders proceed in parallel. When a send fails, the remaining transactions of that sender are not sent, and chaind.eth.error.HeldBackError is returned for them.
+
+    :param conn: RPC connection, must be safe to use from multiple threads
+    :type conn: chainlib.connection.RPCConnection
+    :param chain_spec: Chain spec to decode transactions with
+    :type chain_spec: chainlib.chain.ChainSpec
+    :param concurrency: Maximum number of sends in flight
+    :type concurrency: int
+    :param cache_adapter: Cache transaction class to decode sender and nonce with
+    :type cache_adapter: class
+    """
+
+    def __init__(self, conn, chain_spec, concurrency=8, cache_adapter=EthCacheTx):
+        super(EthAsyncDispatcher, self).__init__(conn)
+        self.chain_spec = chain_spec
+        self.concurrency = concurrency
+        self.cache_adapter = cache_adapter
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+
+    def send_many(self, payloads):
+        return asyncio.run(self.send_many_async(payloads))
+
+
+    async def send_many_async(self, payloads):
+        errors = [None] * len(payloads)
+        senders = {}
+        for i, payload in enumerate(payloads):
+            tx = self.cache_adapter(self.chain_spec)
+            try:
+                tx.deserialize(payload)
+            except Exception as e:
+                errors[i] = e
+                continue
+            if senders.get(tx.sender) == None:
+                senders[tx.sender] = []
+            senders[tx.sender].append((tx.nonce, i,))
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def send_sender(sender, items):
+            items.sort()
+            err = None
+            for (nonce, i) in items:
+                if err != None:
+                    errors[i] = err
+                    continue
+                async with slots:
+                    try:
+                        await loop.run_in_executor(self.executor, self.send, payloads[i])
+                    except Exception as e:
+                        logg.debug('send failed for sender {} nonce {}, holding back later nonces: {}'.format(sender, nonce, e))
+                        errors[i] = e
+                        err = HeldBackError('preceding nonce {} for sender {} failed: {}'.format(nonce, sender, e))
+
+        await asyncio.gather(*[send_sender(k, v) for (k, v) in senders.items()])
+        return errors
+
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+class EthDispatchProcessor(DispatchProcessor):
+    """Queue dispatch processor which sends all upcoming transactions of a cycle together through EthDispatcher.send_many.
+
+    Transactions which the dispatcher held back are returned to the queued state, to be sent in a later cycle. Transactions which failed to send are marked as such. If reserving a transaction for sending fails, the transactions already reserved in the cycle are returned to the queued state as well.
+
+    If the queue adapter sets dispatch_commit, the adapter is committed after each change of states, so that the changes do not wait for a commit of the queuer which shares its store connection.
+
+    The queue store is only read and changed while holding store_lock, and transactions are sent without it. Other threads of the process which change the queue store, like the queuer adding transactions while the dispatch worker runs, must hold it too. The file store locks of a key do not keep two threads from changing it at the same time, and a key whose lock is found taken can be left with its state changed in memory but not in the store.
+
+    :param chain_spec: Chain spec of queue
+    :type chain_spec: chainlib.chain.ChainSpec
+    :param queue_dir: Queue state path
+    :type queue_dir: str
+    :param dispatcher: Transaction dispatcher
+    :type dispatcher: chaind.eth.dispatch.EthDispatcher
+    :param cache_adapter: Cache transaction class to instantiate queue adapter with
+    :type cache_adapter: class
+    :param adapter_cls: Queue adapter class
+    :type adapter_cls: class
+    """
+
+    def __init__(self, chain_spec, queue_dir, dispatcher, cache_adapter=EthCacheTx, adapter_cls=ChaindFsAdapter):
+        super(EthDispatchProcessor, self).__init__(chain_spec, queue_dir, dispatcher)
+        self.chain_spec = chain_spec
+        self.cache_adapter = cache_adapter
+        self.adapter_cls = adapter_cls
+        self.store_lock = threading.Lock()
+
+
+    def get_adapter(self):
+        return self.adapter_cls(
+            self.chain_spec,
+            self.queue_dir,
+            self.cache_adapter,
+            self.dispatcher,
+            )
+
+
+    def process(self, rpc, limit=50):
+        with self.store_lock:
+            adapter = self.get_adapter()
+            upcoming = adapter.upcoming(limit=limit)
+        logg.info('processor has {} candidates for {}, processing with limit {}'.format(len(upcoming), self.chain_spec, limit))
+        if len(upcoming) == 0:
+            return 0
+        return self.dispatch_many(adapter, upcoming)
+
+
+    def __store_retry(self, fn, tx_hash):
+        store_lock = StoreLock()
+        while True:
+            try:
+                with self.store_lock:
+                    return fn(tx_hash)
+            except FileNotFoundError as e:
+                logg.debug('dispatch failed to find {} in backend, will try again: {}'.format(tx_hash, e))
+                store_lock.again(e)
+                continue
+            except StateLockedKey as e:
+                logg.debug('dispatch failed to find {} in backend, will try again: {}'.format(tx_hash, e))
+                store_lock.again(e)
+                continue
+
+
+    def __requeue(self, adapter, k):
+        self.__store_retry(lambda k: adapter.store.change(k, adapter.store.QUEUED, adapter.store.RESERVED), k)
+
+
+    def __commit(self, adapter):
+        if getattr(adapter, 'dispatch_commit', False):
+            with self.store_lock:
+                adapter.commit()
+
+
+    def dispatch_many(self, adapter, tx_hashes):
+        entries = []
+        payloads = []
+        try:
+            for tx_hash in tx_hashes:
+                entry = self.__store_retry(adapter.store.send_start, tx_hash)
+                entries.append(entry)
+                payloads.append(entry.serialize())
+        except Exception as e:
+            logg.error('dispatch failed to reserve {}, returning {} reserved txs to queue: {}'.format(tx_hash, len(entries), e))
+            for entry in entries:
+                self.__requeue(adapter, entry.k)
+            raise
+        finally:
+            self.__commit(adapter)
+
+        errors = self.dispatcher.send_many(payloads)
+
+        i = 0
+        for j, tx_hash in enumerate(tx_hashes):
+            if isinstance(errors[j], HeldBackError):
+                logg.info('dispatch held back for {}: {}'.format(tx_hash, errors[j]))
+                self.__requeue(adapter, entries[j].k)
+                continue
+            if errors[j] != None:
+                logg.error('dispatch send failed for {}: {}'.format(tx_hash, errors[j]))
+                self.__store_retry(adapter.store.fail, tx_hash)
+                continue
+            self.__store_retry(adapter.store.send_end, tx_hash)
+            i += 1
+        self.__commit(adapter)
+        return i
+
+
+class DispatchWorker(threading.Thread):
+    """Runs queue dispatch in its own thread, independently of client input.
+
+    A dispatch cycle runs every interval seconds while the queue is idle, and again after busy_interval seconds while the previous cycle dispatched something. A call to wake starts the next cycle immediately. A cycle which raises an error is logged, and is followed by the next cycle after interval seconds.
+
+    :param process: Dispatch callable, taking the RPC connection and returning the number of transactions dispatched
+    :type process: function
+    :param conn: RPC connection
+    :type conn: chainlib.connection.RPCConnection
+    :param interval: Seconds between cycles while idle
+    :type interval: float
+    :param busy_interval: Seconds between cycles while busy
+    :type busy_interval: float
+    """
+
+    def __init__(self, process, conn, interval=4.0, busy_interval=0.01):
+        super(DispatchWorker, self).__init__(name='dispatch', daemon=True)
+        self.process = process
+        self.conn = conn
+        self.interval = interval
+        self.busy_interval = busy_interval
+        self.cycles = 0
+        self.dead = False
+        self.event = threading.Event()
+
+
+    def wake(self):
+        self.event.set()
+
+
+    def stop(self):
+        self.dead = True
+        self.event.set()
+
+
+    def run(self):
+        state_lock = StoreLock()
+        while not self.dead:
+            self.event.clear()
+            try:
+                r = self.process(self.conn)
+            except BackendError as e:
+                try:
+                    state_lock.again(e)
+                    continue
+                except BackendError as e:
+                    logg.error('dispatch backend still unavailable, waiting for next cycle: {}'.format(e))
+                    r = 0
+            except Exception as e:
+                logg.exception('dispatch cycle failed, waiting for next cycle: {}'.format(e))
+                r = 0
+            state_lock.reset()
+            self.cycles += 1
+            if r > 0:
+                delay = self.busy_interval
+            else:
+                delay = self.interval
+            self.event.wait(timeout=delay)
+        logg.info('dispatch worker stopped after {} cycles'.format(self.cycles))
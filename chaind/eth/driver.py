@@ -0,0 +1,325 @@
+# standard imports
+import time
+import logging
+from collections import deque
+
+# external imports
+from chainsyncer.driver.chain_interface import ChainInterfaceDriver
+from chainsyncer.error import NoBlockForYou
+from chainlib.error import RPCException
+from chainlib.eth.block import block_latest
+from hexathon import strip_0x
+
+# local imports
+from chaind.eth.prefetch import BlockPrefetcher
+from chaind.eth.sparse import BlockStub
+from chaind.eth.chain import EthLazyBlock
+
+logg = logging.getLogger(__name__)
+
+
+class EthChainInterfaceDriver(ChainInterfaceDriver):
+    """Chain interface sync driver which can fetch blocks ahead of the syncer cursor.
+
+    Receipts are retrieved with the receipt method of the chain interface, see chaind.eth.chain.EthChainInterface. A receipt missing from the block or batch receipts returned by the node is retrieved again by transaction hash. If the node still has no receipt for it, the block is retried after the next idle, and none of its transactions are passed to the session filters before that.
+
+    If prefetch is greater than zero, a chaind.eth.prefetch.BlockPrefetcher is created for the connection passed to the first get, and the blocks are still processed in order. The prefetched window never extends beyond the sync target.
+
+    If a tracker is given, only the transactions it tracks get their receipts retrieved and are passed to the session filters. With a chaind.eth.chain.EthLazyBlock, transaction objects are only built for tracked transactions. This is only correct if all filters of the session ignore other transactions, as chaind.filter.StateFilter does.
+
+    If a receipt poller is given, blocks are not fetched while the poller is active. Instead, the cursor advances up to the latest block, and the receipts of the pending transactions are polled each time it gets there. Mined transactions are passed to the session filters with the block they were found in. When the poller becomes inactive, receipts are polled once more, and block scanning resumes after the latest block at the time of that poll.
+
+    If a block cache is given, blocks and receipts are looked up there before they are retrieved from the node, and retrieved ones are added to it. A block height is only mapped to a retrieved block once a block confirmations deeper, descending from it, has been retrieved. A cached block whose parent hash does not match the block processed before it is dropped and retrieved again.
+
+    If follow is given, the syncer waits the interval it suggests whenever it has caught up with the chain, instead of the fixed interval passed to run. If heads is also given, the wait ends as soon as a new head is announced. The next block is always retrieved immediately after a block has been processed.
+
+    :param prefetch: Number of blocks to fetch ahead of the syncer cursor
+    :type prefetch: int
+    :param tracker: Prefilter of transactions to process
+    :type tracker: chaind.eth.track.TxTracker
+    :param poller: Receipt poller for the queue
+    :type poller: chaind.eth.sparse.ReceiptPoller
+    :param cache: Block and receipt cache
+    :type cache: chaind.eth.blockcache.BlockCache
+    :param confirmations: Depth at which a block height is mapped to a block in the cache
+    :type confirmations: int
+    :param follow: Adaptive idle interval
+    :type follow: chaind.eth.head.HeadFollow
+    :param heads: New head subscription, must already be started
+    :type heads: chaind.eth.head.NewHeadsSubscription
+    """
+
+    def __init__(self, store, chain_interface, offset=0, target=-1, pre_callback=None, post_callback=None, block_callback=None, idle_callback=None, prefetch=0, tracker=None, poller=None, cache=None, confirmations=12, follow=None, heads=None):
+        super(EthChainInterfaceDriver, self).__init__(store, chain_interface, offset=offset, target=target, pre_callback=pre_callback, post_callback=post_callback, block_callback=block_callback, idle_callback=idle_callback)
+        self.prefetch = prefetch
+        self.prefetcher = None
+        self.tracker = tracker
+        self.poller = poller
+        self.sparse = False
+        self.sparse_until = -1
+        self.head = -1
+        self.cache = cache
+        self.confirmations = confirmations
+        self.unconfirmed = deque()
+        self.last_block = None
+        self.follow = follow
+        self.heads = heads
+        self.retry = False
+
+
+    def __latest(self, conn):
+        self.head = max(self.head, int(conn.do(block_latest()), 16))
+        return self.head
+
+
+    def __poll(self, conn):
+        self.__latest(conn)
+        for (block, tx) in self.poller.poll(conn):
+            self.process_single(conn, block, tx)
+        self.sparse_until = self.head
+
+
+    def __skip(self, conn, item):
+        if self.poller == None:
+            return False
+        if item.cursor <= self.sparse_until:
+            return True
+        if self.poller.check():
+            if not self.sparse:
+                logg.info('switching to receipt polling at block {}'.format(item.cursor))
+                self.sparse = True
+            return True
+        if self.sparse:
+            self.__poll(conn)
+            self.sparse = False
+            logg.info('switching to block scan after block {}'.format(self.sparse_until))
+        return item.cursor <= self.sparse_until
+
+
+    def get(self, conn, item):
+        if self.retry:
+            self.retry = False
+            raise NoBlockForYou()
+
+        if self.__skip(conn, item):
+            if item.cursor > self.head:
+                self.__latest(conn)
+            if item.cursor > self.head:
+                raise NoBlockForYou()
+            return BlockStub(item.cursor)
+
+        r = None
+        if self.cache != None:
+            r = self.__get_cached(item.cursor)
+        if r == None:
+            r = self.__fetch(conn, item.cursor)
+            if r == None:
+                raise NoBlockForYou()
+            if self.cache != None:
+                self.__put_cached(r)
+        b = self.chain_interface.block_from_src(r)
+        b.txs = b.txs[item.tx_cursor:]
+        self.last_block = (b.number, b.hash,)
+        if self.follow != None and b.timestamp != None:
+            self.follow.observe(b.number, b.timestamp)
+        return b
+
+
+    def __fetch(self, conn, number):
+        try:
+            if self.prefetch == 0:
+                o = self.chain_interface.block_by_number(number)
+                return conn.do(o)
+            if self.prefetcher == None:
+                self.prefetcher = BlockPrefetcher(conn, self.chain_interface, lookahead=self.prefetch)
+            return self.prefetcher.get(number, target=self.store.target)
+        except RPCException as e:
+            logg.warning('could not get block {}, will try again: {}'.format(number, e))
+            return None
+
+
+    def __get_cached(self, number):
+        r = self.cache.get_block(number)
+        if r == None or self.last_block == None:
+            return r
+        (last_number, last_hash) = self.last_block
+        if last_number == number - 1 and strip_0x(r['parentHash']).lower() != strip_0x(last_hash).lower():
+            logg.warning('cached block {} does not descend from block {}, dropping it from cache'.format(number, last_hash))
+            self.cache.invalidate(number)
+            return None
+        return r
+
+
+    def __put_cached(self, r):
+        self.cache.put_block(r)
+        number = int(strip_0x(r['number']), 16)
+        block_hash = strip_0x(r['hash']).lower()
+        if len(self.unconfirmed) > 0:
+            (last_number, last_hash) = self.unconfirmed[-1]
+            if last_number != number - 1 or strip_0x(r['parentHash']).lower() != last_hash:
+                self.unconfirmed.clear()
+        self.unconfirmed.append((number, block_hash,))
+        while len(self.unconfirmed) > 0 and self.unconfirmed[0][0] <= number - self.confirmations:
+            (n, h) = self.unconfirmed.popleft()
+            self.cache.put_number(n, h)
+
+
+    def merge_rcpts(self, conn, txs):
+        if self.cache != None:
+            i = 0
+            for tx in txs:
+                rcpt = self.cache.get_receipt(tx.block.hash, tx.hash)
+                if rcpt == None:
+                    break
+                self.__apply_receipt(tx, rcpt, cached=True)
+                i += 1
+            if i > 0:
+                return i
+
+        method = self.chain_interface.probe_receipts(conn, txs[0].block.hash)
+        if method == 'block':
+            return self.merge_rcpts_block(conn, txs)
+        elif method == 'batch':
+            return self.merge_rcpts_batch(conn, txs)
+        return self.merge_rcpts_single(conn, txs)
+
+
+    def __apply_receipt(self, tx, rcpt, cached=False):
+        if self.cache != None and not cached:
+            self.cache.put_receipt(tx.block.hash, tx.hash, rcpt)
+        tx.apply_receipt(self.chain_interface.src_normalize(rcpt), dialect_filter=self.chain_interface.dialect_filter)
+
+
+    def __receipt(self, conn, tx):
+        o = self.chain_interface.tx_receipt(tx.hash)
+        r = conn.do(o)
+        if r == None:
+            raise NoBlockForYou('no receipt for tx {} in block {}'.format(tx.hash, tx.block.hash))
+        return r
+
+
+    def merge_rcpts_single(self, conn, txs):
+        tx = txs[0]
+        r = self.__receipt(conn, tx)
+        self.__apply_receipt(tx, r)
+        logg.debug('got receipt for {}'.format(tx.hash))
+        return 1
+
+
+    def merge_rcpts_block(self, conn, txs):
+        o = self.chain_interface.block_receipts(txs[0].block.hash)
+        r = conn.do(o)
+        if r == None:
+            logg.warning('no block receipts for {}, getting them by hash'.format(txs[0].block.hash))
+            r = []
+        rcpts = {}
+        for rcpt in r:
+            if rcpt == None:
+                continue
+            rcpts[strip_0x(rcpt['transactionHash']).lower()] = rcpt
+        for tx in txs:
+            rcpt = rcpts.get(strip_0x(tx.hash).lower())
+            if rcpt == None:
+                logg.warning('block receipts for {} missing tx {}, getting it by hash'.format(tx.block.hash, tx.hash))
+                rcpt = self.__receipt(conn, tx)
+            self.__apply_receipt(tx, rcpt)
+        logg.debug('got {} receipts for block {}'.format(len(txs), txs[0].block.number))
+        return len(txs)
+
+
+    def merge_rcpts_batch(self, conn, txs):
+        txs = txs[:self.chain_interface.batch_limit]
+        o = []
+        for tx in txs:
+            o.append(self.chain_interface.tx_receipt(tx.hash))
+        r = conn.do_batch(o)
+        for (tx, rcpt) in zip(txs, r):
+            if isinstance(rcpt, Exception):
+                raise rcpt
+            if rcpt == None:
+                logg.warning('batch receipts for {} missing tx {}, getting it by hash'.format(tx.block.hash, tx.hash))
+                rcpt = self.__receipt(conn, tx)
+            self.__apply_receipt(tx, rcpt)
+        logg.debug('got batch of {} receipts for block {}'.format(len(txs), txs[0].block.number))
+        return len(txs)
+
+
+    def process(self, conn, item, block):
+        try:
+            self.__process(conn, item, block)
+        except NoBlockForYou as e:
+            # the node has the block but not all its receipts yet; the next get waits before retrying the block
+            logg.warning('receipts of block {} not available, retrying: {}'.format(block.number, e))
+            self.retry = True
+
+
+    def __process(self, conn, item, block):
+        if isinstance(block, BlockStub):
+            if self.sparse and block.number >= self.head:
+                self.__poll(conn)
+            raise IndexError()
+
+        if self.tracker == None:
+            return super(EthChainInterfaceDriver, self).process(conn, item, block)
+
+        self.tracker.refresh()
+        lazy = isinstance(block, EthLazyBlock)
+        txs = []
+        i = item.tx_cursor
+        while True:
+            try:
+                src = block.txs[i]
+            except IndexError:
+                break
+            idx = i
+            i += 1
+            if lazy and not self.tracker.have_src(block.tx_hash(idx), block.tx_sender(idx)):
+                continue
+            if isinstance(src, str):
+                if not lazy and not self.tracker.have_hash(src):
+                    continue
+                o = self.chain_interface.tx_by_hash(src)
+                r = conn.do(o)
+                tx = self.chain_interface.tx_from_src(r, block=block)
+            else:
+                tx = block.tx(idx, dialect_filter=self.chain_interface.dialect_filter)
+                if not lazy and not self.tracker.have(tx):
+                    continue
+            txs.append(tx)
+
+        logg.debug('processing {} tracked of {} txs in block {}'.format(len(txs), i - item.tx_cursor, block.number))
+
+        j = len(txs)
+        i = 0
+        while i < j:
+            i += self.merge_rcpts(conn, txs[i:])
+
+        for tx in txs:
+            self.process_single(conn, block, tx)
+
+        raise IndexError()
+
+
+    def idle(self, interval):
+        if self.follow == None:
+            return super(EthChainInterfaceDriver, self).idle(interval)
+        delay = self.follow.delay()
+        logg.debug('waiting {:.2f} seconds for block {}'.format(delay, self.follow.number + 1))
+        if self.heads != None:
+            self.heads.wait(delay)
+        else:
+            time.sleep(delay)
+
+
+    def close(self):
+        if self.heads != None:
+            self.heads.stop()
+            self.heads = None
+        if self.cache != None:
+            logg.info(str(self.cache))
+        if self.tracker != None:
+            logg.info(str(self.tracker))
+        if self.prefetcher != None:
+            logg.info(str(self.prefetcher))
+            self.prefetcher.close()
+            self.prefetcher = None
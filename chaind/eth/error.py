@@ -0,0 +1,18 @@
+class QueueBusyError(Exception):
+    """Raised when a transaction is not admitted to the queue because a queue depth limit has been reached.
+
+    :param retry_after: Seconds after which the client may try again
+    :type retry_after: float
+    """
+
+    def __init__(self, message, retry_after=1.0):
+        super(QueueBusyError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class HeldBackError(Exception):
+    """Returned by a dispatcher for a transaction which was not sent, because the send of an earlier nonce of the same sender failed.
+
+    The transaction may be sent again in a later dispatch cycle.
+    """
+    pass
@@ -0,0 +1,116 @@
+# standard imports
+import logging
+
+# external imports
+from chainlib.status import Status as TxStatus
+from chainqueue.error import NotLocalTxError
+from chaind.filter import StateFilter
+from chaind.adapters.fs import ChaindFsAdapter
+from chaind.error import (
+        QueueLockError,
+        BackendError,
+        )
+from chaind.lock import StoreLock
+from shep.error import StateLockedKey
+
+logg = logging.getLogger(__name__)
+
+
+class EthStateFilter(StateFilter):
+    """State filter which accepts the queue adapter class to use, so that the queue may be kept in another backend than the filesystem store.
+
+    The filter keeps the common name of chaind.filter.StateFilter, so that existing syncer sessions can be resumed with it.
+
+    :param adapter_cls: Queue adapter class
+    :type adapter_cls: class
+    """
+
+    def __init__(self, chain_spec, adapter_path, tx_adapter, throttler=None, adapter_cls=ChaindFsAdapter):
+        super(EthStateFilter, self).__init__(chain_spec, adapter_path, tx_adapter, throttler=throttler)
+        self.adapter_cls = adapter_cls
+
+
+    def common_name(self):
+        return 'chaind_filter_StateFilter'
+
+
+    def get_adapter(self, block, force_reload=False):
+        if self.store_lock == None:
+            self.store_lock = StoreLock()
+
+        reload = False
+        if block.number != self.last_block_height:
+            reload = True
+        elif self.adapter == None:
+            reload = True
+        elif force_reload:
+            reload = True
+
+        self.last_block_height = block.number
+
+        if reload:
+            while True:
+                logg.info('reloading adapter')
+                try:
+                    self.adapter = self.adapter_cls(
+                        self.chain_spec,
+                        self.adapter_path,
+                        self.tx_adapter,
+                        None,
+                        )
+                    break
+                except BackendError as e:
+                    logg.error('adapter instantiation failed: {}, one more try'.format(e))
+                    self.store_lock.again()
+                    continue
+
+        return self.adapter
+
+
+    def filter(self, conn, block, tx, session=None):
+        cache_tx = None
+        queue_adapter = self.get_adapter(block)
+
+        self.store_lock.reset()
+
+        while True:
+            try:
+                cache_tx = queue_adapter.get(tx.hash)
+                break
+            except NotLocalTxError:
+                logg.debug('skipping not local transaction {}'.format(tx.hash))
+                return False
+            except BackendError as e:
+                logg.error('adapter get failed: {}, one more try'.format(e))
+                self.store_lock.again()
+                queue_adapter = self.get_adapter(block, force_reload=True)
+                continue
+
+        if cache_tx == None:
+            raise NotLocalTxError(tx.hash)
+
+        self.store_lock.reset()
+
+        queue_lock = StoreLock(error=QueueLockError)
+        while True:
+            try:
+                if tx.status == TxStatus.SUCCESS:
+                    queue_adapter.succeed(block, tx)
+                else:
+                    queue_adapter.fail(block, tx)
+                break
+            except QueueLockError as e:
+                logg.debug('queue item {} is blocked, will retry: {}'.format(tx.hash, e))
+                queue_lock.again()
+            except (FileNotFoundError, NotLocalTxError, StateLockedKey) as e:
+                logg.debug('queue item {} not found, possible race condition, will retry: {}'.format(tx.hash, e))
+                self.store_lock.again()
+                queue_adapter = self.get_adapter(block, force_reload=True)
+                continue
+
+        logg.info('filter registered {} for {} in {}'.format(tx.status_name, tx.hash, block))
+
+        if self.throttler != None:
+            self.throttler.dec(tx.hash)
+
+        return False
@@ -0,0 +1,305 @@
+# standard imports
+import os
+import ssl
+import json
+import time
+import socket
+import base64
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+
+logg = logging.getLogger(__name__)
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_OP_CONTINUATION = 0x0
+WS_OP_TEXT = 0x1
+WS_OP_CLOSE = 0x8
+WS_OP_PING = 0x9
+WS_OP_PONG = 0xa
+
+
+def ws_frame(payload, opcode=WS_OP_TEXT, mask=True):
+    """Encode a single final websocket frame.
+
+    :param payload: Frame payload
+    :type payload: bytes
+    :param opcode: Frame opcode
+    :type opcode: int
+    :param mask: Mask payload, as required for frames sent by a client
+    :type mask: bool
+    :rtype: bytes
+    :returns: Encoded frame
+    """
+    b = bytes([0x80 | opcode])
+    l = len(payload)
+    m = 0x80 if mask else 0
+    if l < 126:
+        b += bytes([m | l])
+    elif l < 65536:
+        b += bytes([m | 126]) + l.to_bytes(2, byteorder='big')
+    else:
+        b += bytes([m | 127]) + l.to_bytes(8, byteorder='big')
+    if mask:
+        k = os.urandom(4)
+        b += k
+        payload = bytes(v ^ k[i % 4] for (i, v) in enumerate(payload))
+    return b + payload
+
+
+def ws_recv_exact(s, l):
+    buf = b''
+    while len(buf) < l:
+        v = s.recv(l - len(buf))
+        if len(v) == 0:
+            raise ConnectionError('websocket closed')
+        buf += v
+    return buf
+
+
+def ws_recv_frame(s):
+    """Receive a single websocket frame.
+
+    :param s: Connected socket
+    :type s: socket.socket
+    :raises ConnectionError: Socket closed
+    :rtype: tuple
+    :returns: Final frame flag, opcode and unmasked payload
+    """
+    v = ws_recv_exact(s, 2)
+    fin = v[0] & 0x80 > 0
+    opcode = v[0] & 0x0f
+    masked = v[1] & 0x80 > 0
+    l = v[1] & 0x7f
+    if l == 126:
+        l = int.from_bytes(ws_recv_exact(s, 2), byteorder='big')
+    elif l == 127:
+        l = int.from_bytes(ws_recv_exact(s, 8), byteorder='big')
+    k = None
+    if masked:
+        k = ws_recv_exact(s, 4)
+    payload = ws_recv_exact(s, l)
+    if k != None:
+        payload = bytes(v ^ k[i % 4] for (i, v) in enumerate(payload))
+    return (fin, opcode, payload,)
+
+
+def ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('utf-8')).digest()).decode('utf-8')
+
+
+class HeadFollow:
+    """Adapts the syncer idle interval to the observed block interval.
+
+    After a new block, the syncer waits until just before the next block is expected, counting from the block timestamp. Once the block is due, it polls every tenth of the block interval, backing off to max_interval if the block is very late.
+
+    :param block_time: Initial estimate of the block interval, in seconds
+    :type block_time: float
+    :param min_interval: Shortest idle interval, in seconds
+    :type min_interval: float
+    :param max_interval: Longest idle interval, in seconds
+    :type max_interval: float
+    :param weight: Weight of the newest block interval in the estimate
+    :type weight: float
+    """
+
+    def __init__(self, block_time=12.0, min_interval=0.25, max_interval=12.0, weight=0.2):
+        self.block_time = block_time
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.weight = weight
+        self.number = -1
+        self.timestamp = None
+        self.arrival = time.time()
+
+
+    def observe(self, number, timestamp=None):
+        """Record a block.
+
+        :param number: Block height
+        :type number: int
+        :param timestamp: Block timestamp, if known; otherwise the time of the call is used
+        :type timestamp: int
+        """
+        if number <= self.number:
+            return
+        if timestamp != None and self.timestamp != None and number == self.number + 1:
+            delta = timestamp - self.timestamp
+            if delta > 0:
+                self.block_time += self.weight * (delta - self.block_time)
+        self.number = number
+        self.timestamp = timestamp
+        if timestamp == None:
+            self.arrival = time.time()
+        else:
+            self.arrival = timestamp
+
+
+    def delay(self, now=None):
+        """Get the time to wait before looking for the next block.
+
+        :param now: Current unix time, defaults to the time of the call
+        :type now: float
+        :rtype: float
+        :returns: Seconds to wait
+        """
+        if now == None:
+            now = time.time()
+        elapsed = now - self.arrival
+        due = self.block_time * 0.9
+        if elapsed < due:
+            v = due - elapsed
+        elif elapsed < self.block_time * 2:
+            v = self.block_time / 10
+        else:
+            v = self.max_interval
+        return max(self.min_interval, min(v, self.max_interval))
+
+
+class NewHeadsSubscription(threading.Thread):
+    """Subscription to new block headers over a websocket JSON-RPC provider, used to wake up the syncer as soon as a block arrives.
+
+    The connection is established again after errors, waiting up to retry_limit seconds between attempts. The wait does not end on new head notifications, which the syncer may leave unconsumed while it catches up, only on stop.
+
+    :param url: Websocket provider url, ws or wss scheme
+    :type url: str
+    :param timeout: Connection timeout, in seconds
+    :type timeout: float
+    :param retry_limit: Maximum seconds between reconnection attempts
+    :type retry_limit: float
+    """
+
+    def __init__(self, url, timeout=10.0, retry_limit=30.0):
+        super(NewHeadsSubscription, self).__init__(name='newheads', daemon=True)
+        self.url = urlparse(url)
+        self.timeout = timeout
+        self.retry_limit = retry_limit
+        self.event = threading.Event()
+        self.stopped = threading.Event()
+        self.dead = False
+        self.s = None
+        self.number = -1
+        self.notifications = 0
+
+
+    def connect(self):
+        port = self.url.port
+        if port == None:
+            port = 443 if self.url.scheme == 'wss' else 80
+        s = socket.create_connection((self.url.hostname, port), timeout=self.timeout)
+        if self.url.scheme == 'wss':
+            s = ssl.create_default_context().wrap_socket(s, server_hostname=self.url.hostname)
+
+        key = base64.b64encode(os.urandom(16)).decode('utf-8')
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+        req = 'GET {} HTTP/1.1\r\nHost: {}:{}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n'.format(path, self.url.hostname, port, key)
+        s.sendall(req.encode('utf-8'))
+
+        resp = b''
+        while resp.find(b'\r\n\r\n') == -1:
+            v = s.recv(4096)
+            if len(v) == 0:
+                raise ConnectionError('websocket handshake closed')
+            resp += v
+        (head, rest) = resp.split(b'\r\n\r\n', 1)
+        lines = head.decode('utf-8').split('\r\n')
+        if lines[0].split(' ')[1] != '101':
+            raise ConnectionError('websocket handshake rejected: {}'.format(lines[0]))
+        headers = {}
+        for line in lines[1:]:
+            (k, v) = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+        if headers.get('sec-websocket-accept') != ws_accept_key(key):
+            raise ConnectionError('websocket handshake accept key mismatch')
+        if len(rest) > 0:
+            raise ConnectionError('unexpected data after websocket handshake')
+
+        s.settimeout(None)
+        self.s = s
+        o = {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}
+        self.s.sendall(ws_frame(json.dumps(o).encode('utf-8')))
+
+
+    def recv(self):
+        s = self.s
+        if s == None:
+            raise ConnectionError('new heads subscription closed')
+        buf = b''
+        while True:
+            (fin, opcode, payload) = ws_recv_frame(s)
+            if opcode == WS_OP_PING:
+                s.sendall(ws_frame(payload, opcode=WS_OP_PONG))
+                continue
+            elif opcode == WS_OP_CLOSE:
+                raise ConnectionError('websocket closed by provider')
+            elif opcode == WS_OP_PONG:
+                continue
+            buf += payload
+            if fin:
+                return json.loads(buf)
+
+
+    def run(self):
+        delay = 1.0
+        while not self.dead:
+            try:
+                self.connect()
+                logg.info('subscribed to new heads at {}'.format(self.url.geturl()))
+                delay = 1.0
+                while not self.dead:
+                    o = self.recv()
+                    if o.get('method') != 'eth_subscription':
+                        if o.get('error') != None:
+                            raise ConnectionError('newHeads subscription failed: {}'.format(o['error']))
+                        continue
+                    self.number = int(o['params']['result']['number'], 16)
+                    self.notifications += 1
+                    self.event.set()
+            except (OSError, ValueError, KeyError) as e:
+                if self.dead:
+                    break
+                logg.warning('new heads subscription error, retrying in {:.0f} seconds: {}'.format(delay, e))
+                self.close()
+                self.stopped.wait(timeout=delay)
+                delay = min(delay * 2, self.retry_limit)
+        self.close()
+
+
+    def wait(self, timeout):
+        """Wait for a new head notification.
+
+        :param timeout: Maximum seconds to wait
+        :type timeout: float
+        :rtype: bool
+        :returns: True if a notification arrived
+        """
+        r = self.event.wait(timeout=timeout)
+        self.event.clear()
+        return r
+
+
+    def close(self):
+        # called from both the subscription thread and stop
+        s = self.s
+        self.s = None
+        if s == None:
+            return
+        # shutdown first, closing alone does not wake a recv blocked in the subscription thread
+        try:
+            s.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            s.close()
+        except OSError:
+            pass
+
+
+    def stop(self):
+        self.dead = True
+        self.stopped.set()
+        self.event.set()
+        self.close()
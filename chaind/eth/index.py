@@ -0,0 +1,137 @@
+# standard imports
+import math
+import logging
+
+logg = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Bloom filter over keys which are already uniformly distributed, such as transaction hashes.
+
+    Bit positions are derived directly from the key bytes, by double hashing on the first 16 bytes.
+
+    :param capacity: Number of keys the filter is sized for
+    :type capacity: int
+    :param error_rate: False positive rate at capacity
+    :type error_rate: float
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.v = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+
+    def __positions(self, k):
+        a = int.from_bytes(k[:8], 'big')
+        b = int.from_bytes(k[8:16], 'big') | 1
+        for i in range(self.hashes):
+            yield (a + i * b) % self.bits
+
+
+    def add(self, k):
+        for p in self.__positions(k):
+            self.v[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+    def have(self, k):
+        for p in self.__positions(k):
+            if not self.v[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class KnownHashIndex:
+    """In-memory index of transaction hashes already in the queue.
+
+    A bloom filter answers for hashes that are certainly not known. Other hashes are checked against an exact set if one is kept, or else reported as possibly known, to be confirmed by the caller against the store.
+
+    The filter is rebuilt with twice the capacity when it fills up, provided the exact set is kept.
+
+    :param capacity: Number of hashes to size the bloom filter for
+    :type capacity: int
+    :param error_rate: Bloom filter false positive rate at capacity
+    :type error_rate: float
+    :param exact: If set, keep all hashes in memory to resolve bloom filter positives
+    :type exact: bool
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, exact=True):
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate=error_rate)
+        self.exact = None
+        if exact:
+            self.exact = set()
+        self.hits = 0
+        self.misses = 0
+
+
+    def add(self, k):
+        if self.exact != None:
+            if k in self.exact:
+                return
+            self.exact.add(k)
+        self.bloom.add(k)
+        if self.bloom.count > self.bloom.capacity and self.exact != None:
+            logg.info('known hash index exceeds capacity {}, resizing'.format(self.bloom.capacity))
+            self.bloom = BloomFilter(self.bloom.capacity * 2, error_rate=self.error_rate)
+            for v in self.exact:
+                self.bloom.add(v)
+
+
+    def have(self, k):
+        """Check whether a hash is known.
+
+        :param k: Transaction hash
+        :type k: bytes
+        :rtype: bool or None
+        :returns: False if not known, True if known, None if possibly known and no exact set is kept
+        """
+        if not self.bloom.have(k):
+            self.misses += 1
+            return False
+        if self.exact == None:
+            return None
+        if k in self.exact:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+
+    def load(self, path, digest_bytes=32):
+        """Seed the index from the master file of a hash index directory.
+
+        :param path: Path to master file
+        :type path: str
+        :param digest_bytes: Hash length
+        :type digest_bytes: int
+        :rtype: int
+        :returns: Number of hashes read
+        """
+        c = 0
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return 0
+        while True:
+            v = f.read(digest_bytes)
+            if len(v) < digest_bytes:
+                break
+            self.add(v)
+            c += 1
+        f.close()
+        logg.info('known hash index loaded {} hashes from {}'.format(c, path))
+        return c
+
+
+    def __len__(self):
+        return self.bloom.count
+
+
+    def __str__(self):
+        return 'known hash index {} hashes hits {} misses {}'.format(self.bloom.count, self.hits, self.misses)
@@ -0,0 +1,211 @@
+# standard imports
+import logging
+import time
+import socket
+import select
+
+# local imports
+from chaind.eth.admission import (
+        RESULT_BUSY,
+        backoff_delay,
+        )
+
+logg = logging.getLogger(__name__)
+
+# a legacy client sends hex text, which never starts with a null byte
+PIPELINE_MAGIC = b'\x00chaind\x01'
+PIPELINE_MAX_FRAME = 1048576
+
+
+def recv_exact(s, l, buf=b''):
+    while len(buf) < l:
+        v = s.recv(l - len(buf))
+        if len(v) == 0:
+            return None
+        buf += v
+    return buf
+
+
+def frame_request(tx_bytes):
+    return len(tx_bytes).to_bytes(4, byteorder='big') + tx_bytes
+
+
+def frame_response(seq, r, extra_data=None):
+    v = seq.to_bytes(4, byteorder='big') + r.to_bytes(4, byteorder='big')
+    if extra_data != None:
+        v += extra_data.encode('utf-8')
+    return len(v).to_bytes(4, byteorder='big') + v
+
+
+class PipelineConnection:
+    """Server side of a pipelined queuer client connection.
+
+    After the PIPELINE_MAGIC preamble, the client sends any number of requests, each framed as a 4-byte big-endian length followed by the raw signed transaction bytes. Every request is answered, in order, with a 4-byte big-endian length followed by the 4-byte request sequence number, the 4-byte result code and the result data.
+
+    :param srvs: Accepted client socket
+    :type srvs: socket.socket
+    :param buf: Data already received after the preamble
+    :type buf: bytes
+    :param timeout: Seconds to wait for the next request before giving up on the client
+    :type timeout: float
+    """
+
+    def __init__(self, srvs, buf=b'', timeout=5.0):
+        self.srvs = srvs
+        self.buf = buf
+        self.seq = 0
+        self.srvs.settimeout(timeout)
+
+
+    def __recv(self, l):
+        v = self.buf[:l]
+        self.buf = self.buf[l:]
+        return recv_exact(self.srvs, l, buf=v)
+
+
+    def get(self):
+        """Receive the next transaction from the client.
+
+        :raises ValueError: Frame exceeds maximum frame size
+        :rtype: tuple
+        :returns: Sequence number and signed transaction bytes, or None if the client is done
+        """
+        try:
+            v = self.__recv(4)
+            if v == None:
+                return None
+            l = int.from_bytes(v, byteorder='big')
+            if l > PIPELINE_MAX_FRAME:
+                raise ValueError('frame size {} exceeds max {}'.format(l, PIPELINE_MAX_FRAME))
+            v = self.__recv(l)
+        except socket.timeout:
+            logg.warning('pipeline client timed out after {} requests'.format(self.seq))
+            return None
+        if v == None:
+            return None
+        seq = self.seq
+        self.seq += 1
+        return (seq, v,)
+
+
+    def ready(self):
+        """Check whether more request data can be read without waiting.
+
+        :rtype: bool
+        :returns: True if data is available
+        """
+        if len(self.buf) > 0:
+            return True
+        (r, w, x) = select.select([self.srvs], [], [], 0)
+        return len(r) > 0
+
+
+    def respond_put(self, seq, r, extra_data=None):
+        try:
+            self.srvs.sendall(frame_response(seq, r, extra_data=extra_data))
+        except BrokenPipeError:
+            logg.debug('pipeline client hung up before response {}'.format(seq))
+
+
+    def close(self):
+        self.srvs.close()
+
+
+class PipelineSender:
+    """Client side of a pipelined queuer connection.
+
+    Up to window requests are sent before waiting for responses.
+
+    Requests are numbered from 0 in the order send is called, and responses are returned with the number of their request. Requests the queuer is too busy to admit are sent again after a backoff delay, up to busy_retries times. Meanwhile, no new requests are sent. A retried request keeps its number, and may be admitted after requests that were sent later.
+
+    :param path: Queuer socket path
+    :type path: str
+    :param window: Maximum number of requests awaiting response
+    :type window: int
+    :param busy_retries: Maximum number of times to retry a request rejected as busy
+    :type busy_retries: int
+    """
+
+    def __init__(self, path, window=64, busy_retries=10):
+        self.path = path
+        self.window = window
+        self.busy_retries = busy_retries
+        self.inflight = 0
+        self.seq = 0
+        self.wire_seq = 0
+        self.requests = {}
+        self.s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.s.connect(self.path)
+        except FileNotFoundError as e:
+            self.s.close()
+            raise e
+        self.s.sendall(PIPELINE_MAGIC)
+
+
+    def recv(self):
+        v = recv_exact(self.s, 4)
+        if v == None:
+            raise ConnectionError('queuer closed connection with {} requests awaiting response'.format(self.inflight))
+        l = int.from_bytes(v, byteorder='big')
+        v = recv_exact(self.s, l)
+        if v == None:
+            raise ConnectionError('queuer closed connection with {} requests awaiting response'.format(self.inflight))
+        self.inflight -= 1
+        wire_seq = int.from_bytes(v[:4], byteorder='big')
+        r = int.from_bytes(v[4:8], byteorder='big')
+        data = v[8:].decode('utf-8')
+        (seq, tx_bytes, attempt) = self.requests.pop(wire_seq)
+        if r == RESULT_BUSY and attempt < self.busy_retries:
+            try:
+                retry_after = float(data)
+            except ValueError:
+                retry_after = 1.0
+            delay = backoff_delay(attempt + 1, retry_after=retry_after)
+            logg.info('queuer busy, retrying request {} in {:.2f} seconds'.format(seq, delay))
+            time.sleep(delay)
+            self.__send(seq, tx_bytes, attempt=attempt + 1)
+            return None
+        return (seq, r, data,)
+
+
+    def __send(self, seq, tx_bytes, attempt=0):
+        self.s.sendall(frame_request(tx_bytes))
+        # the queuer numbers the frames in the order received
+        self.requests[self.wire_seq] = (seq, tx_bytes, attempt,)
+        self.wire_seq += 1
+        self.inflight += 1
+
+
+    def send(self, tx_bytes):
+        """Send a transaction, and collect responses while the window is full.
+
+        :param tx_bytes: Signed transaction
+        :type tx_bytes: bytes
+        :rtype: list
+        :returns: Sequence number, result code and result data of every response received
+        """
+        self.__send(self.seq, tx_bytes)
+        self.seq += 1
+        results = []
+        while self.inflight > self.window:
+            r = self.recv()
+            if r != None:
+                results.append(r)
+        return results
+
+
+    def close(self):
+        """Signal the end of requests and collect all outstanding responses.
+
+        :rtype: list
+        :returns: Sequence number, result code and result data of every response received
+        """
+        results = []
+        while self.inflight > 0:
+            r = self.recv()
+            if r != None:
+                results.append(r)
+        self.s.shutdown(socket.SHUT_WR)
+        self.s.close()
+        return results
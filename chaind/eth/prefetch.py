@@ -0,0 +1,113 @@
+# standard imports
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# external imports
+from chainlib.error import RPCException
+from chainlib.eth.block import block_latest
+
+logg = logging.getLogger(__name__)
+
+
+class BlockPrefetcher:
+    """Fetches the blocks following the one requested concurrently, so that they are ready when the syncer asks for them in order.
+
+    Blocks are only fetched ahead up to the latest block known to the node. The latest block is looked up again when the window reaches it, at most once every head_ttl seconds. A block which was not available when prefetched, or whose prefetch failed, is fetched again when requested. Errors of that fetch are raised to the caller.
+
+    :param conn: RPC connection, must be safe to use from multiple threads
+    :type conn: chainlib.connection.RPCConnection
+    :param chain_interface: Chain interface to generate block queries with
+    :type chain_interface: chainlib.interface.ChainInterface
+    :param lookahead: Number of blocks to fetch ahead of the requested block
+    :type lookahead: int
+    :param head_ttl: Minimum seconds between lookups of the latest block
+    :type head_ttl: float
+    """
+
+    def __init__(self, conn, chain_interface, lookahead=8, head_ttl=10.0):
+        self.conn = conn
+        self.chain_interface = chain_interface
+        self.lookahead = lookahead
+        self.head_ttl = head_ttl
+        self.head = -1
+        self.head_time = 0
+        self.futures = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.executor = ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix='prefetch')
+
+
+    def fetch(self, number):
+        o = self.chain_interface.block_by_number(number)
+        return self.conn.do(o)
+
+
+    def __refresh_head(self):
+        now = time.monotonic()
+        if now - self.head_time < self.head_ttl:
+            return
+        self.head_time = now
+        try:
+            r = self.conn.do(block_latest())
+        except RPCException as e:
+            logg.warning('prefetch could not get latest block: {}'.format(e))
+            return
+        self.head = max(self.head, int(r, 16))
+        logg.debug('prefetch latest block is {}'.format(self.head))
+
+
+    def get(self, number, target=-1):
+        """Get the block source at the given height, and schedule fetching of the blocks following it.
+
+        :param number: Block height
+        :type number: int
+        :param target: Last block to fetch ahead, or -1 if no limit
+        :type target: int
+        :raises chainlib.error.RPCException: Block could not be retrieved
+        :rtype: dict
+        :returns: Block source, or None if the block does not exist
+        """
+        for k in list(self.futures.keys()):
+            if k < number:
+                self.futures.pop(k).cancel()
+
+        upper = number + self.lookahead
+        if target > -1:
+            upper = min(upper, target)
+        if upper > self.head:
+            self.__refresh_head()
+        upper = min(upper, self.head)
+
+        for i in range(number, upper + 1):
+            if self.futures.get(i) == None:
+                self.futures[i] = self.executor.submit(self.fetch, i)
+
+        f = self.futures.pop(number, None)
+        r = None
+        if f != None:
+            try:
+                r = f.result()
+            except RPCException as e:
+                logg.warning('prefetch of block {} failed, fetching it again: {}'.format(number, e))
+                self.errors += 1
+        if r == None:
+            self.misses += 1
+            r = self.fetch(number)
+        else:
+            self.hits += 1
+        if r != None:
+            self.head = max(self.head, number)
+        return r
+
+
+    def close(self):
+        for f in self.futures.values():
+            f.cancel()
+        self.futures = {}
+        self.executor.shutdown()
+
+
+    def __str__(self):
+        return 'block prefetch lookahead {} head {} hits {} misses {} errors {}'.format(self.lookahead, self.head, self.hits, self.misses, self.errors)
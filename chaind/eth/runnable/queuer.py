@@ -2,6 +2,8 @@
 import os
 import logging
 import signal
+import time
+import threading
 
 # external imports
 import chainlib.eth.cli
@@ -22,7 +24,6 @@ from chaind.cli.arg import (
         apply_arg,
         apply_flag,
         )
-from chaind.session import SessionController
 from chaind.setup import Environment
 from chaind.error import (
         NothingToDoError,
@@ -43,19 +44,28 @@ from chainqueue.cache import CacheTokenTx
 from chainlib.encode import TxHexNormalizer
 from chainlib.chain import ChainSpec
 from chaind.adapters.fs import ChaindFsAdapter
-from chaind.dispatch import DispatchProcessor
 from chainqueue.data import config_dir as chainqueue_config_dir
 from chaind.data import config_dir as chaind_config_dir
 from chainlib.eth.cli.log import process_log
 from chaind.cli.config import process_config as process_config_local
 
 # local imports
-from chaind.eth.cache import EthCacheTx
 from chaind.eth.settings import ChaindSettings
-from chaind.eth.dispatch import EthDispatcher
-from chaind.eth.settings import process_settings
-from chaind.settings import (
+from chaind.eth.dispatch import (
+        EthDispatcher,
+        EthAsyncDispatcher,
+        EthDispatchProcessor,
+        DispatchWorker,
+        )
+from chaind.eth.settings import (
+        process_settings,
         process_queue,
+        )
+from chaind.eth.session import EthSessionController
+from chaind.eth.pipeline import PipelineConnection
+from chaind.eth.error import QueueBusyError
+from chaind.eth.admission import RESULT_BUSY
+from chaind.settings import (
         process_socket,
         process_dispatch,
         )
@@ -87,6 +97,7 @@ logg = process_log(args, logg)
 config = Config()
 config.add_schema_dir(chainqueue_config_dir)
 config.add_schema_dir(chaind_config_dir)
+config.add_schema_dir(os.path.join(config_dir, 'eth'))
 config = process_config(config, arg, args, flags)
 config = process_config_local(config, arg, args, flags)
 config.add('eth', 'CHAIND_ENGINE', False)
@@ -103,9 +114,13 @@ logg.debug('settings loaded:\n{}'.format(settings))
 tx_normalizer = TxHexNormalizer().tx_hash
 token_cache_store = CacheTokenTx(settings.get('CHAIN_SPEC'), normalizer=tx_normalizer)
 
-dispatcher = EthDispatcher(settings.get('CONN'))
-processor = DispatchProcessor(settings.get('CHAIN_SPEC'), settings.dir_for('queue'), dispatcher)
-ctrl = SessionController(settings, processor.process)
+if settings.get('DISPATCH_CONCURRENCY') > 0:
+    dispatcher = EthAsyncDispatcher(settings.get('RPC'), settings.get('CHAIN_SPEC'), concurrency=settings.get('DISPATCH_CONCURRENCY'), cache_adapter=settings.get('TX_CACHE_ADAPTER'))
+else:
+    dispatcher = EthDispatcher(settings.get('RPC'), batch_size=settings.get('DISPATCH_BATCH_SIZE'))
+processor = EthDispatchProcessor(settings.get('CHAIN_SPEC'), settings.dir_for('queue'), dispatcher, cache_adapter=settings.get('TX_CACHE_ADAPTER'), adapter_cls=settings.get('QUEUE_DISPATCH_ADAPTER'))
+ctrl = EthSessionController(settings, processor.process)
+ctrl.set_accept_timeout(settings.get('DISPATCH_INTERVAL'))
 
 signal.signal(signal.SIGINT, ctrl.shutdown)
 signal.signal(signal.SIGTERM, ctrl.shutdown)
@@ -114,18 +129,132 @@ logg.info('session id is ' + settings.get('SESSION_ID'))
 logg.info('session socket path is ' + settings.get('SESSION_SOCKET_PATH'))
 
 
+# seconds between decode cache statistics in the log
+DECODE_CACHE_LOG_INTERVAL = 60.0
+decode_cache_log_time = time.monotonic()
+
+
+def dispatch(conn):
+    global decode_cache_log_time
+    r = processor.process(conn)
+    if time.monotonic() - decode_cache_log_time >= DECODE_CACHE_LOG_INTERVAL:
+        logg.debug(str(settings.get('DECODE_CACHE')))
+        decode_cache_log_time = time.monotonic()
+    return r
+
+
+def put(queue_adapter, v):
+    result_data = None
+    r = 0 # no error
+    # the dispatch worker changes the same store
+    with processor.store_lock:
+        try:
+            result_data = queue_adapter.put(v.hex())
+        except DuplicateTxError as e:
+            logg.error('tx already exists: {}'.format(e))
+            r = 1
+        except QueueBusyError as e:
+            logg.warning('tx not admitted: {}'.format(e))
+            return (RESULT_BUSY, str(e.retry_after),)
+        except ValueError as e:
+            logg.error('adapter rejected input {}: "{}"'.format(v.hex(), e))
+            return (2, None,)
+
+        if r == 0:
+            queue_adapter.enqueue(result_data)
+
+    return (r, result_data,)
+
+
+def serve_pipeline(queue_adapter, client, worker=None, batch_size=0):
+    done = False
+    while not done:
+        reqs = []
+        while True:
+            req = None
+            try:
+                req = client.get()
+            except ValueError as e:
+                logg.error('pipeline client sent invalid frame: {}'.format(e))
+            if req == None:
+                done = True
+                break
+            reqs.append(req)
+            if len(reqs) >= batch_size or not client.ready():
+                break
+
+        results = []
+        c = 0
+        for (seq, v) in reqs:
+            (r, result_data) = put(queue_adapter, v)
+            if r == 0:
+                c += 1
+            results.append((seq, r, result_data,))
+        if batch_size > 0 and len(reqs) > 0:
+            with processor.store_lock:
+                queue_adapter.commit()
+
+        for (seq, r, result_data) in results:
+            client.respond_put(seq, r, extra_data=result_data)
+        if c > 0 and worker != None:
+            worker.wake()
+    logg.info('pipeline client done after {} requests'.format(client.seq))
+
+
+def serve_pipeline_thread(queue_adapter, client, worker=None, batch_size=0):
+    try:
+        serve_pipeline(queue_adapter, client, worker=worker, batch_size=batch_size)
+    except Exception as e:
+        logg.exception('pipeline client failed after {} requests: {}'.format(client.seq, e))
+    client.close()
+
+
 def main():
     global dispatcher, settings
 
-    queue_adapter = ChaindFsAdapter(
+    # the queue view is only needed by admission control
+    snapshot_path = None
+    if settings.get('ADMISSION') != None and settings.get('SNAPSHOT_INTERVAL') > 0:
+        snapshot_path = os.path.join(settings.dir_for('queue'), '.snapshot')
+
+    queue_adapter = settings.get('QUEUE_ADAPTER')(
         settings.get('CHAIN_SPEC'),
         settings.dir_for('queue'),
-        EthCacheTx,
+        settings.get('TX_CACHE_ADAPTER'),
         dispatcher,
+        known_index=settings.get('KNOWN_INDEX'),
+        admission=settings.get('ADMISSION'),
+        snapshot_path=snapshot_path,
+        deferred_commit=settings.get('COMMIT_BATCH_SIZE') > 0,
         store_sync=False,
         )
+    if settings.get('ADMISSION') != None and snapshot_path == None:
+        queue_adapter.refresh()
+    snapshot_time = time.monotonic()
+
+    worker = DispatchWorker(dispatch, settings.get('RPC'), interval=settings.get('DISPATCH_INTERVAL'), busy_interval=settings.get('SESSION_DISPATCH_DELAY'))
+    worker.start()
+
+    batch_size = settings.get('COMMIT_BATCH_SIZE')
+    batch = []
+    batch_start = 0
+    pipelines = []
+
+    def commit():
+        with processor.store_lock:
+            queue_adapter.commit()
+        for (client_socket, r, result_data) in batch:
+            ctrl.respond_put(client_socket, r, extra_data=result_data)
+        logg.debug('group commit of {} submissions'.format(len(batch)))
+        batch.clear()
+        worker.wake()
 
     while True:
+        if len(batch) > 0:
+            if len(batch) >= batch_size or time.monotonic() - batch_start >= settings.get('COMMIT_DELAY'):
+                commit()
+                ctrl.set_accept_timeout(settings.get('DISPATCH_INTERVAL'))
+
         v = None
         client_socket = None
         try:
@@ -137,28 +266,43 @@ def main():
         except ClientInputError:
             continue
         except NothingToDoError:
-            pass
+            if snapshot_path != None and time.monotonic() - snapshot_time >= settings.get('SNAPSHOT_INTERVAL'):
+                with processor.store_lock:
+                    queue_adapter.save_snapshot()
+                snapshot_time = time.monotonic()
+            continue
 
-        if v == None:
-            ctrl.process(settings.get('CONN'))
-            #queue_adapter = create_adapter(settings, dispatcher)
+        # pipelined clients are served alongside the accept loop, so that one does not hold up the others
+        if isinstance(client_socket, PipelineConnection):
+            pipelines = [t for t in pipelines if t.is_alive()]
+            t = threading.Thread(target=serve_pipeline_thread, args=(queue_adapter, client_socket,), kwargs={'worker': worker, 'batch_size': batch_size}, daemon=True)
+            t.start()
+            pipelines.append(t)
             continue
 
-        result_data = None
-        r = 0 # no error
-        try:
-            result_data = queue_adapter.put(v.hex())
-        except DuplicateTxError as e:
-            logg.error('tx already exists: {}'.format(e))
-            r = 1
-        except ValueError as e:
-            logg.error('adapter rejected input {}: "{}"'.format(v.hex(), e))
+        (r, result_data) = put(queue_adapter, v)
+        if r == 2:
             continue
 
-        if r == 0:
-            queue_adapter.enqueue(result_data)
+        if batch_size > 0:
+            if len(batch) == 0:
+                batch_start = time.monotonic()
+                ctrl.set_accept_timeout(settings.get('COMMIT_DELAY'))
+            batch.append((client_socket, r, result_data,))
+            continue
 
         ctrl.respond_put(client_socket, r, extra_data=result_data)
+        if r == 0:
+            worker.wake()
+
+    for t in pipelines:
+        t.join()
+    if len(batch) > 0:
+        commit()
+    worker.stop()
+    worker.join()
+    queue_adapter.save_snapshot()
+    logg.info(str(settings.get('DECODE_CACHE')))
         
 
 if __name__ == '__main__':
@@ -7,6 +7,7 @@ import enum
 import re
 import stat
 import socket
+import time
 
 # external imports
 import chainlib.eth.cli
@@ -34,7 +35,6 @@ from chaind.cli.arg import (
         apply_flag,
         )
 from chainlib.eth.cli.log import process_log
-from chaind.settings import process_queue
 from chaind.settings import ChaindSettings
 from chaind.error import TxSourceError
 from chainlib.error import (
@@ -51,10 +51,21 @@ from chaind.eth.cli.output import (
         Outputter,
         OpMode,
         )
-from chaind.eth.settings import process_settings
+from chaind.eth.settings import (
+        process_settings,
+        process_queue,
+        )
+from chaind.eth.pipeline import PipelineSender
+from chaind.eth.admission import (
+        RESULT_BUSY,
+        backoff_delay,
+        )
 
 logg = logging.getLogger()
 
+script_dir = os.path.dirname(os.path.realpath(__file__))
+config_dir = os.path.join(script_dir, '..', 'data', 'config')
+
 
 def process_settings_local(settings, config):
 #    if settings.get('SIGNER') == None:
@@ -85,6 +96,7 @@ logg = process_log(args, logg)
 config = Config()
 config.add_schema_dir(chainqueue_config_dir)
 config.add_schema_dir(chaind_config_dir)
+config.add_schema_dir(os.path.join(config_dir, 'eth'))
 config = process_config(config, arg, args, flags)
 config = process_config_local(config, arg, args, flags)
 config.add(args.source, '_SOURCE', False)
@@ -133,8 +145,26 @@ class SocketSender:
 
     def __init__(self, settings):
         self.path = settings.get('SESSION_SOCKET_PATH')
+        self.busy_retries = settings.get('ADMISSION_SEND_RETRIES')
+
 
     def send(self, tx):
+        attempt = 0
+        while True:
+            r = self.send_once(tx)
+            if int.from_bytes(r[:4], byteorder='big') != RESULT_BUSY or attempt == self.busy_retries:
+                return r
+            attempt += 1
+            try:
+                retry_after = float(r[4:].decode('utf-8'))
+            except ValueError:
+                retry_after = 1.0
+            delay = backoff_delay(attempt, retry_after=retry_after)
+            logg.info('queuer busy, retrying in {:.2f} seconds'.format(delay))
+            time.sleep(delay)
+
+
+    def send_once(self, tx):
         s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         err = None
         try:
@@ -169,7 +199,11 @@ def main():
             )
     
     logg.debug('source {}'.format(config.get('_SOURCE')))
-    processor = Processor(token_resolver, config.get('_SOURCE')[0], use_checksum=not config.get('_UNSAFE'))
+    try:
+        processor = Processor(token_resolver, config.get('_SOURCE')[0], use_checksum=not config.get('_UNSAFE'), sign_processes=settings.get('SIGN_PROCESSES'), sign_batch_size=settings.get('SIGN_BATCH_SIZE'))
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
     processor.add_processor(CSVProcessor())
 
     sends = None
@@ -182,7 +216,14 @@ def main():
     sender = None
     if config.true('_SOCKET_SEND'):
         if settings.get('SESSION_SOCKET_PATH') != None:
-            sender = SocketSender(settings)
+            if settings.get('PIPELINE_WINDOW') > 0:
+                try:
+                    sender = PipelineSender(settings.get('SESSION_SOCKET_PATH'), window=settings.get('PIPELINE_WINDOW'), busy_retries=settings.get('ADMISSION_SEND_RETRIES'))
+                except FileNotFoundError as e:
+                    sys.stderr.write('send to socket {} failed: {}\n'.format(settings.get('SESSION_SOCKET_PATH'), e))
+                    sys.exit(1)
+            else:
+                sender = SocketSender(settings)
 
     tx_iter = iter(processor)
     out = Outputter(mode)
@@ -192,8 +233,17 @@ def main():
             tx_bytes = next(tx_iter)
         except StopIteration:
             break
+        except TxSourceError as e:
+            sys.stderr.write('processing error after {} transactions: {}. processors: {}\n'.format(processor.cursor, str(e), str(processor)))
+            if isinstance(sender, PipelineSender):
+                for r in sender.close():
+                    logg.info('sent seq {} result {} {}'.format(r[0], r[1], r[2]))
+            sys.exit(1)
         tx_hex = tx_bytes.hex()
-        if sender != None:
+        if isinstance(sender, PipelineSender):
+            for r in sender.send(tx_bytes):
+                logg.info('sent seq {} result {} {}'.format(r[0], r[1], r[2]))
+        elif sender != None:
             r = None
             try:
                 r = sender.send(tx_hex)
@@ -203,6 +253,10 @@ def main():
             logg.info('sent {} result {}'.format(tx_hex, r))
         print(out.do(tx_hex))
 
+    if isinstance(sender, PipelineSender):
+        for r in sender.close():
+            logg.info('sent seq {} result {} {}'.format(r[0], r[1], r[2]))
+
 
 if __name__ == '__main__':
     main()
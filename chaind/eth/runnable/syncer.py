@@ -1,15 +1,13 @@
 # standard imports
 import os
+import sys
 import logging
 
 # external imports
 import chainlib.eth.cli
 from chaind.setup import Environment
-from chaind.filter import StateFilter
 from chainlib.eth.block import block_latest
 from hexathon import strip_0x
-from chainsyncer.store.fs import SyncFsStore
-from chainsyncer.driver.chain_interface import ChainInterfaceDriver
 from chainsyncer.error import SyncDone
 from chainlib.eth.cli.arg import (
         Arg,
@@ -36,11 +34,21 @@ from chaind.cli.config import process_config as process_config_local
 from chainsyncer.cli.config import process_config as process_config_syncer
 
 # local imports
-from chaind.eth.cache import EthCacheTx
 from chaind.eth.settings import (
     process_settings,
     process_sync,
     )
+from chaind.eth.filter import EthStateFilter
+from chaind.eth.driver import EthChainInterfaceDriver
+from chaind.eth.index import KnownHashIndex
+from chaind.eth.track import TxTracker
+from chaind.eth.sparse import ReceiptPoller
+from chaind.eth.head import NewHeadsSubscription
+from chaind.eth.shard import (
+        shard_range,
+        shard_session_id,
+        run_shards,
+        )
 
 
 logg = logging.getLogger()
@@ -71,6 +79,7 @@ logg = process_log(args, logg)
 config = Config()
 config.add_schema_dir(chainsyncer_config_dir)
 config.add_schema_dir(chaind_config_dir)
+config.add_schema_dir(os.path.join(config_dir, 'eth'))
 config = process_config(config, arg, args, flags)
 config = process_config_local(config, arg, args, flags)
 config = process_config_syncer(config, arg, args, flags)
@@ -84,18 +93,65 @@ settings = process_sync(settings, config)
 logg.debug('settings loaded:\n{}'.format(settings))
 
 
-def main():
-    fltr = StateFilter(settings.get('CHAIN_SPEC'), settings.dir_for('queue'), EthCacheTx)
-    sync_store = SyncFsStore(settings.get('SESSION_DATA_PATH'), session_id=settings.get('SESSION_ID'))
+def get_adapter():
+    return settings.get('QUEUE_ADAPTER')(settings.get('CHAIN_SPEC'), settings.dir_for('queue'), settings.get('TX_CACHE_ADAPTER'), None)
+
+
+def sync(offset, target, session_id, sparse=True, head=True):
+    fltr = EthStateFilter(settings.get('CHAIN_SPEC'), settings.dir_for('queue'), settings.get('TX_CACHE_ADAPTER'), adapter_cls=settings.get('QUEUE_DISPATCH_ADAPTER'))
+    sync_store = settings.get('SYNC_STORE')(settings.get('SESSION_DATA_PATH'), session_id=session_id)
     sync_store.register(fltr)
 
-    logg.debug('session block offset {}'.format(settings.get('SYNCER_OFFSET')))
+    logg.debug('session {} block offset {} target {}'.format(session_id, offset, target))
+
+    tracker = None
+    if settings.get('SYNCER_TRACK'):
+        index = settings.get('KNOWN_INDEX')
+        if index == None:
+            index = KnownHashIndex()
+        tracker = TxTracker(index, get_adapter().load_since, senders=settings.get('SYNCER_TRACK_SENDERS'))
+
+    poller = None
+    if sparse and settings.get('SYNCER_SPARSE_THRESHOLD') > 0:
+        poller = ReceiptPoller(get_adapter, settings.get('SYNCER_INTERFACE'), threshold=settings.get('SYNCER_SPARSE_THRESHOLD'), check_interval=settings.get('SYNCER_SPARSE_CHECK_INTERVAL'))
 
-    drv = ChainInterfaceDriver(sync_store, settings.get('SYNCER_INTERFACE'), offset=settings.get('SYNCER_OFFSET'), target=settings.get('SYNCER_LIMIT'))
+    follow = None
+    heads = None
+    if head:
+        follow = settings.get('SYNCER_FOLLOW')
+        if follow != None and settings.get('SYNCER_HEADS_URL') != None:
+            heads = NewHeadsSubscription(settings.get('SYNCER_HEADS_URL'))
+            heads.start()
+
+    drv = EthChainInterfaceDriver(sync_store, settings.get('SYNCER_INTERFACE'), offset=offset, target=target, prefetch=settings.get('SYNCER_PREFETCH'), tracker=tracker, poller=poller, cache=settings.get('SYNCER_CACHE'), confirmations=settings.get('SYNCER_CACHE_CONFIRMATIONS'), follow=follow, heads=heads)
     try:
-        drv.run(settings.get('CONN'))
+        drv.run(settings.get('RPC'))
     except SyncDone as e:
         logg.info('sync done: {}'.format(e))
+    finally:
+        drv.close()
+
+
+def sync_shard(offset, target):
+    sync(offset, target, shard_session_id(settings.get('SESSION_ID'), offset, target), sparse=False, head=False)
+
+
+def main():
+    offset = settings.get('SYNCER_OFFSET')
+    limit = settings.get('SYNCER_LIMIT')
+    shards = []
+    if settings.get('SYNCER_SHARDS') > 1 and limit > offset:
+        shards = shard_range(offset, limit, settings.get('SYNCER_SHARDS'))
+
+    if len(shards) < 2:
+        sync(offset, limit, settings.get('SESSION_ID'))
+        return
+
+    logg.info('syncing blocks {} to {} in {} shards'.format(offset, limit, len(shards)))
+    failed = run_shards(sync_shard, shards)
+    if len(failed) > 0:
+        logg.error('{} of {} sync shards failed, run again with the same range and shards to resume them'.format(len(failed), len(shards)))
+        sys.exit(1)
    
 
 if __name__ == '__main__':
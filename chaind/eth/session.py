@@ -0,0 +1,90 @@
+# standard imports
+import os
+import stat
+import logging
+
+# external imports
+from hexathon import strip_0x
+from chaind.session import SessionController
+from chaind.error import (
+        NothingToDoError,
+        ClientGoneError,
+        ClientBlockError,
+        ClientInputError,
+        )
+
+# local imports
+from chaind.eth.pipeline import (
+        PIPELINE_MAGIC,
+        PipelineConnection,
+        )
+
+logg = logging.getLogger(__name__)
+
+
+class EthSessionController(SessionController):
+    """Session controller which also accepts pipelined client connections.
+
+    A client which opens with PIPELINE_MAGIC is returned as a chaind.eth.pipeline.PipelineConnection in place of the client socket, with no data. Other clients are handled as single hex transaction submissions, as before.
+    """
+
+    pipeline_timeout = 5.0
+    accept_timeout = None
+
+    def set_accept_timeout(self, timeout):
+        """Wait up to timeout seconds for each client connection.
+
+        Without it, the accept timeout is adjusted after each client and each dispatch cycle, to interleave dispatch with client input in the same loop.
+
+        :param timeout: Seconds to wait for a client
+        :type timeout: float
+        """
+        self.accept_timeout = timeout
+        self.srv.settimeout(timeout)
+
+
+    def get(self):
+        srvs = None
+        try:
+            logg.debug('getting connection')
+            (srvs, srvs_addr) = self.get_connection()
+        except OSError as e:
+            try:
+                fi = os.stat(self.socket_path)
+            except FileNotFoundError:
+                logg.error('socket is gone')
+                raise ClientGoneError()
+            if not stat.S_ISSOCK(fi.st_mode):
+                logg.error('entity on socket path is not a socket')
+                raise ClientGoneError()
+            if srvs == None:
+                logg.debug('timeout (remote socket is none)')
+                raise NothingToDoError()
+
+        if self.accept_timeout == None:
+            self.srv.settimeout(0.1)
+        srvs.settimeout(0.1)
+        data_in = None
+        try:
+            data_in = srvs.recv(1048576)
+        except BlockingIOError as e:
+            logg.debug('block io error: {}'.format(e))
+
+        if data_in == None:
+            raise ClientBlockError()
+
+        if data_in[:len(PIPELINE_MAGIC)] == PIPELINE_MAGIC:
+            logg.debug('client requested pipeline')
+            return (PipelineConnection(srvs, buf=data_in[len(PIPELINE_MAGIC):], timeout=self.pipeline_timeout), None,)
+
+        data = None
+        data_in_str = None
+        try:
+            data_in_str = data_in.decode('utf-8')
+            data_hex = strip_0x(data_in_str.rstrip())
+            data = bytes.fromhex(data_hex)
+        except ValueError:
+            logg.error('invalid input "{}"'.format(data_in_str))
+            raise ClientInputError()
+
+        return (srvs, data,)
@@ -1,32 +1,277 @@
+# standard imports
+import os
+
 # external imports
-from chainlib.eth.connection import EthHTTPConnection
 from chainlib.eth.settings import process_settings as base_process_settings
 from chaind.eth.chain import EthChainInterface
+from chaind.eth.connection import (
+        EthBatchHTTPConnection,
+        EthPoolHTTPConnection,
+        EthMultiConnection,
+        )
+from chaind.eth.cache import (
+        EthCacheTx,
+        EthLazyCacheTx,
+        DecodeCache,
+        )
 from chaind.settings import *
+from chaind.settings import process_queue as base_process_queue
+from chaind.adapters.fs import ChaindFsAdapter
 from chainsyncer.settings import process_sync_range
+from chainsyncer.store.fs import SyncFsStore
+from chainqueue.store.fs import (
+        IndexStore,
+        CounterStore,
+        )
+from chaind.eth.index import KnownHashIndex
+from chaind.eth.admission import AdmissionControl
+from chaind.eth.adapter import (
+        EthFsAdapter,
+        EthSqliteAdapter,
+        EthLogAdapter,
+        )
+from chaind.eth.store.sqlite import (
+        shared_factory,
+        SqliteIndexStore,
+        SqliteCounterStore,
+        SyncSqliteStore,
+        )
+from chaind.eth.store.log import shared_factory as shared_log_factory
+from chaind.eth.blockcache import BlockCache
+from chaind.eth.head import HeadFollow
 
 
-def process_common(settings, config):
+def process_rpc_providers(settings, config):
     rpc_provider = config.get('RPC_PROVIDER')
     if rpc_provider == None:
         rpc_provider = 'http://localhost:8545'
-    conn = EthHTTPConnection(url=rpc_provider, chain_spec=settings.get('CHAIN_SPEC'))
+
+    rpc_providers = []
+    for url in rpc_provider.split(','):
+        url = url.strip()
+        if url != '':
+            rpc_providers.append(url)
+    settings.set('RPC_PROVIDERS', rpc_providers)
+
+    # connections created by chainlib only take a single endpoint
+    if len(rpc_providers) > 1:
+        config.add(rpc_providers[0], 'RPC_PROVIDER', exists_ok=True)
+    return settings
+
+
+def process_common(settings, config):
+    conns = []
+    pool_size = int(config.get('POOL_SIZE'))
+    for url in settings.get('RPC_PROVIDERS'):
+        if pool_size > 0:
+            conn = EthPoolHTTPConnection(url=url, chain_spec=settings.get('CHAIN_SPEC'), pool_size=pool_size, idle_timeout=float(config.get('POOL_IDLE_TIMEOUT')))
+        else:
+            conn = EthBatchHTTPConnection(url=url, chain_spec=settings.get('CHAIN_SPEC'))
+        conns.append(conn)
+
+    if len(conns) > 1:
+        conn = EthMultiConnection(
+                conns,
+                hedge_delay=float(config.get('ROUTE_HEDGE_DELAY')),
+                error_threshold=float(config.get('ROUTE_ERROR_THRESHOLD')),
+                cooldown=float(config.get('ROUTE_COOLDOWN')),
+                )
     settings.set('RPC', conn)
     return settings
 
 
+def process_decode(settings, config):
+    decode_cache = DecodeCache(
+            capacity=int(config.get('DECODE_CACHE_SIZE')),
+            capacity_bytes=int(config.get('DECODE_CACHE_BYTES')),
+            )
+    EthCacheTx.decode_cache = decode_cache
+    settings.set('DECODE_CACHE', decode_cache)
+
+    decode_processes = int(config.get('DECODE_PROCESSES'))
+    if decode_processes == 0:
+        decode_processes = os.cpu_count()
+    EthCacheTx.decode_processes = decode_processes
+    settings.set('DECODE_PROCESSES', decode_processes)
+
+    if config.true('DECODE_LAZY'):
+        settings.set('TX_CACHE_ADAPTER', EthLazyCacheTx)
+    else:
+        settings.set('TX_CACHE_ADAPTER', EthCacheTx)
+    return settings
+
+
+def process_dispatch_batch(settings, config):
+    settings.set('DISPATCH_BATCH_SIZE', int(config.get('DISPATCH_BATCH_SIZE')))
+    settings.set('DISPATCH_CONCURRENCY', int(config.get('DISPATCH_CONCURRENCY')))
+    settings.set('DISPATCH_INTERVAL', float(config.get('DISPATCH_INTERVAL')))
+    return settings
+
+
+def process_pipeline(settings, config):
+    settings.set('PIPELINE_WINDOW', int(config.get('PIPELINE_WINDOW')))
+    return settings
+
+
+def process_sign(settings, config):
+    sign_processes = int(config.get('SIGN_PROCESSES'))
+    if sign_processes == 0:
+        sign_processes = os.cpu_count()
+    settings.set('SIGN_PROCESSES', sign_processes)
+    settings.set('SIGN_BATCH_SIZE', int(config.get('SIGN_BATCH_SIZE')))
+    return settings
+
+
+def process_commit(settings, config):
+    settings.set('COMMIT_BATCH_SIZE', int(config.get('COMMIT_BATCH_SIZE')))
+    settings.set('COMMIT_DELAY', float(config.get('COMMIT_DELAY')))
+    return settings
+
+
+def process_index(settings, config):
+    known_index = None
+    capacity = int(config.get('INDEX_CAPACITY'))
+    if capacity > 0:
+        known_index = KnownHashIndex(
+                capacity=capacity,
+                error_rate=float(config.get('INDEX_ERROR_RATE')),
+                exact=config.true('INDEX_EXACT'),
+                )
+    settings.set('KNOWN_INDEX', known_index)
+    return settings
+
+
+def process_admission(settings, config):
+    admission = None
+    max_depth = int(config.get('ADMISSION_MAX_DEPTH'))
+    max_sender_depth = int(config.get('ADMISSION_MAX_SENDER_DEPTH'))
+    if max_depth > 0 or max_sender_depth > 0:
+        admission = AdmissionControl(
+                max_depth=max_depth,
+                max_sender_depth=max_sender_depth,
+                retry_after=float(config.get('ADMISSION_RETRY_AFTER')),
+                refresh_interval=float(config.get('ADMISSION_REFRESH_INTERVAL')),
+                )
+    settings.set('ADMISSION', admission)
+    settings.set('ADMISSION_SEND_RETRIES', int(config.get('ADMISSION_SEND_RETRIES')))
+    return settings
+
+
+def process_snapshot(settings, config):
+    settings.set('SNAPSHOT_INTERVAL', float(config.get('SNAPSHOT_INTERVAL')))
+    return settings
+
+
+def process_queue_backend(settings, config):
+    if config.get('STATE_BACKEND') == 'sqlite':
+        settings.set('QUEUE_ADAPTER', EthSqliteAdapter)
+        settings.set('QUEUE_DISPATCH_ADAPTER', EthSqliteAdapter)
+        settings.set('SYNC_STORE', SyncSqliteStore)
+    elif config.get('STATE_BACKEND') == 'log':
+        settings.set('QUEUE_ADAPTER', EthLogAdapter)
+        settings.set('QUEUE_DISPATCH_ADAPTER', EthLogAdapter)
+        settings.set('SYNC_STORE', SyncFsStore)
+    else:
+        settings.set('QUEUE_ADAPTER', EthFsAdapter)
+        settings.set('QUEUE_DISPATCH_ADAPTER', ChaindFsAdapter)
+        settings.set('SYNC_STORE', SyncFsStore)
+    return settings
+
+
+def process_queue(settings, config):
+    if config.get('STATE_BACKEND') not in ['sqlite', 'log']:
+        return base_process_queue(settings, config)
+
+    if config.get('STATE_PATH') == None:
+        config.add(settings.dir_for('queue'), 'STATE_PATH', False)
+    settings = process_queue_tx(settings, config)
+    settings = process_queue_paths(settings, config)
+    state_path = config.get('STATE_PATH')
+    if config.get('STATE_BACKEND') == 'log':
+        factory = shared_log_factory(os.path.join(state_path, 'log'))
+        settings.set('QUEUE_INDEX_STORE', IndexStore(os.path.join(state_path, 'tx'), digest_bytes=32))
+        settings.set('QUEUE_COUNTER_STORE', CounterStore(state_path))
+    else:
+        factory = shared_factory(os.path.join(state_path, 'queue.sqlite'))
+        settings.set('QUEUE_INDEX_STORE', SqliteIndexStore(factory))
+        settings.set('QUEUE_COUNTER_STORE', SqliteCounterStore(factory))
+    settings.set('QUEUE_STORE_FACTORY', factory.add)
+    settings = process_queue_store(settings, config)
+    return settings
+
+
+def process_sync_track(settings, config):
+    settings.set('SYNCER_TRACK', config.true('TRACK_PREFILTER'))
+    senders = []
+    for v in config.get('TRACK_SENDERS', '').split(','):
+        v = v.strip()
+        if v != '':
+            senders.append(v)
+    settings.set('SYNCER_TRACK_SENDERS', senders)
+    return settings
+
+
+def process_sync_sparse(settings, config):
+    settings.set('SYNCER_SPARSE_THRESHOLD', int(config.get('SPARSE_THRESHOLD')))
+    settings.set('SYNCER_SPARSE_CHECK_INTERVAL', float(config.get('SPARSE_CHECK_INTERVAL')))
+    return settings
+
+
+def process_sync_cache(settings, config):
+    cache = None
+    cache_path = config.get('BLOCKCACHE_PATH')
+    if cache_path != None:
+        cache = BlockCache(os.path.expanduser(cache_path), settings.get('CHAIN_SPEC'), max_bytes=int(config.get('BLOCKCACHE_SIZE')))
+    settings.set('SYNCER_CACHE', cache)
+    settings.set('SYNCER_CACHE_CONFIRMATIONS', int(config.get('BLOCKCACHE_CONFIRMATIONS')))
+    return settings
+
+
+def process_sync_head(settings, config):
+    follow = None
+    if config.true('HEAD_ADAPTIVE'):
+        follow = HeadFollow(
+                block_time=float(config.get('HEAD_BLOCK_TIME')),
+                min_interval=float(config.get('HEAD_MIN_INTERVAL')),
+                max_interval=float(config.get('HEAD_MAX_INTERVAL')),
+                )
+    settings.set('SYNCER_FOLLOW', follow)
+    settings.set('SYNCER_HEADS_URL', config.get('HEAD_WEBSOCKET'))
+    return settings
+
+
 def process_sync(settings, config):
     dialect_filter = settings.get('RPC_DIALECT_FILTER')
-    settings.set('SYNCER_INTERFACE', EthChainInterface(dialect_filter=dialect_filter))
+    settings.set('SYNCER_INTERFACE', EthChainInterface(
+        dialect_filter=dialect_filter,
+        receipt_method=config.get('RECEIPT_METHOD'),
+        batch_limit=int(config.get('RECEIPT_BATCH_SIZE')),
+        ))
     #settings.set('SYNCER_INTERFACE', EthChainInterface())
     settings = process_sync_range(settings, config)
+    settings.set('SYNCER_PREFETCH', int(config.get('PREFETCH_LOOKAHEAD')))
+    settings.set('SYNCER_SHARDS', int(config.get('SHARD_COUNT')))
+    settings = process_sync_track(settings, config)
+    settings = process_sync_sparse(settings, config)
+    settings = process_sync_cache(settings, config)
+    settings = process_sync_head(settings, config)
     return settings
 
 
 def process_settings(settings, config):
+    settings = process_rpc_providers(settings, config)
     settings = base_process_settings(settings, config)
     settings = process_common(settings, config)
+    settings = process_decode(settings, config)
+    settings = process_dispatch_batch(settings, config)
+    settings = process_pipeline(settings, config)
+    settings = process_sign(settings, config)
+    settings = process_commit(settings, config)
+    settings = process_index(settings, config)
+    settings = process_admission(settings, config)
+    settings = process_snapshot(settings, config)
     settings = process_backend(settings, config)
+    settings = process_queue_backend(settings, config)
     settings = process_session(settings, config)
     settings = process_socket(settings, config)
     settings = process_token(settings, config)
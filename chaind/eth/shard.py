@@ -0,0 +1,66 @@
+# standard imports
+import logging
+import multiprocessing
+
+logg = logging.getLogger(__name__)
+
+
+def shard_range(offset, limit, count):
+    """Split a block range into consecutive shards of about equal size.
+
+    :param offset: First block of range
+    :type offset: int
+    :param limit: Last block of range, inclusive
+    :type limit: int
+    :param count: Maximum number of shards
+    :type count: int
+    :rtype: list
+    :returns: First and last block, inclusive, of each shard, in order
+    """
+    total = limit - offset + 1
+    if total <= 0:
+        return []
+    count = max(1, min(count, total))
+    size = total // count
+    rest = total % count
+    r = []
+    a = offset
+    for i in range(count):
+        b = a + size - 1
+        if i < rest:
+            b += 1
+        r.append((a, b,))
+        a = b + 1
+    return r
+
+
+def shard_session_id(session_id, offset, target):
+    return '{}.{}-{}'.format(session_id, offset, target)
+
+
+def run_shards(fn, shards):
+    """Run a sync function for each shard in its own process, and wait for all of them to finish.
+
+    :param fn: Sync function, taking the first and last block of the shard
+    :type fn: function
+    :param shards: First and last block of each shard
+    :type shards: list of tuple
+    :rtype: list
+    :returns: Shards whose process did not exit successfully
+    """
+    procs = []
+    for (offset, target) in shards:
+        p = multiprocessing.Process(target=fn, args=(offset, target,), name='sync-{}-{}'.format(offset, target))
+        p.start()
+        logg.info('started sync shard {}-{} pid {}'.format(offset, target, p.pid))
+        procs.append((p, offset, target,))
+
+    failed = []
+    for (p, offset, target) in procs:
+        p.join()
+        if p.exitcode != 0:
+            logg.error('sync shard {}-{} exited with code {}'.format(offset, target, p.exitcode))
+            failed.append((offset, target,))
+        else:
+            logg.info('sync shard {}-{} done'.format(offset, target))
+    return failed
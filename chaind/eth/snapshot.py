@@ -0,0 +1,79 @@
+# standard imports
+import os
+import logging
+
+logg = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'chaindq\x02'
+SNAPSHOT_ENTRY_SIZE = 4 + 32 + 8 + 20
+
+
+def snapshot_write(path, entries, view_time):
+    """Write a queue state snapshot.
+
+    The 8-byte time of the view of the queue is followed by the entries. Each entry is written in a fixed size record of the 4-byte state, the 32-byte transaction hash, the 8-byte nonce and the 20-byte sender address. The snapshot replaces any previous one atomically.
+
+    :param path: Snapshot file path
+    :type path: str
+    :param entries: State, nonce and sender, by transaction hash
+    :type entries: dict
+    :param view_time: Time the entries were read from the queue store, in nanoseconds
+    :type view_time: int
+    """
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'wb')
+    f.write(SNAPSHOT_MAGIC)
+    f.write(view_time.to_bytes(8, byteorder='big'))
+    f.write(len(entries).to_bytes(4, byteorder='big'))
+    for (tx_hash, (state, nonce, sender)) in entries.items():
+        if nonce == None:
+            nonce = 0xffffffffffffffff
+        f.write(state.to_bytes(4, byteorder='big'))
+        f.write(bytes.fromhex(tx_hash))
+        f.write(nonce.to_bytes(8, byteorder='big'))
+        f.write(bytes.fromhex(sender))
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(tmp_path, path)
+    logg.info('wrote queue snapshot with {} entries to {}'.format(len(entries), path))
+
+
+def snapshot_read(path):
+    """Read a queue state snapshot written by snapshot_write.
+
+    :param path: Snapshot file path
+    :type path: str
+    :raises ValueError: Snapshot is invalid
+    :rtype: tuple
+    :returns: State, nonce and sender by transaction hash, and the time of the view in nanoseconds; or None if there is no snapshot
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    v = f.read()
+    f.close()
+
+    if v[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError('not a queue snapshot: {}'.format(path))
+    c = len(SNAPSHOT_MAGIC)
+    view_time = int.from_bytes(v[c:c+8], byteorder='big')
+    c += 8
+    l = int.from_bytes(v[c:c+4], byteorder='big')
+    c += 4
+    if len(v) - c != l * SNAPSHOT_ENTRY_SIZE:
+        raise ValueError('queue snapshot {} truncated, expected {} entries'.format(path, l))
+
+    entries = {}
+    for i in range(l):
+        state = int.from_bytes(v[c:c+4], byteorder='big')
+        tx_hash = v[c+4:c+36].hex()
+        nonce = int.from_bytes(v[c+36:c+44], byteorder='big')
+        if nonce == 0xffffffffffffffff:
+            nonce = None
+        sender = v[c+44:c+64].hex()
+        entries[tx_hash] = (state, nonce, sender,)
+        c += SNAPSHOT_ENTRY_SIZE
+    logg.info('read queue snapshot with {} entries from {}'.format(len(entries), path))
+    return (entries, view_time,)
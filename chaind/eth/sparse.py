@@ -0,0 +1,118 @@
+# standard imports
+import logging
+import time
+
+# external imports
+from chainlib.error import RPCException
+from chainlib.eth.block import block_by_hash
+from hexathon import (
+        add_0x,
+        strip_0x,
+        to_int as hex_to_int,
+        )
+
+logg = logging.getLogger(__name__)
+
+
+class BlockStub:
+    """Stands in for a block which is not fetched, while receipts are polled instead.
+
+    :param number: Block height
+    :type number: int
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.hash = None
+        self.txs = []
+
+
+    def __str__(self):
+        return 'block {} (not fetched)'.format(self.number)
+
+
+class ReceiptPoller:
+    """Finds the receipts of the transactions in the queue by hash, instead of scanning every block for them.
+
+    The poller is active while the number of transactions in the queue which are not final is at most threshold. The number is looked up again at most once every check_interval seconds.
+
+    :param get_adapter: Callable returning a queue adapter with an active method, such as chaind.eth.adapter.EthFsAdapter
+    :type get_adapter: function
+    :param chain_interface: Chain interface to generate queries and objects with
+    :type chain_interface: chaind.eth.chain.EthChainInterface
+    :param threshold: Maximum number of pending transactions to poll receipts for, 0 to never poll
+    :type threshold: int
+    :param check_interval: Minimum seconds between lookups of the pending transactions
+    :type check_interval: float
+    """
+
+    def __init__(self, get_adapter, chain_interface, threshold=16, check_interval=10.0):
+        self.get_adapter = get_adapter
+        self.chain_interface = chain_interface
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.pending = []
+        self.check_time = 0
+        self.polls = 0
+
+
+    def check(self, force=False):
+        """Look up the pending transactions in the queue, unless done less than check_interval seconds ago.
+
+        :param force: Look up regardless of when last done
+        :type force: bool
+        :rtype: bool
+        :returns: True if receipts should be polled instead of scanning blocks
+        """
+        if self.threshold == 0:
+            return False
+        now = time.monotonic()
+        if force or now - self.check_time >= self.check_interval:
+            self.check_time = now
+            adapter = self.get_adapter()
+            self.pending = list(adapter.active().keys())
+            logg.debug('receipt poller has {} pending txs'.format(len(self.pending)))
+        return len(self.pending) <= self.threshold
+
+
+    def receipts(self, conn):
+        o = []
+        for tx_hash in self.pending:
+            o.append(self.chain_interface.tx_receipt(add_0x(tx_hash)))
+        if len(o) == 0:
+            return []
+        if len(o) > 1 and getattr(conn, 'do_batch', None) != None:
+            r = conn.do_batch(o)
+            for v in r:
+                if isinstance(v, Exception):
+                    raise v
+            return r
+        return [conn.do(v) for v in o]
+
+
+    def poll(self, conn):
+        """Retrieve the receipts of the pending transactions.
+
+        :param conn: RPC connection
+        :type conn: chainlib.connection.RPCConnection
+        :rtype: list
+        :returns: Block and transaction object, with receipt applied, for every pending transaction that has been mined
+        """
+        self.check(force=True)
+        self.polls += 1
+        blocks = {}
+        r = []
+        for rcpt in self.receipts(conn):
+            if rcpt == None:
+                continue
+            block_hash = strip_0x(rcpt['blockHash'])
+            block = blocks.get(block_hash)
+            if block == None:
+                o = block_by_hash(add_0x(block_hash))
+                block = self.chain_interface.block_from_src(conn.do(o))
+                blocks[block_hash] = block
+            tx = block.tx(hex_to_int(rcpt['transactionIndex']), dialect_filter=self.chain_interface.dialect_filter)
+            tx.apply_receipt(self.chain_interface.src_normalize(rcpt), dialect_filter=self.chain_interface.dialect_filter)
+            r.append((block, tx,))
+        logg.info('receipt poll {} found {} of {} pending txs mined'.format(self.polls, len(r), len(self.pending)))
+        return r
@@ -0,0 +1,172 @@
+# standard imports
+import os
+import logging
+
+# external imports
+from shep.store.file import (
+        SimpleFileStore,
+        SimpleFileStoreFactory,
+        )
+from chainqueue.store.fs import (
+        IndexStore,
+        CounterStore,
+        )
+
+logg = logging.getLogger(__name__)
+
+
+class SyncSet:
+    """Files and directories written to since the last sync.
+
+    Files are synced before directories, so that new directory entries never point to unsynced contents.
+    """
+
+    def __init__(self):
+        self.files = set()
+        self.dirs = set()
+        self.syncs = 0
+
+
+    def add_file(self, path):
+        self.files.add(path)
+        self.dirs.add(os.path.dirname(path))
+
+
+    def add_dir(self, path):
+        self.dirs.add(path)
+
+
+    def __fsync(self, path, flags):
+        try:
+            fd = os.open(path, flags)
+        except FileNotFoundError:
+            # moved or removed since; its new location is tracked separately
+            return False
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return True
+
+
+    def sync(self):
+        """Sync all tracked files and directories to disk, and stop tracking them.
+
+        :rtype: int
+        :returns: Number of files and directories synced
+        """
+        c = 0
+        for fp in self.files:
+            if self.__fsync(fp, os.O_RDONLY):
+                c += 1
+        for fp in self.dirs:
+            if self.__fsync(fp, os.O_RDONLY | os.O_DIRECTORY):
+                c += 1
+        self.files.clear()
+        self.dirs.clear()
+        self.syncs += c
+        return c
+
+
+    def __len__(self):
+        return len(self.files) + len(self.dirs)
+
+
+class SyncFileStore(SimpleFileStore):
+    """shep.store.file.SimpleFileStore which records the paths it writes to in a chaind.eth.store.fs.SyncSet.
+    """
+
+    def __init__(self, path, binary=False, lock_path=None, sync_set=None):
+        super(SyncFileStore, self).__init__(path, binary=binary, lock_path=lock_path)
+        self.sync_set = sync_set
+
+
+    def put(self, k, contents=None):
+        super(SyncFileStore, self).put(k, contents=contents)
+        self.sync_set.add_file(self.path(k))
+
+
+    def remove(self, k):
+        super(SyncFileStore, self).remove(k)
+        self.sync_set.add_dir(self.path())
+
+
+    def replace(self, k, contents):
+        super(SyncFileStore, self).replace(k, contents)
+        self.sync_set.add_file(self.path(k))
+
+
+class SyncFileStoreFactory(SimpleFileStoreFactory):
+    """Creates chaind.eth.store.fs.SyncFileStore instances sharing a single chaind.eth.store.fs.SyncSet.
+
+    :param sync_set: Set of paths to record writes in
+    :type sync_set: chaind.eth.store.fs.SyncSet
+    """
+
+    def __init__(self, path, binary=False, use_lock=False, sync_set=None):
+        super(SyncFileStoreFactory, self).__init__(path, binary=binary, use_lock=use_lock)
+        self.path = path
+        self.binary = binary
+        self.use_lock = use_lock
+        self.sync_set = sync_set
+
+
+    def add(self, k):
+        lock_path = None
+        if self.use_lock:
+            lock_path = os.path.join(self.path, '.lock')
+        store_path = os.path.join(self.path, str(k))
+        return SyncFileStore(store_path, binary=self.binary, lock_path=lock_path, sync_set=self.sync_set)
+
+
+class SyncIndexStore(IndexStore):
+    """chainqueue.store.fs.IndexStore which records the paths it writes to in a chaind.eth.store.fs.SyncSet.
+    """
+
+    def __init__(self, root_path, digest_bytes=32, sync_set=None):
+        super(SyncIndexStore, self).__init__(root_path, digest_bytes=digest_bytes)
+        self.sync_set = sync_set
+
+
+    def put(self, k, v):
+        super(SyncIndexStore, self).put(k, v)
+        fp = self.store.to_filepath(k)
+        self.sync_set.add_file(fp)
+        self.sync_set.add_file(self.store.master_file)
+        # the entry may have created new levels of directories
+        d = os.path.dirname(fp)
+        while d != self.store.path and len(d) > len(self.store.path):
+            d = os.path.dirname(d)
+            self.sync_set.add_dir(d)
+
+
+class SyncCounterStore(CounterStore):
+    """chainqueue.store.fs.CounterStore which only writes the counter to disk on sync.
+
+    :param sync_set: Set of paths to record the counter file in
+    :type sync_set: chaind.eth.store.fs.SyncSet
+    """
+
+    def __init__(self, root_path, sync_set=None):
+        super(SyncCounterStore, self).__init__(root_path)
+        self.path = os.path.join(root_path, '.counter')
+        self.sync_set = sync_set
+        self.synced = self.count
+
+
+    def next(self):
+        c = self.count
+        self.count += 1
+        return c
+
+
+    def sync(self):
+        """Write the counter, if it changed since the last sync.
+        """
+        if self.count == self.synced:
+            return
+        self.f.write(self.count.to_bytes(8, 'big'))
+        self.f.seek(0)
+        self.f.flush()
+        self.synced = self.count
+        self.sync_set.add_file(self.path)
@@ -0,0 +1,657 @@
+# standard imports
+import os
+import mmap
+import fcntl
+import logging
+import datetime
+import threading
+
+# external imports
+from shep.store.base import StoreFactory
+
+logg = logging.getLogger(__name__)
+
+LOG_OP_PUT = 1
+LOG_OP_REMOVE = 2
+# no records follow in the segment, appends continue in the next one
+LOG_OP_SEAL = 3
+
+CHECKPOINT_MAGIC = b'chaindl\x01'
+
+_factories = {}
+_factories_pid = None
+_factories_lock = threading.Lock()
+
+
+def log_record(op, ns, k, v=b'', ts=0.0):
+    ns = ns.encode('utf-8')
+    k = k.encode('utf-8')
+    ts = int(ts * 1000000)
+    b = op.to_bytes(1, byteorder='big')
+    b += ts.to_bytes(8, byteorder='big')
+    b += len(ns).to_bytes(2, byteorder='big') + ns
+    b += len(k).to_bytes(2, byteorder='big') + k
+    b += len(v).to_bytes(4, byteorder='big') + v
+    return len(b).to_bytes(4, byteorder='big') + b
+
+
+def log_value_offset(ns, k):
+    """Offset of the contents in a record written by log_record.
+
+    :param ns: State name
+    :type ns: str
+    :param k: Content key
+    :type k: str
+    :rtype: int
+    :returns: Offset from the start of the record
+    """
+    return 21 + len(ns.encode('utf-8')) + len(k.encode('utf-8'))
+
+
+class LogStore:
+    """Store of contents for a single state, in an append-only log shared by all states.
+
+    Implements the same interface as shep.store.file.SimpleFileStore.
+
+    :param ns: State name
+    :type ns: str
+    :param factory: Log factory
+    :type factory: chaind.eth.store.log.LogStoreFactory
+    :param binary: If set, contents are returned as bytes, otherwise as str
+    :type binary: bool
+    """
+
+    def __init__(self, ns, factory, binary=False):
+        self.ns = ns
+        self.factory = factory
+        self.binary = binary
+
+
+    def __to_contents(self, v):
+        if v == None:
+            return b''
+        if isinstance(v, str):
+            return v.encode('utf-8')
+        return bytes(v)
+
+
+    def __to_result(self, v):
+        if self.binary:
+            return bytes(v)
+        return str(v, 'utf-8')
+
+
+    def put(self, k, contents=None):
+        self.factory.append(LOG_OP_PUT, self.ns, k, self.__to_contents(contents))
+
+
+    def remove(self, k):
+        self.view(k)
+        self.factory.append(LOG_OP_REMOVE, self.ns, k)
+
+
+    def view(self, k):
+        """Retrieve contents as a slice of the memory mapped log, without copying.
+
+        :param k: Content key
+        :type k: str
+        :raises FileNotFoundError: Content key does not exist for the state
+        :rtype: memoryview
+        :returns: Contents
+        """
+        return self.factory.view(self.ns, k)
+
+
+    def get(self, k):
+        return self.__to_result(self.view(k))
+
+
+    def list(self):
+        r = []
+        for (k, v) in self.factory.items(self.ns):
+            if len(v) == 0:
+                v = None
+            else:
+                v = self.__to_result(v)
+            r.append((k, v,))
+        return r
+
+
+    def path(self, k=None):
+        return None
+
+
+    def replace(self, k, contents):
+        self.view(k)
+        self.put(k, contents)
+
+
+    def modified(self, k):
+        return self.factory.modified(self.ns, k)
+
+
+    def register_modify(self, k):
+        pass
+
+
+class LogStoreFactory(StoreFactory):
+    """Provides state stores backed by a segmented, append-only log of puts and removes, read back through mmap.
+
+    Every state change is a single append to the current segment. The position of the latest contents of every key is kept in memory. Records appended by this factory are indexed as they are written. Records appended by other processes are indexed when they are found before an append of this factory, or when catch_up is called. A factory is meant to live as long as the process, see chaind.eth.store.log.shared_factory.
+
+    Appends are serialized between processes with an exclusive lock on the current segment, and between threads with a lock on the factory. The current segment stays open for appends. A segment is closed for appends with a seal record when it is full.
+
+    The index is saved to a checkpoint file in the log directory every checkpoint_interval records, and on close. A new factory loads the checkpoint and only scans the records appended after it.
+
+    Segments are compacted on commit, at most once every checkpoint_interval records. Starting from the oldest closed segment, the current contents of every key in a segment whose current contents take up less than compact_ratio of it are appended again, with their original modification time. The oldest closed segments which then hold no current contents are removed. A factory which finds that the segment it reads from has been removed drops the index entries into removed segments, whose records have all been superseded, and goes on with the oldest remaining segment.
+
+    :param path: Log directory
+    :type path: str
+    :param binary: If set, contents are returned as bytes, otherwise as str
+    :type binary: bool
+    :param segment_size: Size at which a new segment is started, in bytes
+    :type segment_size: int
+    :param checkpoint_interval: Number of records after which the index is saved to the checkpoint
+    :type checkpoint_interval: int
+    :param compact_ratio: Share of a closed segment below which its current contents are appended again, 0 to disable compaction
+    :type compact_ratio: float
+    """
+
+    def __init__(self, path, binary=False, segment_size=67108864, checkpoint_interval=65536, compact_ratio=0.5):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.binary = binary
+        self.segment_size = segment_size
+        self.checkpoint_interval = checkpoint_interval
+        self.compact_ratio = compact_ratio
+        self.compact_records = 0
+        self.checkpoint_path = os.path.join(self.path, 'checkpoint')
+        self.lock = threading.RLock()
+        self.index = {}
+        self.segments = []
+        self.maps = []
+        self.segment = 0
+        self.cursor = 0
+        self.records = 0
+        self.fd = None
+        self.dirty = False
+        self.created = False
+        self.__load_checkpoint()
+        self.catch_up()
+
+
+    def __segment_path(self, i):
+        return os.path.join(self.path, '{:08d}.log'.format(i))
+
+
+    def __segment_numbers(self):
+        r = []
+        for v in os.listdir(self.path):
+            if v[-4:] != '.log':
+                continue
+            try:
+                r.append(int(v[:-4]))
+            except ValueError:
+                continue
+        r.sort()
+        return r
+
+
+    def __trim(self):
+        """Drop what refers to segments removed by compaction, and move on to the oldest remaining segment if the current one was removed.
+
+        :rtype: bool
+        :returns: True if the current segment was moved
+        """
+        segments = self.__segment_numbers()
+        if len(segments) == 0:
+            return False
+        first = segments[0]
+        for keys in self.index.values():
+            for k in [k for (k, v) in keys.items() if v[0] < first]:
+                del keys[k]
+        for i in range(min(first, len(self.maps))):
+            self.__unmap(i)
+        if self.segment >= first:
+            return False
+        logg.info('log segments before {} were removed, skipping ahead from segment {}'.format(first, self.segment))
+        if self.fd != None:
+            os.close(self.fd)
+            self.fd = None
+            self.dirty = False
+        self.segment = first
+        self.cursor = 0
+        return True
+
+
+    def __map(self, i):
+        while len(self.maps) <= i:
+            self.maps.append(None)
+            self.segments.append(0)
+        fp = self.__segment_path(i)
+        f = open(fp, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        m = None
+        if size > 0:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        self.maps[i] = m
+        self.segments[i] = size
+        return size
+
+
+    def __unmap(self, i):
+        # the map may still be referenced by views handed out
+        self.maps[i] = None
+        self.segments[i] = 0
+
+
+    def __mapped(self, i, end):
+        if i >= len(self.maps) or self.segments[i] < end:
+            self.__map(i)
+        return self.maps[i]
+
+
+    def __index(self, op, ns, k, i, o, l, ts):
+        if self.index.get(ns) == None:
+            self.index[ns] = {}
+        if op == LOG_OP_PUT:
+            self.index[ns][k] = (i, o, l, ts,)
+        elif op == LOG_OP_REMOVE:
+            try:
+                del self.index[ns][k]
+            except KeyError:
+                pass
+        self.records += 1
+
+
+    def __scan(self, end):
+        i = self.segment
+        m = self.__mapped(i, end)
+        end = self.segments[i]
+        c = self.cursor
+        sealed = False
+        while c + 4 <= end:
+            l = int.from_bytes(m[c:c+4], byteorder='big')
+            if c + 4 + l > end:
+                break
+            o = c + 4
+            op = m[o]
+            if op == LOG_OP_SEAL:
+                sealed = True
+                c += 4 + l
+                break
+            ts = int.from_bytes(m[o+1:o+9], byteorder='big') / 1000000
+            o += 9
+            l_ns = int.from_bytes(m[o:o+2], byteorder='big')
+            ns = str(m[o+2:o+2+l_ns], 'utf-8')
+            o += 2 + l_ns
+            l_k = int.from_bytes(m[o:o+2], byteorder='big')
+            k = str(m[o+2:o+2+l_k], 'utf-8')
+            o += 2 + l_k
+            l_v = int.from_bytes(m[o:o+4], byteorder='big')
+            o += 4
+            self.__index(op, ns, k, i, o, l_v, ts)
+            c += 4 + l
+        self.cursor = c
+        return sealed
+
+
+    def __next_segment(self):
+        if self.fd != None:
+            if self.dirty:
+                os.fsync(self.fd)
+                self.dirty = False
+            os.close(self.fd)
+            self.fd = None
+        self.segment += 1
+        self.cursor = 0
+
+
+    def catch_up(self):
+        """Index records appended by other processes since the last call.
+        """
+        with self.lock:
+            while True:
+                try:
+                    size = os.stat(self.__segment_path(self.segment)).st_size
+                except FileNotFoundError:
+                    if self.__trim():
+                        continue
+                    break
+                sealed = False
+                if size > self.cursor:
+                    try:
+                        sealed = self.__scan(size)
+                    except FileNotFoundError:
+                        continue
+                if not sealed and not os.path.exists(self.__segment_path(self.segment + 1)):
+                    break
+                self.__next_segment()
+            if self.records >= self.checkpoint_interval:
+                self.checkpoint()
+
+
+    def __append(self, b, check=None):
+        """Append a record to the current segment, with the segment locked.
+
+        :param check: Called after the records of other processes have been indexed, the record is not appended unless it returns True
+        :type check: function
+        :rtype: int
+        :returns: Offset of the record, -1 if check failed, or None if the segment is closed for appends
+        """
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self.fd).st_size
+            if size > self.cursor:
+                try:
+                    if self.__scan(size):
+                        return None
+                except FileNotFoundError:
+                    # closed and removed by compaction
+                    return None
+            if check != None and not check():
+                return -1
+            if size > 0 and size + len(b) > self.segment_size:
+                os.write(self.fd, log_record(LOG_OP_SEAL, '', ''))
+                self.cursor = os.fstat(self.fd).st_size
+                self.dirty = True
+                return None
+            os.write(self.fd, b)
+            self.cursor = size + len(b)
+            self.dirty = True
+            return size
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+    def __write(self, op, ns, k, v, ts, check=None):
+        b = log_record(op, ns, k, v, ts=ts)
+        with self.lock:
+            while True:
+                if self.fd == None:
+                    fp = self.__segment_path(self.segment)
+                    if not os.path.exists(fp):
+                        if self.__trim():
+                            continue
+                        self.created = True
+                    self.fd = os.open(fp, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                c = self.__append(b, check=check)
+                if c == -1:
+                    return False
+                if c != None:
+                    break
+                self.__next_segment()
+            self.__index(op, ns, k, self.segment, c + log_value_offset(ns, k), len(v), int(ts * 1000000) / 1000000)
+            self.compact_records += 1
+        return True
+
+
+    def append(self, op, ns, k, v=b''):
+        self.__write(op, ns, k, v, datetime.datetime.utcnow().timestamp())
+
+
+    def __removed(self):
+        # the contents were superseded in a segment not yet scanned, and the segment was removed by compaction in another process
+        self.__trim()
+        self.catch_up()
+
+
+    def view(self, ns, k):
+        with self.lock:
+            try:
+                (i, o, l, ts) = self.index[ns][k]
+            except KeyError:
+                raise FileNotFoundError(k)
+            try:
+                m = self.__mapped(i, o + l)
+            except FileNotFoundError:
+                self.__removed()
+                return self.view(ns, k)
+            return memoryview(m)[o:o+l]
+
+
+    def items(self, ns):
+        r = []
+        with self.lock:
+            for (k, (i, o, l, ts)) in self.index.get(ns, {}).items():
+                try:
+                    m = self.__mapped(i, o + l)
+                except FileNotFoundError:
+                    self.__removed()
+                    return self.items(ns)
+                r.append((k, memoryview(m)[o:o+l],))
+        return r
+
+
+    def modified(self, ns, k):
+        with self.lock:
+            try:
+                return self.index[ns][k][3]
+            except KeyError:
+                raise FileNotFoundError(k)
+
+
+    def commit(self):
+        """Sync the records appended since the last commit to disk.
+
+        Segments filled since the last commit were synced when they were closed for appends. If segments were created, the log directory is synced too.
+        """
+        with self.lock:
+            if self.fd != None and self.dirty:
+                os.fsync(self.fd)
+                self.dirty = False
+            if self.created:
+                fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self.created = False
+            if self.compact_ratio > 0 and self.compact_records >= self.checkpoint_interval:
+                self.compact()
+            if self.records >= self.checkpoint_interval:
+                self.checkpoint()
+
+
+    def compact(self):
+        """Append the current contents of sparse closed segments again, and remove the oldest closed segments which hold no current contents.
+
+        :rtype: int
+        :returns: Number of segments removed
+        """
+        with self.lock:
+            self.compact_records = 0
+            self.catch_up()
+            live = {}
+            for (ns, keys) in self.index.items():
+                for (k, (i, o, l, ts)) in keys.items():
+                    live[i] = live.get(i, 0) + log_value_offset(ns, k) + l
+            c = 0
+            for i in sorted(live.keys()):
+                if i >= self.segment:
+                    break
+                try:
+                    size = os.stat(self.__segment_path(i)).st_size
+                except FileNotFoundError:
+                    continue
+                if live[i] >= size * self.compact_ratio:
+                    break
+                c += self.__relocate(i)
+
+            first = self.segment
+            for keys in self.index.values():
+                for v in keys.values():
+                    first = min(first, v[0])
+            removed = [i for i in self.__segment_numbers() if i < first]
+            if len(removed) == 0:
+                return 0
+
+            # the records appended again must be on disk before the originals are gone
+            if self.fd != None and self.dirty:
+                os.fsync(self.fd)
+                self.dirty = False
+            self.checkpoint()
+            for i in removed:
+                os.unlink(self.__segment_path(i))
+                if i < len(self.maps):
+                    self.__unmap(i)
+            fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            logg.info('log compaction appended {} records again and removed {} segments before {}'.format(c, len(removed), first))
+            return len(removed)
+
+
+    def __relocate(self, i):
+        c = 0
+        for (ns, keys) in list(self.index.items()):
+            for (k, v) in list(keys.items()):
+                if v[0] != i:
+                    continue
+                (o, l, ts) = v[1:]
+                contents = bytes(self.__mapped(i, o + l)[o:o+l])
+                # skip if another process changed the key before the lock on the segment was taken
+                if self.__write(LOG_OP_PUT, ns, k, contents, ts, check=lambda: self.index.get(ns, {}).get(k) == v):
+                    c += 1
+        return c
+
+
+    def checkpoint(self):
+        """Save the index of the records scanned so far to the checkpoint file.
+        """
+        with self.lock:
+            b = CHECKPOINT_MAGIC
+            b += self.segment.to_bytes(4, byteorder='big')
+            b += self.cursor.to_bytes(8, byteorder='big')
+            b += len(self.index).to_bytes(4, byteorder='big')
+            for (ns, keys) in self.index.items():
+                v = ns.encode('utf-8')
+                b += len(v).to_bytes(2, byteorder='big') + v
+                b += len(keys).to_bytes(4, byteorder='big')
+                for (k, (i, o, l, ts)) in keys.items():
+                    v = k.encode('utf-8')
+                    b += len(v).to_bytes(2, byteorder='big') + v
+                    b += i.to_bytes(4, byteorder='big')
+                    b += o.to_bytes(8, byteorder='big')
+                    b += l.to_bytes(4, byteorder='big')
+                    b += int(ts * 1000000).to_bytes(8, byteorder='big')
+            self.records = 0
+
+        tmp_path = '{}.{}.tmp'.format(self.checkpoint_path, os.getpid())
+        f = open(tmp_path, 'wb')
+        f.write(b)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(tmp_path, self.checkpoint_path)
+        logg.debug('log index checkpoint at segment {} offset {}'.format(self.segment, self.cursor))
+
+
+    def __load_checkpoint(self):
+        try:
+            f = open(self.checkpoint_path, 'rb')
+        except FileNotFoundError:
+            return
+        v = f.read()
+        f.close()
+
+        try:
+            (segment, cursor, index) = self.__read_checkpoint(v)
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            logg.warning('ignoring log index checkpoint: {}'.format(e))
+            return
+        try:
+            size = os.stat(self.__segment_path(segment)).st_size
+        except FileNotFoundError:
+            size = -1
+        if size < cursor:
+            logg.warning('ignoring log index checkpoint beyond end of log')
+            return
+        self.segment = segment
+        self.cursor = cursor
+        self.index = index
+
+
+    def __read_checkpoint(self, v):
+        if v[:len(CHECKPOINT_MAGIC)] != CHECKPOINT_MAGIC:
+            raise ValueError('not a log index checkpoint')
+        c = len(CHECKPOINT_MAGIC)
+        segment = int.from_bytes(v[c:c+4], byteorder='big')
+        cursor = int.from_bytes(v[c+4:c+12], byteorder='big')
+        l = int.from_bytes(v[c+12:c+16], byteorder='big')
+        c += 16
+        index = {}
+        for j in range(l):
+            l_ns = int.from_bytes(v[c:c+2], byteorder='big')
+            ns = str(v[c+2:c+2+l_ns], 'utf-8')
+            c += 2 + l_ns
+            n = int.from_bytes(v[c:c+4], byteorder='big')
+            c += 4
+            keys = {}
+            for jj in range(n):
+                l_k = int.from_bytes(v[c:c+2], byteorder='big')
+                k = str(v[c+2:c+2+l_k], 'utf-8')
+                c += 2 + l_k
+                i = int.from_bytes(v[c:c+4], byteorder='big')
+                o = int.from_bytes(v[c+4:c+12], byteorder='big')
+                ll = int.from_bytes(v[c+12:c+16], byteorder='big')
+                ts = int.from_bytes(v[c+16:c+24], byteorder='big') / 1000000
+                c += 24
+                keys[k] = (i, o, ll, ts,)
+            index[ns] = keys
+        if c != len(v):
+            raise ValueError('log index checkpoint truncated')
+        return (segment, cursor, index,)
+
+
+    def add(self, k):
+        return LogStore(str(k), self, binary=self.binary)
+
+
+    def ls(self):
+        with self.lock:
+            return list(self.index.keys())
+
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            if self.records > 0:
+                self.checkpoint()
+            if self.fd != None:
+                os.close(self.fd)
+                self.fd = None
+
+
+def shared_factory(path, binary=False, segment_size=67108864):
+    """Get a log factory for the given log directory, which is shared by all callers in the process with the same options.
+
+    A shared factory catches up with the records appended by other processes when it is handed out again.
+
+    Factories are not shared across a fork; a child process opens its own.
+
+    :param path: Log directory
+    :type path: str
+    :param binary: If set, contents are returned as bytes, otherwise as str
+    :type binary: bool
+    :param segment_size: Size at which a new segment is started, in bytes
+    :type segment_size: int
+    :rtype: chaind.eth.store.log.LogStoreFactory
+    :returns: Log factory
+    """
+    global _factories_pid
+    k = (os.path.realpath(path), binary, segment_size,)
+    with _factories_lock:
+        if _factories_pid != os.getpid():
+            _factories.clear()
+            _factories_pid = os.getpid()
+        factory = _factories.get(k)
+        if factory == None:
+            factory = LogStoreFactory(path, binary=binary, segment_size=segment_size)
+            _factories[k] = factory
+            return factory
+    factory.catch_up()
+    return factory
@@ -0,0 +1,369 @@
+# standard imports
+import os
+import logging
+import datetime
+import threading
+import sqlite3
+
+# external imports
+from shep.store.base import StoreFactory
+from chainqueue.error import (
+        DuplicateTxError,
+        NotLocalTxError,
+        )
+from chainsyncer.store import SyncStore
+
+logg = logging.getLogger(__name__)
+
+_factories = {}
+_factories_pid = None
+_factories_lock = threading.Lock()
+
+
+class SqliteStore:
+    """Store of contents for a single state, in the state table of a SQLite database.
+
+    Implements the same interface as shep.store.file.SimpleFileStore.
+
+    :param ns: State name
+    :type ns: str
+    :param factory: Database factory
+    :type factory: chaind.eth.store.sqlite.SqliteStoreFactory
+    :param binary: If set, contents are returned as bytes, otherwise as str
+    :type binary: bool
+    """
+
+    def __init__(self, ns, factory, binary=False):
+        self.ns = ns
+        self.factory = factory
+        self.binary = binary
+
+
+    def __to_contents(self, v):
+        if v == None:
+            return b''
+        if isinstance(v, str):
+            return v.encode('utf-8')
+        return v
+
+
+    def __to_result(self, v):
+        if self.binary:
+            return v
+        return v.decode('utf-8')
+
+
+    def put(self, k, contents=None):
+        self.factory.write('INSERT OR REPLACE INTO state (ns, k, v, modified) VALUES (?, ?, ?, ?)', (self.ns, k, self.__to_contents(contents), datetime.datetime.utcnow().timestamp(),))
+
+
+    def remove(self, k):
+        c = self.factory.write('DELETE FROM state WHERE ns = ? AND k = ?', (self.ns, k,))
+        if c == 0:
+            raise FileNotFoundError(k)
+
+
+    def get(self, k):
+        r = self.factory.read('SELECT v FROM state WHERE ns = ? AND k = ?', (self.ns, k,))
+        if len(r) == 0:
+            raise FileNotFoundError(k)
+        return self.__to_result(r[0][0])
+
+
+    def list(self):
+        r = []
+        for (k, v) in self.factory.read('SELECT k, v FROM state WHERE ns = ?', (self.ns,)):
+            if len(v) == 0:
+                v = None
+            else:
+                v = self.__to_result(v)
+            r.append((k, v,))
+        return r
+
+
+    def path(self, k=None):
+        return None
+
+
+    def replace(self, k, contents):
+        c = self.factory.write('UPDATE state SET v = ?, modified = ? WHERE ns = ? AND k = ?', (self.__to_contents(contents), datetime.datetime.utcnow().timestamp(), self.ns, k,))
+        if c == 0:
+            raise FileNotFoundError(k)
+
+
+    def modified(self, k):
+        r = self.factory.read('SELECT modified FROM state WHERE ns = ? AND k = ?', (self.ns, k,))
+        if len(r) == 0:
+            raise FileNotFoundError(k)
+        return r[0][0]
+
+
+    def register_modify(self, k):
+        pass
+
+
+class SqliteStoreFactory(StoreFactory):
+    """Provides state stores, transaction hash index and counter backed by a single SQLite database file.
+
+    The database is opened in write-ahead log mode, so that a queuer and a syncer process may share it.
+
+    If deferred is set, writes are collected in a transaction which is only committed, with a single sync, when commit is called. Otherwise, every write is committed immediately.
+
+    :param path: Database file path
+    :type path: str
+    :param binary: If set, state contents are returned as bytes, otherwise as str
+    :type binary: bool
+    :param deferred: If set, writes are only committed by calling commit
+    :type deferred: bool
+    :param timeout: Seconds to wait for a lock held by another connection
+    :type timeout: float
+    """
+
+    def __init__(self, path, binary=False, deferred=False, timeout=30.0):
+        d = os.path.dirname(path)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.binary = binary
+        self.deferred = deferred
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS state (ns TEXT NOT NULL, k TEXT NOT NULL, v BLOB, modified REAL, PRIMARY KEY (ns, k))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS tx_index (hash TEXT PRIMARY KEY, k TEXT NOT NULL, sender TEXT, nonce INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS tx_index_sender ON tx_index (sender, nonce)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS counter (k TEXT PRIMARY KEY, v INTEGER NOT NULL)')
+
+
+    def write(self, sql, args=()):
+        with self.lock:
+            if self.deferred and not self.db.in_transaction:
+                self.db.execute('BEGIN IMMEDIATE')
+            c = self.db.execute(sql, args)
+            return c.rowcount
+
+
+    def read(self, sql, args=()):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+
+    def commit(self):
+        with self.lock:
+            if self.db.in_transaction:
+                self.db.execute('COMMIT')
+
+
+    def add(self, k):
+        return SqliteStore(str(k), self, binary=self.binary)
+
+
+    def ls(self):
+        r = []
+        for (k,) in self.read('SELECT DISTINCT ns FROM state'):
+            r.append(k)
+        return r
+
+
+    def close(self):
+        if self.db == None:
+            return
+        self.commit()
+        self.db.close()
+        self.db = None
+
+
+def shared_factory(path, binary=False, deferred=False):
+    """Get a database factory for the given database file, which is shared by all callers in the process.
+
+    There is only one connection to a database file in a process, so that threads of the process never wait for each other on the database write lock.
+
+    If any caller asks for deferred writes, writes of all callers are deferred from then on. Callers which need their writes to be committed right away must call commit.
+
+    Connections are not shared across a fork; a child process opens its own.
+
+    :param path: Database file path
+    :type path: str
+    :param binary: If set, state contents are returned as bytes, otherwise as str
+    :type binary: bool
+    :param deferred: If set, writes are only committed by calling commit
+    :type deferred: bool
+    :rtype: chaind.eth.store.sqlite.SqliteStoreFactory
+    :returns: Database factory
+    """
+    global _factories_pid
+    k = (os.path.realpath(path), binary,)
+    with _factories_lock:
+        if _factories_pid != os.getpid():
+            _factories.clear()
+            _factories_pid = os.getpid()
+        factory = _factories.get(k)
+        if factory == None or factory.db == None:
+            factory = SqliteStoreFactory(path, binary=binary, deferred=deferred)
+            _factories[k] = factory
+        elif deferred:
+            factory.deferred = True
+    return factory
+
+
+class SqliteStoreAdder:
+    """Provides state stores from a factory with their state names prefixed, so that several state sets can share a database.
+
+    :param factory: Database factory
+    :type factory: chaind.eth.store.sqlite.SqliteStoreFactory
+    :param prefix: State name prefix
+    :type prefix: str
+    """
+
+    def __init__(self, factory, prefix):
+        self.factory = factory
+        self.prefix = prefix
+
+
+    def add(self, k):
+        return self.factory.add(self.prefix + '.' + str(k))
+
+
+    def ls(self):
+        r = []
+        l = len(self.prefix) + 1
+        for k in self.factory.ls():
+            if k[:l] == self.prefix + '.':
+                r.append(k[l:])
+        return r
+
+
+class SqliteIndexStore:
+    """Transaction hash index backed by a SQLite database, with the same interface as chainqueue.store.fs.IndexStore.
+
+    Sender and nonce may be recorded for each transaction, and are indexed for lookup.
+
+    :param factory: Database factory
+    :type factory: chaind.eth.store.sqlite.SqliteStoreFactory
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+
+    def put(self, k, v):
+        try:
+            self.factory.write('INSERT INTO tx_index (hash, k) VALUES (?, ?)', (k, v,))
+        except sqlite3.IntegrityError:
+            raise DuplicateTxError(k)
+
+
+    def get(self, k):
+        r = self.factory.read('SELECT k FROM tx_index WHERE hash = ?', (k,))
+        if len(r) == 0:
+            raise NotLocalTxError(k)
+        return r[0][0]
+
+
+    def set_sender(self, k, sender, nonce):
+        self.factory.write('UPDATE tx_index SET sender = ?, nonce = ? WHERE hash = ?', (sender, nonce, k,))
+
+
+    def by_sender(self, sender):
+        """List transactions of a sender.
+
+        :param sender: Sender address
+        :type sender: str
+        :rtype: list
+        :returns: Nonce and transaction hash of each transaction, in nonce order
+        """
+        return self.factory.read('SELECT nonce, hash FROM tx_index WHERE sender = ? ORDER BY nonce', (sender,))
+
+
+    def hashes(self):
+        for (k,) in self.factory.read('SELECT hash FROM tx_index'):
+            yield k
+
+
+    def load_since(self, cursor):
+        """Load the hashes added to the index after the given cursor.
+
+        The signature matches the loaders of chaind.eth.track.TxTracker.
+
+        :param cursor: Row id to load hashes after
+        :type cursor: int
+        :rtype: tuple
+        :returns: Hashes, as bytes, and the next cursor
+        """
+        r = []
+        for (i, k) in self.factory.read('SELECT rowid, hash FROM tx_index WHERE rowid > ? ORDER BY rowid', (cursor,)):
+            r.append(bytes.fromhex(k))
+            cursor = i
+        return (r, cursor,)
+
+
+class SqliteCounterStore:
+    """Counter backed by a SQLite database, with the same interface as chainqueue.store.fs.CounterStore.
+
+    :param factory: Database factory
+    :type factory: chaind.eth.store.sqlite.SqliteStoreFactory
+    :param k: Counter name
+    :type k: str
+    """
+
+    def __init__(self, factory, k='tx'):
+        self.factory = factory
+        self.k = k
+        r = self.factory.read('SELECT v FROM counter WHERE k = ?', (k,))
+        if len(r) == 0:
+            self.count = 0
+        else:
+            self.count = r[0][0]
+        logg.debug('counter starts at {}'.format(self.count))
+
+
+    def next(self):
+        with self.factory.lock:
+            c = self.count
+            self.count += 1
+            self.factory.write('INSERT OR REPLACE INTO counter (k, v) VALUES (?, ?)', (self.k, self.count,))
+        return c
+
+
+class SyncSqliteStore(SyncStore):
+    """Syncer session store backed by a single SQLite database file in the session directory.
+
+    See chainsyncer.store.fs.SyncFsStore
+    """
+
+    def __init__(self, base_path, session_id=None, state_event_callback=None, filter_state_event_callback=None):
+        super(SyncSqliteStore, self).__init__(base_path, session_id=session_id)
+        os.makedirs(self.session_path, exist_ok=True)
+        self.session_id = os.path.basename(self.session_path)
+
+        self.factory = SqliteStoreFactory(os.path.join(self.session_path, 'sync.sqlite'), binary=True)
+        self.setup_sync_state(SqliteStoreAdder(self.factory, 'sync'), state_event_callback)
+        self.setup_filter_state(SqliteStoreAdder(self.factory, 'filter'), filter_state_event_callback)
+        self.target_db = SqliteStoreAdder(self.factory, '.stat').add('target')
+
+
+    def get_target(self):
+        try:
+            v = self.target_db.get('target')
+        except FileNotFoundError:
+            return
+        self.target = int(v)
+
+
+    def set_target(self, v):
+        self.target_db.put('target', str(v))
+        self.target = v
+
+
+    def save_filter_list(self):
+        fltr = []
+        for v in self.filters:
+            fltr.append(v.common_name())
+        self.target_db.put('filter_list', ','.join(fltr))
+
+
+    def load_filter_list(self):
+        v = self.target_db.get('filter_list')
+        v = v.decode('utf-8')
+        return v.split(',')
@@ -7,6 +7,23 @@ from hexathon import strip_0x
 
 logg = logging.getLogger(__name__)
 
+_sign_resolver = None
+
+
+def sign_init(resolver):
+    """Set the token resolver to sign with in a signing worker process.
+
+    :param resolver: Token resolver
+    :type resolver: chaind.eth.token.base.BaseTokenResolver
+    """
+    global _sign_resolver
+    _sign_resolver = resolver
+
+
+def sign_worker(tx):
+    return _sign_resolver.sign(tx)
+
+
 class BaseTokenResolver:
 
     def __init__(self, chain_spec, sender, signer, gas_oracle, nonce_oracle, advance_nonce=False):
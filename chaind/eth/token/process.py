@@ -1,5 +1,8 @@
 # standard imports
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # external imports
 from chaind.error import TxSourceError
@@ -15,17 +18,49 @@ from hexathon import (
         )
 from funga.eth.transaction import EIP155Transaction
 
+# local imports
+from chaind.eth.token.base import (
+        sign_init,
+        sign_worker,
+        )
+
 logg = logging.getLogger(__name__)
 
 
 class Processor:
-
-    def __init__(self, resolver, source, use_checksum=True):
+    """Creates and signs transactions from the records of a transaction source.
+
+    If sign_processes is greater than one, records are read in batches of sign_batch_size. The transactions of a batch are created in order, so nonces are assigned sequentially as before. They are then signed in a pool of worker processes, while the next batch is created. Signed transactions are returned in record order.
+
+    The worker processes sign with the resolver as it was when iteration started. The workers are always forked, since the keys of a signer usually cannot be pickled. On platforms without fork, only a single signing process can be used.
+
+    :param resolver: Token resolver
+    :type resolver: chaind.eth.token.base.BaseTokenResolver
+    :param source: Transaction source
+    :type source: str
+    :param use_checksum: Reject recipient addresses without a valid checksum
+    :type use_checksum: bool
+    :param sign_processes: Number of signing worker processes
+    :type sign_processes: int
+    :param sign_batch_size: Number of transactions per signing batch
+    :type sign_batch_size: int
+    :raises ValueError: More than one signing process on a platform without fork
+    """
+
+    def __init__(self, resolver, source, use_checksum=True, sign_processes=1, sign_batch_size=256):
         self.resolver = resolver
         self.source = source
         self.processor = []
         self.safe = use_checksum
         self.conn = None
+        self.sign_processes = sign_processes
+        self.sign_batch_size = sign_batch_size
+        self.sign_context = None
+        if self.sign_processes > 1:
+            try:
+                self.sign_context = multiprocessing.get_context('fork')
+            except ValueError:
+                raise ValueError('parallel signing needs the fork start method, which is not available on this platform; set sign processes to 1')
         
 
     def add_processor(self, processor):
@@ -33,15 +68,24 @@ class Processor:
 
 
     def load(self, conn, process=True):
+        """Open the transaction source.
+
+        Records are read, validated and signed one at a time during iteration, so invalid records are only reported when they are reached.
+
+        :param conn: RPC connection
+        :type conn: chainlib.connection.RPCConnection
+        :param process: Validate and normalize records
+        :type process: bool
+        :raises TxSourceError: Source could not be opened
+        :rtype: iterator
+        :returns: Line number and fields of each record
+        """
         self.conn = conn
         for processor in self.processor:
             self.content = processor.load(self.source)
         if self.content != None:
             if process:
-                try:
-                    self.process()
-                except Exception as e:
-                    raise TxSourceError('invalid source contents: {}'.format(str(e)))
+                self.content = self.process(self.content)
             return self.content
         raise TxSourceError('unparseable source')
        
@@ -50,40 +94,55 @@ class Processor:
     # 1: amount
     # 2: token identifier (optional, when not specified network gas token will be used)
     # 3: gas amount (optional)
-    def process(self):
-        txs = []
-        for i, r in enumerate(self.content):
+    def process(self, content):
+        for (i, r) in content:
             logg.debug('processing {}'.format(r))
-            address = r[0]
-            if self.safe:
-                if not is_checksum_address(address):
-                    raise ValueError('invalid checksum address {} in record {}'.format(address, i))
-            else:
-                address = to_checksum_address(address)
-
-            self.content[i][0] = add_0x(address)
             try:
-                self.content[i][1] = int(r[1])
-            except ValueError:
-                self.content[i][1] = int(strip_0x(r[1]), 16)
-            native_token_value = 0
+                yield (i, self.process_record(r),)
+            except (ValueError, IndexError) as e:
+                raise TxSourceError('invalid source contents on line {}: {}'.format(i, str(e)))
 
-            if len(self.content[i]) == 3:
-                self.content[i].append(native_token_value)
+
+    def process_record(self, r):
+        address = r[0]
+        if self.safe:
+            if not is_checksum_address(address):
+                raise ValueError('invalid checksum address {}'.format(address))
+        else:
+            address = to_checksum_address(address)
+
+        r[0] = add_0x(address)
+        try:
+            r[1] = int(r[1])
+        except ValueError:
+            r[1] = int(strip_0x(r[1]), 16)
+        native_token_value = 0
+
+        if len(r) == 3:
+            r.append(native_token_value)
+        return r
 
 
     def __iter__(self):
         self.resolver.reset()
         self.cursor = 0
+        if self.sign_processes > 1:
+            return self.__sign_parallel()
         return self
 
 
     def __next__(self): 
-        if self.cursor == len(self.content):
-            raise StopIteration()
+        (i, r) = next(self.content)
 
-        r = self.content[self.cursor]
+        tx = self.__create(r)
+        v =  self.resolver.sign(tx)
 
+        self.cursor += 1
+
+        return v
+
+
+    def __create(self, r):
         value = r[1]
         gas_value = 0
         try:
@@ -99,12 +158,42 @@ class Processor:
         except IndexError:
             pass
 
-        tx = self.resolver.create(self.conn, r[0], gas_value, data=data, token_value=value, executable_address=executable_address)
-        v =  self.resolver.sign(tx)
-
-        self.cursor += 1
-
-        return v
+        return self.resolver.create(self.conn, r[0], gas_value, data=data, token_value=value, executable_address=executable_address)
+
+
+    def __sign_parallel(self):
+        pending = deque()
+        err = None
+        with ProcessPoolExecutor(max_workers=self.sign_processes, mp_context=self.sign_context, initializer=sign_init, initargs=(self.resolver,)) as pool:
+            while err == None:
+                txs = []
+                while len(txs) < self.sign_batch_size:
+                    try:
+                        (i, r) = next(self.content)
+                    except StopIteration:
+                        break
+                    except TxSourceError as e:
+                        err = e
+                        break
+                    txs.append(self.__create(r))
+                if len(txs) == 0:
+                    break
+
+                chunksize = max(1, len(txs) // (self.sign_processes * 4))
+                logg.debug('signing {} txs with {} processes chunk size {}'.format(len(txs), self.sign_processes, chunksize))
+                pending.append(pool.map(sign_worker, txs, chunksize=chunksize))
+                while len(pending) > 1:
+                    for v in pending.popleft():
+                        self.cursor += 1
+                        yield v
+
+            while len(pending) > 0:
+                for v in pending.popleft():
+                    self.cursor += 1
+                    yield v
+
+        if err != None:
+            raise err
 
 
     def __str__(self):
@@ -0,0 +1,112 @@
+# standard imports
+import logging
+
+# external imports
+from hexathon import strip_0x
+
+logg = logging.getLogger(__name__)
+
+
+def load_index_file(path, cursor, digest_bytes=32):
+    """Load the hashes appended to the master file of a hash index directory after the given offset.
+
+    :param path: Path to master file
+    :type path: str
+    :param cursor: Byte offset to read from
+    :type cursor: int
+    :param digest_bytes: Hash length
+    :type digest_bytes: int
+    :rtype: tuple
+    :returns: Hashes, as bytes, and the next cursor
+    """
+    r = []
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return (r, cursor,)
+    f.seek(cursor)
+    while True:
+        v = f.read(digest_bytes)
+        if len(v) < digest_bytes:
+            break
+        r.append(v)
+        cursor += digest_bytes
+    f.close()
+    return (r, cursor,)
+
+
+class TxTracker:
+    """Prefilter of the block transactions the syncer filters act on.
+
+    A transaction is tracked if its hash is in the queue hash index, or if it is sent from one of the tracked sender addresses. Hashes added to the queue by other processes are picked up by refresh.
+
+    With a known hash index which does not keep an exact set, hashes which are possibly in the queue are also tracked.
+
+    :param index: Index to hold the queue transaction hashes
+    :type index: chaind.eth.index.KnownHashIndex
+    :param loader: Loader of hashes added to the queue after a cursor, such as chaind.eth.adapter.EthFsAdapter.load_since
+    :type loader: function
+    :param senders: Sender addresses to track
+    :type senders: list of str
+    """
+
+    def __init__(self, index, loader, senders=[]):
+        self.index = index
+        self.loader = loader
+        self.cursor = 0
+        self.senders = set()
+        for sender in senders:
+            self.add_sender(sender)
+        self.skipped = 0
+        self.tracked = 0
+
+
+    def add_sender(self, address):
+        self.senders.add(strip_0x(address).lower())
+
+
+    def refresh(self):
+        (hashes, self.cursor) = self.loader(self.cursor)
+        for k in hashes:
+            self.index.add(k)
+        if len(hashes) > 0:
+            logg.debug('tracker added {} queue hashes'.format(len(hashes)))
+
+
+    def have_hash(self, tx_hash):
+        return self.index.have(bytes.fromhex(strip_0x(tx_hash))) != False
+
+
+    def have(self, tx):
+        """Check whether a transaction is tracked.
+
+        :param tx: Transaction
+        :type tx: chainlib.eth.tx.Tx
+        :rtype: bool
+        :returns: True if tracked
+        """
+        return self.have_src(tx.hash, tx.outputs[0])
+
+
+    def have_src(self, tx_hash, sender=None):
+        """Check whether a transaction is tracked, by hash and sender.
+
+        :param tx_hash: Transaction hash
+        :type tx_hash: str
+        :param sender: Sender address, if known
+        :type sender: str
+        :rtype: bool
+        :returns: True if tracked
+        """
+        r = self.have_hash(tx_hash)
+        if not r and sender != None and len(self.senders) > 0:
+            r = strip_0x(sender).lower() in self.senders
+        if r:
+            self.tracked += 1
+        else:
+            self.skipped += 1
+        return r
+
+
+    def __str__(self):
+        return 'tx tracker {} senders tracked {} skipped {}'.format(len(self.senders), self.tracked, self.skipped)
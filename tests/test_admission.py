@@ -0,0 +1,44 @@
+# standard imports
+import unittest
+import logging
+
+# local imports
+from chaind.eth.admission import (
+        AdmissionControl,
+        backoff_delay,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestAdmission(unittest.TestCase):
+
+    def test_depth(self):
+        admission = AdmissionControl(max_depth=2)
+        self.assertTrue(admission.admit('foo'))
+        admission.add('aa', 'foo')
+        admission.add('aa', 'foo')
+        admission.add('bb', 'bar')
+        self.assertFalse(admission.admit('baz'))
+        admission.refresh({'bb': 'bar'})
+        self.assertTrue(admission.admit('baz'))
+        self.assertFalse(admission.due())
+
+
+    def test_sender_depth(self):
+        admission = AdmissionControl(max_sender_depth=1)
+        admission.add('aa', 'foo')
+        self.assertFalse(admission.admit('foo'))
+        self.assertTrue(admission.admit('bar'))
+
+
+    def test_backoff(self):
+        self.assertGreaterEqual(backoff_delay(1, retry_after=1.0), 1.0)
+        self.assertLessEqual(backoff_delay(1, retry_after=1.0), 1.1)
+        self.assertGreaterEqual(backoff_delay(3, retry_after=1.0), 4.0)
+        self.assertLessEqual(backoff_delay(10, retry_after=1.0, limit=30.0), 33.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
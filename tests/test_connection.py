@@ -0,0 +1,204 @@
+# standard imports
+import time
+import socket
+import unittest
+import threading
+import logging
+
+# external imports
+from chainlib.error import (
+        RPCException,
+        JSONRPCException,
+        )
+
+# local imports
+from chaind.eth.connection import (
+        HTTPConnectionPool,
+        EthMultiConnection,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+def recv_request(s):
+    buf = b''
+    while buf.find(b'\r\n\r\n') == -1:
+        v = s.recv(4096)
+        if len(v) == 0:
+            return None
+        buf += v
+    (head, body) = buf.split(b'\r\n\r\n', 1)
+    l = 0
+    for line in head.decode('utf-8').split('\r\n'):
+        if line.lower().startswith('content-length:'):
+            l = int(line.split(':', 1)[1])
+    while len(body) < l:
+        body += s.recv(l - len(body))
+    return body
+
+
+class HTTPServer(threading.Thread):
+    """Serves POST requests on one connection at a time, echoing the body.
+
+    The behavior for each request, in order of arrival, is taken from actions. 'ok' responds and keeps the connection open, 'drop' closes the connection after responding, and 'stall' reads the request and never responds.
+    """
+
+    def __init__(self, actions):
+        super(HTTPServer, self).__init__(daemon=True)
+        self.actions = actions
+        self.requests = []
+        self.connections = 0
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.bind(('127.0.0.1', 0))
+        self.srv.listen(4)
+        self.srv.settimeout(1.0)
+        self.port = self.srv.getsockname()[1]
+
+
+    def run(self):
+        while len(self.actions) > 0:
+            try:
+                (s, addr) = self.srv.accept()
+            except socket.timeout:
+                break
+            self.connections += 1
+            while len(self.actions) > 0:
+                body = recv_request(s)
+                if body == None:
+                    break
+                self.requests.append(body)
+                action = self.actions.pop(0)
+                if action == 'stall':
+                    time.sleep(0.5)
+                    break
+                s.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: ' + str(len(body)).encode('utf-8') + b'\r\n\r\n' + body)
+                if action == 'drop':
+                    break
+            s.close()
+        self.srv.close()
+
+
+class TestPool(unittest.TestCase):
+
+    def pool(self, actions):
+        self.srv = HTTPServer(actions)
+        self.srv.start()
+        return HTTPConnectionPool('http://127.0.0.1:{}'.format(self.srv.port), size=2, timeout=0.2)
+
+
+    def test_reuse(self):
+        pool = self.pool(['ok', 'ok', 'ok'])
+        for i in range(3):
+            v = str(i).encode('utf-8')
+            self.assertEqual(pool.request(v, {}), v)
+        pool.close()
+        self.srv.join()
+        self.assertEqual(self.srv.connections, 1)
+
+
+    def test_reconnect(self):
+        pool = self.pool(['drop', 'ok'])
+        self.assertEqual(pool.request(b'foo', {}), b'foo')
+        time.sleep(0.1)
+        self.assertEqual(pool.request(b'bar', {}), b'bar')
+        pool.close()
+        self.srv.join()
+        self.assertEqual(self.srv.connections, 2)
+        self.assertEqual(self.srv.requests, [b'foo', b'bar'])
+
+
+    def test_timeout_not_retried(self):
+        pool = self.pool(['ok', 'stall', 'ok'])
+        self.assertEqual(pool.request(b'foo', {}), b'foo')
+        with self.assertRaises(RPCException):
+            pool.request(b'bar', {})
+        pool.close()
+        self.srv.join()
+        self.assertEqual(self.srv.requests, [b'foo', b'bar'])
+
+
+class MockNodeConn:
+
+    def __init__(self, location, result=None, delay=0.0, error=None):
+        self.location = location
+        self.chain_spec = None
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+
+    def do(self, o, error_parser=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error != None:
+            raise self.error
+        return self.result
+
+
+    def disconnect(self):
+        pass
+
+
+class TestMultiConnection(unittest.TestCase):
+
+    def test_hedge(self):
+        slow = MockNodeConn('slow', result='slow', delay=0.5)
+        fast = MockNodeConn('fast', result='fast', delay=0.05)
+        conn = EthMultiConnection([slow, fast], hedge_delay=0.05)
+        conn.endpoints[0].record(0.01)
+        conn.endpoints[1].record(0.02)
+
+        t = time.monotonic()
+        self.assertEqual(conn.do({}), 'fast')
+        self.assertLess(time.monotonic() - t, 0.4)
+        self.assertEqual(slow.calls, 1)
+        self.assertEqual(fast.calls, 1)
+
+        conn.disconnect()
+
+        # answered within the hedge delay, no hedge
+        first = MockNodeConn('first', result='first')
+        second = MockNodeConn('second', result='second')
+        conn = EthMultiConnection([first, second], hedge_delay=0.05)
+        self.assertEqual(conn.do({}), 'first')
+        self.assertEqual(second.calls, 0)
+        conn.disconnect()
+
+
+    def test_hedge_error(self):
+        dead = MockNodeConn('dead', error=RPCException('connection refused'))
+        slow = MockNodeConn('slow', result='slow', delay=0.1)
+        ok = MockNodeConn('ok', result='ok')
+        conn = EthMultiConnection([dead, slow, ok], hedge_delay=0.05)
+        conn.endpoints[0].record(0.01)
+        conn.endpoints[1].record(0.02)
+        conn.endpoints[2].record(0.03)
+        self.assertEqual(conn.do({}), 'slow')
+        self.assertEqual(ok.calls, 0)
+        conn.disconnect()
+
+
+    def test_failover_errors(self):
+        for e in [RPCException('foo'), ConnectionResetError('foo'), socket.timeout('foo'), ValueError('RPC id mismatch')]:
+            dead = MockNodeConn('dead', error=e)
+            ok = MockNodeConn('ok', result='ok')
+            conn = EthMultiConnection([dead, ok])
+            self.assertEqual(conn.do({}), 'ok')
+            self.assertEqual(dead.calls, 1)
+            self.assertGreater(conn.endpoints[0].error_rate, 0)
+
+
+    def test_failover_passes_response_errors(self):
+        for e in [JSONRPCException('nonce too low'), TypeError('foo')]:
+            dead = MockNodeConn('dead', error=e)
+            ok = MockNodeConn('ok', result='ok')
+            conn = EthMultiConnection([dead, ok])
+            with self.assertRaises(type(e)):
+                conn.do({})
+            self.assertEqual(ok.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# standard imports
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+
+# external imports
+from chainlib.chain import ChainSpec
+from chainlib.eth.gas import (
+        Gas,
+        OverrideGasOracle,
+        )
+from chainlib.eth.nonce import OverrideNonceOracle
+from chainqueue.error import DuplicateTxError
+from chainqueue.store.fs import CounterStore
+from funga.eth.keystore.dict import DictKeystore
+from funga.eth.signer import EIP155Signer
+from hexathon import strip_0x
+
+# local imports
+from chaind.eth.adapter import EthFsAdapter
+from chaind.eth.cache import EthCacheTx
+from chaind.eth.snapshot import (
+        snapshot_read,
+        snapshot_write,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.chain_spec = ChainSpec('foo', 'bar', 42, 'baz')
+        self.path = tempfile.mkdtemp()
+        keystore = DictKeystore()
+        address = keystore.import_raw_key(os.urandom(32))
+        signer = EIP155Signer(keystore)
+        self.txs = []
+        for nonce in range(3):
+            c = Gas(self.chain_spec, signer=signer, gas_oracle=OverrideGasOracle(price=1, limit=21000), nonce_oracle=OverrideNonceOracle(address, nonce))
+            (tx_hash, o) = c.create(address, '0x' + 'ee' * 20, 1024)
+            self.txs.append(strip_0x(o['params'][0]))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def adapter(self, deferred_commit=False):
+        return EthFsAdapter(self.chain_spec, self.path, EthCacheTx, None, deferred_commit=deferred_commit)
+
+
+    def test_commit(self):
+        adapter = self.adapter(deferred_commit=True)
+        tx_hashes = []
+        for tx in self.txs:
+            tx_hashes.append(adapter.put(tx))
+            adapter.enqueue(tx_hashes[-1])
+        with self.assertRaises(DuplicateTxError):
+            adapter.put(self.txs[0])
+
+        self.assertEqual(self.adapter().store.upcoming(), [])
+        self.assertEqual(CounterStore(self.path).count, 0)
+
+        adapter.commit()
+        self.assertEqual(sorted(self.adapter().store.upcoming()), sorted(tx_hashes))
+        self.assertEqual(CounterStore(self.path).count, 3)
+        self.assertEqual(len(adapter.sync_set), 0)
+        self.assertGreater(adapter.sync_set.syncs, 0)
+
+        with self.assertRaises(DuplicateTxError):
+            adapter.put(self.txs[1])
+
+        adapter.commit()
+        self.assertEqual(adapter.commits, 2)
+
+
+    def test_commit_pending(self):
+        adapter = self.adapter(deferred_commit=True)
+        tx_hash = adapter.put(self.txs[0])
+        adapter.commit()
+        store = self.adapter().store
+        self.assertEqual(store.upcoming(), [])
+        self.assertEqual(store.pending(), [tx_hash])
+
+
+    def test_snapshot_view(self):
+        snapshot_path = os.path.join(self.path, '.snapshot')
+        adapter = EthFsAdapter(self.chain_spec, self.path, EthCacheTx, None, snapshot_path=snapshot_path)
+        tx_hashes = []
+        for tx in self.txs:
+            tx_hashes.append(adapter.put(tx))
+            adapter.enqueue(tx_hashes[-1])
+        self.assertEqual(len(adapter.entries), 3)
+        adapter.refresh()
+        adapter.save_snapshot()
+
+        # state listings older than the snapshot are not read again
+        (entries, view_time) = snapshot_read(snapshot_path)
+        entries[tx_hashes[0]] = (entries[tx_hashes[0]][0], 99, entries[tx_hashes[0]][2],)
+        del entries[tx_hashes[2]]
+        snapshot_write(snapshot_path, entries, view_time + 10000000000)
+        adapter = EthFsAdapter(self.chain_spec, self.path, EthCacheTx, None, snapshot_path=snapshot_path)
+        self.assertEqual(adapter.entries, entries)
+
+        # changed state listings are reconciled, without decoding known txs
+        adapter.store.reserve(tx_hashes[1])
+        snapshot_write(snapshot_path, entries, view_time)
+        adapter = EthFsAdapter(self.chain_spec, self.path, EthCacheTx, None, snapshot_path=snapshot_path)
+        self.assertEqual(adapter.entries[tx_hashes[0]][1], 99)
+        self.assertGreater(adapter.entries[tx_hashes[1]][0] & adapter.store.RESERVED, 0)
+        self.assertEqual(adapter.entries[tx_hashes[2]][1], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
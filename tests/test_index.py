@@ -0,0 +1,76 @@
+# standard imports
+import os
+import tempfile
+import unittest
+import shutil
+import logging
+
+# local imports
+from chaind.eth.index import (
+        BloomFilter,
+        KnownHashIndex,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestKnownHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_bloom(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        keys = [os.urandom(32) for i in range(1000)]
+        for k in keys:
+            bloom.add(k)
+        for k in keys:
+            self.assertTrue(bloom.have(k))
+        c = 0
+        for i in range(1000):
+            if bloom.have(os.urandom(32)):
+                c += 1
+        self.assertLess(c, 50)
+
+
+    def test_exact(self):
+        index = KnownHashIndex(capacity=4)
+        keys = [os.urandom(32) for i in range(10)]
+        for k in keys:
+            index.add(k)
+        self.assertEqual(len(index), 10)
+        self.assertGreaterEqual(index.bloom.capacity, 10)
+        for k in keys:
+            self.assertTrue(index.have(k))
+        self.assertFalse(index.have(os.urandom(32)))
+
+
+    def test_inexact(self):
+        index = KnownHashIndex(capacity=100, exact=False)
+        k = os.urandom(32)
+        index.add(k)
+        self.assertIsNone(index.have(k))
+
+
+    def test_load(self):
+        keys = [os.urandom(32) for i in range(3)]
+        fp = os.path.join(self.path, '.master')
+        f = open(fp, 'wb')
+        for k in keys:
+            f.write(k)
+        f.close()
+        index = KnownHashIndex(capacity=100)
+        self.assertEqual(index.load(fp), 3)
+        for k in keys:
+            self.assertTrue(index.have(k))
+        self.assertEqual(index.load(os.path.join(self.path, 'nonexistent')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+# standard imports
+import os
+import tempfile
+import unittest
+import shutil
+import logging
+
+# external imports
+from chainqueue import (
+        Store,
+        Status,
+        )
+from chainqueue.store.fs import (
+        IndexStore,
+        CounterStore,
+        )
+
+# local imports
+from chaind.eth.store.log import (
+        LogStoreFactory,
+        shared_factory,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestLogStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.path, 'log')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_state(self):
+        factory = LogStoreFactory(self.log_path)
+        state_store = Status(factory.add, allow_invalid=True)
+        index_store = IndexStore(os.path.join(self.path, 'tx'), digest_bytes=32)
+        store = Store(None, state_store, index_store, CounterStore(self.path), sync=False)
+
+        tx_hash = os.urandom(32).hex()
+        k = '1.0_0_' + tx_hash
+        index_store.put(tx_hash, k)
+        state_store.put(k, 'deadbeef')
+        store.enqueue(tx_hash)
+        factory.close()
+
+        factory = LogStoreFactory(self.log_path)
+        state_store = Status(factory.add, allow_invalid=True)
+        store = Store(None, state_store, index_store, CounterStore(self.path))
+        self.assertEqual(store.upcoming(), [tx_hash])
+        self.assertEqual(store.get(tx_hash), (k, 'deadbeef',))
+        self.assertEqual(bytes(factory.view('QUEUED', k)), b'deadbeef')
+        factory.close()
+
+
+    def test_remove(self):
+        factory = LogStoreFactory(self.log_path)
+        s = factory.add('FOO')
+        s.put('bar', 'baz')
+        s.replace('bar', 'xyzzy')
+        self.assertEqual(s.get('bar'), 'xyzzy')
+        s.remove('bar')
+        with self.assertRaises(FileNotFoundError):
+            s.get('bar')
+        with self.assertRaises(FileNotFoundError):
+            s.remove('bar')
+        factory.close()
+
+
+    def test_segments(self):
+        factory = LogStoreFactory(self.log_path, segment_size=256)
+        s = factory.add('FOO')
+        for i in range(10):
+            s.put(str(i), os.urandom(50).hex())
+        self.assertGreater(len(os.listdir(self.log_path)), 1)
+
+        other = LogStoreFactory(self.log_path)
+        self.assertEqual(len(other.add('FOO').list()), 10)
+        s.put('foo', 'bar')
+        with self.assertRaises(FileNotFoundError):
+            other.add('FOO').get('foo')
+        other.catch_up()
+        self.assertEqual(other.add('FOO').get('foo'), 'bar')
+        factory.close()
+        other.close()
+
+
+    def test_append_other(self):
+        factory = LogStoreFactory(self.log_path, segment_size=256)
+        other = LogStoreFactory(self.log_path, segment_size=256)
+        s = factory.add('FOO')
+        s_other = other.add('FOO')
+        for i in range(10):
+            s.put('foo', os.urandom(50).hex())
+            v = os.urandom(10).hex()
+            s_other.put('foo', v)
+        # appends pick up the records of the other factory before their own
+        s.put('bar', 'baz')
+        self.assertEqual(s.get('foo'), v)
+        s_other.put('bar', 'xyzzy')
+        factory.catch_up()
+        self.assertEqual(s.get('bar'), 'xyzzy')
+        factory.close()
+        other.close()
+
+
+    def test_checkpoint(self):
+        factory = LogStoreFactory(self.log_path, segment_size=256, checkpoint_interval=4)
+        s = factory.add('FOO')
+        for i in range(10):
+            s.put(str(i), os.urandom(50).hex())
+        s.remove('3')
+        factory.commit()
+        self.assertTrue(os.path.exists(factory.checkpoint_path))
+        s.put('foo', 'bar')
+        factory.close()
+
+        # nothing to scan after the checkpoint written on close
+        other = LogStoreFactory(self.log_path)
+        self.assertEqual(other.records, 0)
+        self.assertEqual(other.index, factory.index)
+        self.assertEqual(other.add('FOO').get('foo'), 'bar')
+        other.close()
+
+        f = open(factory.checkpoint_path, 'rb+')
+        f.truncate(20)
+        f.close()
+        other = LogStoreFactory(self.log_path)
+        self.assertEqual(other.records, 12)
+        self.assertEqual(other.index, factory.index)
+        other.close()
+
+
+    def test_compact(self):
+        factory = LogStoreFactory(self.log_path, segment_size=256, checkpoint_interval=4)
+        other = LogStoreFactory(self.log_path, segment_size=256)
+        s = factory.add('FOO')
+        s.put('foo', 'bar')
+        for i in range(100):
+            s.put(str(i % 2), os.urandom(50).hex())
+            factory.commit()
+        self.assertLess(len(os.listdir(self.log_path)), 10)
+        self.assertFalse(os.path.exists(os.path.join(self.log_path, '00000000.log')))
+        self.assertEqual(s.get('foo'), 'bar')
+
+        # the other factory skips the removed segments
+        other.catch_up()
+        self.assertEqual(other.index, factory.index)
+        self.assertEqual(other.add('FOO').get('1'), s.get('1'))
+        other.add('FOO').put('baz', 'xyzzy')
+        other.close()
+
+        factory.catch_up()
+        self.assertEqual(s.get('baz'), 'xyzzy')
+        index = factory.index
+        factory.close()
+
+        factory = LogStoreFactory(self.log_path)
+        self.assertEqual(factory.index, index)
+        factory.close()
+
+        os.unlink(factory.checkpoint_path)
+        factory = LogStoreFactory(self.log_path)
+        self.assertEqual(factory.index, index)
+        self.assertEqual(factory.add('FOO').get('foo'), 'bar')
+        factory.close()
+
+
+    def test_shared(self):
+        factory = shared_factory(self.log_path)
+        self.assertIs(shared_factory(self.log_path), factory)
+        other = LogStoreFactory(self.log_path)
+        other.add('FOO').put('bar', 'baz')
+        other.close()
+        self.assertEqual(shared_factory(self.log_path).add('FOO').get('bar'), 'baz')
+        factory.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# standard imports
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import shutil
+import logging
+
+# local imports
+from chaind.eth.pipeline import (
+        PIPELINE_MAGIC,
+        PipelineConnection,
+        PipelineSender,
+        recv_exact,
+        )
+from chaind.eth.admission import RESULT_BUSY
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.path, 'chaind.sock')
+        self.srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.srv.bind(self.socket_path)
+        self.srv.listen(1)
+        self.received = []
+
+
+    def tearDown(self):
+        self.srv.close()
+        shutil.rmtree(self.path)
+
+
+    def serve(self):
+        (srvs, addr) = self.srv.accept()
+        magic = recv_exact(srvs, len(PIPELINE_MAGIC))
+        self.assertEqual(magic, PIPELINE_MAGIC)
+        client = PipelineConnection(srvs)
+        while True:
+            req = client.get()
+            if req == None:
+                break
+            (seq, v) = req
+            self.received.append(v)
+            client.respond_put(seq, seq % 2, extra_data=v.hex())
+        client.close()
+
+
+    def test_pipeline(self):
+        t = threading.Thread(target=self.serve)
+        t.start()
+
+        sender = PipelineSender(self.socket_path, window=4)
+        results = []
+        for i in range(10):
+            results += sender.send(os.urandom(i + 1))
+        self.assertEqual(len(results), 6)
+        results += sender.close()
+        t.join()
+
+        self.assertEqual(len(self.received), 10)
+        for i, r in enumerate(results):
+            self.assertEqual(r[0], i)
+            self.assertEqual(r[1], i % 2)
+            self.assertEqual(r[2], self.received[i].hex())
+
+
+    def serve_busy(self):
+        (srvs, addr) = self.srv.accept()
+        magic = recv_exact(srvs, len(PIPELINE_MAGIC))
+        client = PipelineConnection(srvs)
+        while True:
+            req = client.get()
+            if req == None:
+                break
+            (seq, v) = req
+            if seq == 0:
+                client.respond_put(seq, RESULT_BUSY, extra_data='0.01')
+                continue
+            self.received.append(v)
+            client.respond_put(seq, 0, extra_data=v.hex())
+        client.close()
+
+
+    def test_pipeline_busy(self):
+        t = threading.Thread(target=self.serve_busy)
+        t.start()
+
+        sender = PipelineSender(self.socket_path, window=1)
+        results = []
+        results += sender.send(b'\x01')
+        results += sender.send(b'\x02')
+        results += sender.close()
+        t.join()
+
+        self.assertEqual(self.received, [b'\x02', b'\x01'])
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], (1, 0, '02',))
+        self.assertEqual(results[1], (0, 0, '01',))
+
+
+    def test_ready(self):
+        (a, b) = socket.socketpair()
+        client = PipelineConnection(a, buf=b'\x00')
+        self.assertTrue(client.ready())
+        client = PipelineConnection(a)
+        self.assertFalse(client.ready())
+        b.sendall(b'\x00\x00\x00\x01\x2a')
+        self.assertTrue(client.ready())
+        self.assertEqual(client.get(), (0, b'\x2a',))
+        self.assertFalse(client.ready())
+        a.close()
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
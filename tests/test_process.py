@@ -0,0 +1,117 @@
+# standard imports
+import os
+import tempfile
+import unittest
+import logging
+
+# external imports
+from chaind.error import TxSourceError
+from chainlib.eth.address import to_checksum_address
+
+# local imports
+from chaind.eth.cli.csv import CSVProcessor
+from chaind.eth.token.process import Processor
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class MockResolver:
+
+    def __init__(self):
+        self.nonce = 0
+        self.resets = 0
+        self.created = []
+
+
+    def reset(self):
+        self.resets += 1
+
+
+    def create(self, conn, recipient, gas_value, data=None, token_value=0, executable_address=None):
+        tx = {
+            'to': recipient,
+            'value': token_value,
+            'nonce': self.nonce,
+            }
+        self.nonce += 1
+        self.created.append(recipient)
+        return tx
+
+
+    def sign(self, tx):
+        return '{}:{}:{}'.format(tx['nonce'], tx['to'], tx['value']).encode('utf-8')
+
+
+class TestProcess(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+
+    def processor(self, contents, sign_processes=1):
+        f = open(self.path, 'w')
+        f.write(contents)
+        f.close()
+        processor = Processor(MockResolver(), self.path, use_checksum=False, sign_processes=sign_processes, sign_batch_size=16)
+        processor.add_processor(CSVProcessor())
+        processor.load(None)
+        return processor
+
+
+    def test_stream(self):
+        processor = self.processor('{},42\n\n{},0x2a\n'.format('ee' * 20, 'dd' * 20))
+        r = list(processor)
+        self.assertEqual(len(r), 2)
+        self.assertEqual(r[0], '0:0x{}:42'.format(to_checksum_address('ee' * 20)).encode('utf-8'))
+        self.assertEqual(r[1], '1:0x{}:42'.format(to_checksum_address('dd' * 20)).encode('utf-8'))
+
+
+    def test_invalid(self):
+        processor = self.processor('{},42\n\n{},foo\n{},42\n'.format('ee' * 20, 'dd' * 20, 'cc' * 20))
+        tx_iter = iter(processor)
+        next(tx_iter)
+        with self.assertRaisesRegex(TxSourceError, 'line 3'):
+            next(tx_iter)
+        self.assertEqual(processor.cursor, 1)
+
+
+    def test_parallel(self):
+        contents = ''
+        for i in range(100):
+            contents += '{},{}\n'.format(os.urandom(20).hex(), i)
+        r = list(self.processor(contents))
+        processor = self.processor(contents, sign_processes=4)
+        self.assertEqual(processor.sign_context.get_start_method(), 'fork')
+        self.assertEqual(list(processor), r)
+        self.assertEqual(processor.cursor, 100)
+
+
+    def test_parallel_invalid(self):
+        contents = ''
+        for i in range(40):
+            contents += '{},{}\n'.format(os.urandom(20).hex(), i)
+        contents += '{},foo\n'.format(os.urandom(20).hex())
+        processor = self.processor(contents, sign_processes=2)
+        r = []
+        with self.assertRaisesRegex(TxSourceError, 'line 41'):
+            for v in processor:
+                r.append(v)
+        self.assertEqual(len(r), 40)
+        self.assertEqual(r[39], '39:{}:39'.format(processor.resolver.created[39]).encode('utf-8'))
+
+
+    def test_missing(self):
+        processor = Processor(MockResolver(), self.path + '.foo')
+        processor.add_processor(CSVProcessor())
+        with self.assertRaises(TxSourceError):
+            processor.load(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
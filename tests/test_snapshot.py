@@ -0,0 +1,50 @@
+# standard imports
+import os
+import tempfile
+import unittest
+import shutil
+import logging
+
+# local imports
+from chaind.eth.snapshot import (
+        snapshot_read,
+        snapshot_write,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.path, '.snapshot')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_snapshot(self):
+        self.assertIsNone(snapshot_read(self.snapshot_path))
+        entries = {
+            os.urandom(32).hex(): (2, 42, os.urandom(20).hex(),),
+            os.urandom(32).hex(): (8, None, os.urandom(20).hex(),),
+            }
+        snapshot_write(self.snapshot_path, entries, 1234567890123456789)
+        self.assertEqual(snapshot_read(self.snapshot_path), (entries, 1234567890123456789,))
+        self.assertFalse(os.path.exists(self.snapshot_path + '.tmp'))
+
+
+    def test_snapshot_invalid(self):
+        snapshot_write(self.snapshot_path, {os.urandom(32).hex(): (2, 42, os.urandom(20).hex(),)}, 0)
+        f = open(self.snapshot_path, 'rb+')
+        f.truncate(20)
+        f.close()
+        with self.assertRaises(ValueError):
+            snapshot_read(self.snapshot_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# standard imports
+import os
+import tempfile
+import unittest
+import shutil
+import logging
+
+# external imports
+from chainqueue import (
+        Store,
+        Status,
+        )
+from chainqueue.error import (
+        DuplicateTxError,
+        NotLocalTxError,
+        )
+
+# local imports
+from chaind.eth.store.sqlite import (
+        SqliteStoreFactory,
+        shared_factory,
+        SqliteIndexStore,
+        SqliteCounterStore,
+        SyncSqliteStore,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class TestSqliteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.path, 'queue.sqlite')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_state(self):
+        factory = SqliteStoreFactory(self.db_path)
+        state_store = Status(factory.add, allow_invalid=True)
+        index_store = SqliteIndexStore(factory)
+        store = Store(None, state_store, index_store, SqliteCounterStore(factory), sync=False)
+
+        tx_hash = os.urandom(32).hex()
+        k = '1.0_0_' + tx_hash
+        index_store.put(tx_hash, k)
+        state_store.put(k, 'deadbeef')
+        store.enqueue(tx_hash)
+        with self.assertRaises(DuplicateTxError):
+            index_store.put(tx_hash, k)
+        with self.assertRaises(NotLocalTxError):
+            index_store.get(os.urandom(32).hex())
+
+        index_store.set_sender(tx_hash, 'ee' * 20, 42)
+        self.assertEqual(index_store.by_sender('ee' * 20), [(42, tx_hash,)])
+
+        (hashes, cursor) = index_store.load_since(0)
+        self.assertEqual(hashes, [bytes.fromhex(tx_hash)])
+        self.assertEqual(index_store.load_since(cursor), ([], cursor,))
+        factory.close()
+
+        factory = SqliteStoreFactory(self.db_path)
+        state_store = Status(factory.add, allow_invalid=True)
+        store = Store(None, state_store, SqliteIndexStore(factory), SqliteCounterStore(factory))
+        self.assertEqual(store.upcoming(), [tx_hash])
+        self.assertEqual(store.get(tx_hash), (k, 'deadbeef',))
+        self.assertIn('QUEUED', factory.ls())
+        factory.close()
+
+
+    def test_counter(self):
+        factory = SqliteStoreFactory(self.db_path)
+        counter = SqliteCounterStore(factory)
+        self.assertEqual(counter.next(), 0)
+        self.assertEqual(counter.next(), 1)
+        factory.close()
+
+        factory = SqliteStoreFactory(self.db_path)
+        counter = SqliteCounterStore(factory)
+        self.assertEqual(counter.next(), 2)
+        factory.close()
+
+
+    def test_deferred(self):
+        factory = SqliteStoreFactory(self.db_path, deferred=True)
+        factory.add('FOO').put('bar', 'baz')
+        other = SqliteStoreFactory(self.db_path)
+        with self.assertRaises(FileNotFoundError):
+            other.add('FOO').get('bar')
+        factory.commit()
+        self.assertEqual(other.add('FOO').get('bar'), 'baz')
+        factory.close()
+        other.close()
+
+
+    def test_shared(self):
+        factory = shared_factory(self.db_path)
+        self.assertIs(shared_factory(self.db_path), factory)
+        self.assertFalse(factory.deferred)
+        deferred = shared_factory(self.db_path, deferred=True)
+        self.assertIs(deferred, factory)
+        self.assertTrue(factory.deferred)
+        factory.add('FOO').put('bar', 'baz')
+        self.assertTrue(factory.db.in_transaction)
+        factory.commit()
+        factory.close()
+        other = shared_factory(self.db_path)
+        self.assertIsNot(other, factory)
+        self.assertEqual(other.add('FOO').get('bar'), 'baz')
+        other.close()
+
+
+    def test_sync_store(self):
+        store = SyncSqliteStore(self.path, session_id='foo')
+        store.start(offset=13, target=42)
+        self.assertEqual(store.target, 42)
+        self.assertEqual(store.next_item().cursor, 13)
+        store.factory.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,760 @@
+# standard imports
+import os
+import tempfile
+import shutil
+import unittest
+import json
+import time
+import socket
+import threading
+import logging
+
+# external imports
+from chainlib.error import (
+        RPCException,
+        JSONRPCException,
+        )
+from chainsyncer.error import NoBlockForYou
+from chainsyncer.store.mem import SyncMemStore
+
+# local imports
+from chaind.eth.prefetch import BlockPrefetcher
+from chaind.eth.chain import (
+        EthChainInterface,
+        EthLazyBlock,
+        )
+from chaind.eth.driver import EthChainInterfaceDriver
+from chaind.eth.index import KnownHashIndex
+from chaind.eth.shard import shard_range
+from chaind.eth.blockcache import BlockCache
+from chaind.eth.sparse import (
+        ReceiptPoller,
+        BlockStub,
+        )
+from chaind.eth.head import (
+        HeadFollow,
+        NewHeadsSubscription,
+        ws_frame,
+        ws_recv_frame,
+        ws_accept_key,
+        WS_OP_PING,
+        WS_OP_PONG,
+        )
+from chaind.eth.track import (
+        TxTracker,
+        load_index_file,
+        )
+
+logging.basicConfig(level=logging.DEBUG)
+logg = logging.getLogger()
+
+
+class BlockConnection:
+
+    def __init__(self, head):
+        self.head = head
+        self.requested = []
+        self.fails = {}
+        self.lock = threading.Lock()
+
+
+    def do(self, o):
+        if o['method'] == 'eth_blockNumber':
+            return hex(self.head)
+        number = int(o['params'][0], 16)
+        with self.lock:
+            self.requested.append(number)
+            if self.fails.get(number, 0) > 0:
+                self.fails[number] -= 1
+                raise RPCException('block {} unavailable'.format(number))
+        if number > self.head:
+            return None
+        return {'number': hex(number)}
+
+
+class ReceiptConnection:
+
+    def __init__(self, receipts, block_receipts=True):
+        self.receipts = receipts
+        self.block_receipts = block_receipts
+        self.methods = []
+
+
+    def do(self, o, error_parser=None):
+        self.methods.append(o['method'])
+        if o['method'] == 'eth_getBlockReceipts':
+            if not self.block_receipts:
+                raise JSONRPCException('method not found')
+            return list(self.receipts.values())
+        return self.receipts[o['params'][0]]
+
+
+class ReceiptBatchConnection(ReceiptConnection):
+
+    def do_batch(self, o, error_parser=None):
+        self.methods.append('batch')
+        return [self.receipts[v['params'][0]] for v in o]
+
+
+class NullReceiptConnection(ReceiptBatchConnection):
+
+    def __init__(self, receipts, block_receipts=True, missing=()):
+        super(NullReceiptConnection, self).__init__(receipts, block_receipts=block_receipts)
+        self.missing = list(missing)
+
+
+    def do(self, o, error_parser=None):
+        if o['method'] == 'eth_getBlockReceipts' and self.block_receipts:
+            self.methods.append(o['method'])
+            return [None] + list(self.receipts.values())[1:]
+        if o['params'][0] in self.missing:
+            self.methods.append(o['method'])
+            return None
+        return super(NullReceiptConnection, self).do(o, error_parser=error_parser)
+
+
+    def do_batch(self, o, error_parser=None):
+        r = super(NullReceiptConnection, self).do_batch(o, error_parser=error_parser)
+        r[0] = None
+        return r
+
+
+def block_with_receipts(c):
+    (block, receipts, src) = block_src_with_receipts(c)
+    return (block, receipts,)
+
+
+def block_src_with_receipts(c):
+    block_hash = '0x' + os.urandom(32).hex()
+    txs = []
+    receipts = {}
+    for i in range(c):
+        tx_hash = '0x' + os.urandom(32).hex()
+        txs.append({
+            'hash': tx_hash,
+            'from': '0x' + 'ee' * 20,
+            'to': '0x' + 'dd' * 20,
+            'nonce': hex(i),
+            'gas': '0x5208',
+            'gasPrice': '0x1',
+            'value': '0x0',
+            'input': '0x',
+            'v': '0x1b',
+            'r': '0x01',
+            's': '0x01',
+            'blockHash': block_hash,
+            'blockNumber': '0x2a',
+            'transactionIndex': hex(i),
+            })
+        receipts[tx_hash] = {
+            'transactionHash': tx_hash,
+            'blockHash': block_hash,
+            'blockNumber': '0x2a',
+            'transactionIndex': hex(i),
+            'status': '0x1',
+            'gasUsed': '0x5208',
+            'contractAddress': None,
+            'logs': [],
+            }
+    src = {
+        'hash': block_hash,
+        'number': '0x2a',
+        'transactions': txs,
+        'timestamp': '0x1',
+        'miner': '0x' + 'cc' * 20,
+        'gasLimit': '0x1',
+        'gasUsed': '0x1',
+        'parentHash': '0x' + '00' * 32,
+        }
+    block = EthLazyBlock.from_src(src)
+    return (block, receipts, src,)
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.chain_interface = EthChainInterface()
+
+
+    def test_in_order(self):
+        conn = BlockConnection(100)
+        prefetcher = BlockPrefetcher(conn, self.chain_interface, lookahead=4)
+        for i in range(10, 20):
+            r = prefetcher.get(i)
+            self.assertEqual(int(r['number'], 16), i)
+        prefetcher.close()
+        # blocks still pending at close are cancelled
+        self.assertLessEqual(set(range(10, 20)), set(conn.requested))
+        self.assertLessEqual(set(conn.requested), set(range(10, 24)))
+        self.assertEqual(len(conn.requested), len(set(conn.requested)))
+
+
+    def test_target(self):
+        conn = BlockConnection(100)
+        prefetcher = BlockPrefetcher(conn, self.chain_interface, lookahead=4)
+        for i in range(10, 13):
+            prefetcher.get(i, target=12)
+        prefetcher.close()
+        self.assertEqual(max(conn.requested), 12)
+
+
+    def test_head(self):
+        conn = BlockConnection(11)
+        prefetcher = BlockPrefetcher(conn, self.chain_interface, lookahead=4)
+        self.assertIsNotNone(prefetcher.get(10))
+        self.assertIsNotNone(prefetcher.get(11))
+        self.assertIsNone(prefetcher.get(12))
+        conn.head = 12
+        self.assertIsNotNone(prefetcher.get(12))
+        prefetcher.close()
+        self.assertEqual(max(conn.requested), 12)
+
+
+    def test_error(self):
+        conn = BlockConnection(100)
+        conn.fails[12] = 1
+        conn.fails[14] = 2
+        prefetcher = BlockPrefetcher(conn, self.chain_interface, lookahead=4)
+        prefetcher.get(10)
+        prefetcher.get(11)
+        self.assertEqual(int(prefetcher.get(12)['number'], 16), 12)
+        self.assertEqual(prefetcher.errors, 1)
+        self.assertEqual(conn.requested.count(12), 2)
+
+        prefetcher.get(13)
+        with self.assertRaises(RPCException):
+            prefetcher.get(14)
+        self.assertEqual(prefetcher.errors, 2)
+        prefetcher.close()
+
+
+class TestReceipts(unittest.TestCase):
+
+    def merge(self, conn, chain_interface, c):
+        (block, conn.receipts) = block_with_receipts(c)
+        drv = EthChainInterfaceDriver(SyncMemStore(), chain_interface)
+        txs = [block.tx(i) for i in range(c)]
+        i = 0
+        while i < c:
+            i += drv.merge_rcpts(conn, txs[i:])
+        for tx in txs:
+            self.assertIsNotNone(tx.status)
+
+
+    def test_block(self):
+        conn = ReceiptBatchConnection(None)
+        chain_interface = EthChainInterface()
+        self.merge(conn, chain_interface, 5)
+        self.assertEqual(chain_interface.receipt_method, 'block')
+        self.assertEqual(conn.methods, ['eth_getBlockReceipts'] * 2)
+
+
+    def test_batch(self):
+        conn = ReceiptBatchConnection(None, block_receipts=False)
+        chain_interface = EthChainInterface(batch_limit=2)
+        self.merge(conn, chain_interface, 5)
+        self.assertEqual(chain_interface.receipt_method, 'batch')
+        self.assertEqual(conn.methods, ['eth_getBlockReceipts', 'batch', 'batch', 'batch'])
+
+
+    def test_single(self):
+        conn = ReceiptConnection(None, block_receipts=False)
+        chain_interface = EthChainInterface()
+        self.merge(conn, chain_interface, 3)
+        self.assertEqual(chain_interface.receipt_method, 'single')
+        self.assertEqual(conn.methods, ['eth_getBlockReceipts'] + ['eth_getTransactionReceipt'] * 3)
+
+
+    def test_null(self):
+        conn = NullReceiptConnection(None)
+        self.merge(conn, EthChainInterface(), 3)
+        self.assertEqual(conn.methods, ['eth_getBlockReceipts'] * 2 + ['eth_getTransactionReceipt'])
+
+        conn = NullReceiptConnection(None, block_receipts=False)
+        self.merge(conn, EthChainInterface(batch_limit=3), 3)
+        self.assertEqual(conn.methods, ['eth_getBlockReceipts', 'batch', 'eth_getTransactionReceipt'])
+
+
+    def test_null_retry(self):
+        (block, receipts) = block_with_receipts(3)
+        conn = NullReceiptConnection(receipts, missing=[block.txs[0]['hash']])
+        drv = EthChainInterfaceDriver(SyncMemStore(), EthChainInterface(receipt_method='block'))
+        drv.session = FilterSession()
+        item = drv.store.next_item()
+        drv.process(conn, item, block)
+        self.assertTrue(drv.retry)
+        self.assertEqual(drv.session.txs, [])
+        with self.assertRaises(NoBlockForYou):
+            drv.get(conn, item)
+        self.assertFalse(drv.retry)
+
+        conn.missing = []
+        with self.assertRaises(IndexError):
+            drv.process(conn, item, block)
+        self.assertEqual(len(drv.session.txs), 3)
+
+
+class FilterSession:
+
+    def __init__(self):
+        self.txs = []
+
+
+    def filter(self, conn, block, tx):
+        self.txs.append(tx.hash)
+
+
+class TestTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.master_file = os.path.join(self.path, '.master')
+        (self.block, self.receipts) = block_with_receipts(5)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def track(self, tx_hash):
+        f = open(self.master_file, 'ab')
+        f.write(bytes.fromhex(tx_hash[2:]))
+        f.close()
+
+
+    def process(self, tracker):
+        conn = ReceiptConnection(self.receipts)
+        drv = EthChainInterfaceDriver(SyncMemStore(), EthChainInterface(receipt_method='single'), tracker=tracker)
+        drv.session = FilterSession()
+        item = drv.store.next_item()
+        with self.assertRaises(IndexError):
+            drv.process(conn, item, self.block)
+        return (conn.methods, drv.session.txs,)
+
+
+    def test_load(self):
+        hashes = [tx['hash'] for tx in self.block.txs]
+        self.track(hashes[0])
+        (r, cursor) = load_index_file(self.master_file, 0)
+        self.assertEqual(cursor, 32)
+        self.track(hashes[1])
+        (r, cursor) = load_index_file(self.master_file, cursor)
+        self.assertEqual(r, [bytes.fromhex(hashes[1][2:])])
+        self.assertEqual(cursor, 64)
+
+
+    def test_prefilter(self):
+        hashes = [tx['hash'] for tx in self.block.txs]
+        tracker = TxTracker(KnownHashIndex(capacity=100), lambda v: load_index_file(self.master_file, v))
+        self.track(hashes[3])
+        (methods, txs) = self.process(tracker)
+        self.assertEqual(methods, ['eth_getTransactionReceipt'])
+        self.assertEqual(txs, [hashes[3][2:]])
+
+        self.track(hashes[1])
+        (methods, txs) = self.process(tracker)
+        self.assertEqual(len(methods), 2)
+        self.assertEqual(txs, [hashes[1][2:], hashes[3][2:]])
+
+
+    def test_lazy(self):
+        hashes = [tx['hash'] for tx in self.block.txs]
+        self.assertEqual(self.block.tx_hash(2), hashes[2][2:])
+        self.assertEqual(self.block.tx_sender(2), 'ee' * 20)
+        tracker = TxTracker(KnownHashIndex(capacity=100), lambda v: load_index_file(self.master_file, v))
+        self.track(hashes[2])
+        self.process(tracker)
+        self.assertEqual(list(self.block.tx_cache.keys()), [2])
+        self.assertIs(self.block.tx(2), self.block.tx_cache[2])
+
+
+    def test_sender(self):
+        tracker = TxTracker(KnownHashIndex(capacity=100), lambda v: load_index_file(self.master_file, v), senders=['0x' + 'EE' * 20])
+        (methods, txs) = self.process(tracker)
+        self.assertEqual(len(txs), 5)
+
+
+class PollAdapter:
+
+    def __init__(self, pending):
+        self.pending = pending
+
+
+    def active(self):
+        r = {}
+        for tx_hash in self.pending:
+            r[tx_hash] = None
+        return r
+
+
+class PollConnection(ReceiptConnection):
+
+    def __init__(self, receipts, block_src, head):
+        super(PollConnection, self).__init__(receipts)
+        self.block_src = block_src
+        self.head = head
+
+
+    def do(self, o, error_parser=None):
+        if o['method'] == 'eth_blockNumber':
+            return hex(self.head)
+        elif o['method'] == 'eth_getBlockByHash':
+            self.methods.append(o['method'])
+            return self.block_src
+        elif o['method'] == 'eth_getTransactionReceipt':
+            self.methods.append(o['method'])
+            return self.receipts.get(o['params'][0])
+        self.methods.append(o['method'])
+        return None
+
+
+class TestSparse(unittest.TestCase):
+
+    def setUp(self):
+        (block, receipts, src) = block_src_with_receipts(3)
+        self.hashes = list(receipts.keys())
+        self.adapter = PollAdapter([self.hashes[1][2:], os.urandom(32).hex()])
+        self.conn = PollConnection(receipts, src, 44)
+        self.chain_interface = EthChainInterface()
+        self.poller = ReceiptPoller(lambda: self.adapter, self.chain_interface, threshold=2, check_interval=0)
+        self.drv = EthChainInterfaceDriver(SyncMemStore(), self.chain_interface, offset=40, poller=self.poller)
+        self.drv.session = FilterSession()
+        self.item = self.drv.store.next_item()
+
+
+    def step(self):
+        block = self.drv.get(self.conn, self.item)
+        try:
+            self.drv.process(self.conn, self.item, block)
+        except IndexError:
+            self.item.next(advance_block=True)
+        return block
+
+
+    def test_poll(self):
+        for i in range(40, 45):
+            block = self.step()
+            self.assertIsInstance(block, BlockStub)
+            self.assertEqual(block.number, i)
+        self.assertEqual(self.drv.session.txs, [self.hashes[1][2:]])
+        self.assertEqual(self.conn.methods, ['eth_getTransactionReceipt'] * 2 + ['eth_getBlockByHash'])
+        with self.assertRaises(NoBlockForYou):
+            self.drv.get(self.conn, self.item)
+
+
+    def test_switch(self):
+        for i in range(40, 45):
+            self.step()
+        self.adapter.pending.append(os.urandom(32).hex())
+        self.conn.head = 46
+        self.conn.methods = []
+        for i in range(45, 47):
+            block = self.step()
+            self.assertIsInstance(block, BlockStub)
+        self.assertEqual(self.conn.methods.count('eth_getTransactionReceipt'), 3)
+        self.assertEqual(self.drv.session.txs, [self.hashes[1][2:]] * 2)
+        with self.assertRaises(NoBlockForYou):
+            self.drv.get(self.conn, self.item)
+        self.assertEqual(self.conn.methods[-1], 'eth_getBlockByNumber')
+
+
+class TestShard(unittest.TestCase):
+
+    def test_range(self):
+        self.assertEqual(shard_range(10, 19, 3), [(10, 13), (14, 16), (17, 19)])
+        self.assertEqual(shard_range(10, 11, 4), [(10, 10), (11, 11)])
+        self.assertEqual(shard_range(10, 10, 1), [(10, 10)])
+        self.assertEqual(shard_range(10, 9, 2), [])
+
+
+class ChainConnection:
+
+    def __init__(self, head):
+        self.chain = []
+        parent = '0x' + '00' * 32
+        for i in range(head + 1):
+            block_hash = '0x' + os.urandom(32).hex()
+            self.chain.append({
+                'hash': block_hash,
+                'number': hex(i),
+                'transactions': [],
+                'timestamp': '0x1',
+                'miner': '0x' + 'cc' * 20,
+                'gasLimit': '0x1',
+                'gasUsed': '0x1',
+                'parentHash': parent,
+                })
+            parent = block_hash
+        self.requested = []
+
+
+    def do(self, o, error_parser=None):
+        number = int(o['params'][0], 16)
+        self.requested.append(number)
+        try:
+            return self.chain[number]
+        except IndexError:
+            return None
+
+
+class LatestChainConnection(ChainConnection):
+
+    def __init__(self, length, head):
+        super(LatestChainConnection, self).__init__(length)
+        self.head = head
+
+
+    def do(self, o, error_parser=None):
+        if o['method'] == 'eth_blockNumber':
+            return hex(self.head)
+        return super(LatestChainConnection, self).do(o, error_parser=error_parser)
+
+
+class StubPoller:
+
+    def __init__(self):
+        self.active = True
+
+
+    def check(self):
+        return self.active
+
+
+    def poll(self, conn):
+        return []
+
+
+class TestBlockCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = BlockCache(self.path, 'evm:foo:1:bar')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def sync(self, conn, offset, target):
+        drv = EthChainInterfaceDriver(SyncMemStore(), EthChainInterface(), offset=offset, cache=self.cache, confirmations=2)
+        item = drv.store.next_item()
+        for i in range(offset, target + 1):
+            block = drv.get(conn, item)
+            self.assertEqual(block.number, i)
+            item.next(advance_block=True)
+        return drv
+
+
+    def test_receipt(self):
+        block_hash = os.urandom(32).hex()
+        tx_hash = os.urandom(32).hex()
+        self.assertIsNone(self.cache.get_receipt(block_hash, tx_hash))
+        self.cache.put_receipt(block_hash, tx_hash, {'status': '0x1'})
+        self.assertEqual(self.cache.get_receipt(block_hash, tx_hash), {'status': '0x1'})
+        self.assertIsNone(self.cache.get_receipt(os.urandom(32).hex(), tx_hash))
+
+
+    def test_confirmations(self):
+        conn = ChainConnection(10)
+        self.sync(conn, 0, 5)
+        for i in range(4):
+            self.assertEqual(self.cache.get_block(i), conn.chain[i])
+        self.assertIsNone(self.cache.get_block(4))
+
+        conn.requested = []
+        self.sync(conn, 0, 5)
+        self.assertEqual(conn.requested, [4, 5])
+
+
+    def test_reorg(self):
+        conn = ChainConnection(10)
+        self.sync(conn, 0, 5)
+        stale = dict(conn.chain[3])
+        stale['hash'] = '0x' + os.urandom(32).hex()
+        stale['parentHash'] = '0x' + os.urandom(32).hex()
+        self.cache.put_block(stale)
+        self.cache.invalidate(3)
+        self.cache.put_number(3, stale['hash'])
+
+        conn.requested = []
+        self.sync(conn, 0, 5)
+        self.assertEqual(conn.requested, [3, 4, 5])
+
+
+    def test_evict(self):
+        cache = BlockCache(self.path, 'evm:foo:1:bar', max_bytes=1024)
+        for i in range(20):
+            cache.put_receipt(os.urandom(32).hex(), os.urandom(32).hex(), {'v': 'ff' * 50})
+        self.assertLessEqual(cache.size, 1024)
+
+
+class Heads:
+
+    def __init__(self):
+        self.waits = []
+        self.stopped = False
+
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        return False
+
+
+    def stop(self):
+        self.stopped = True
+
+
+class HeadsServer(threading.Thread):
+
+    def __init__(self, numbers):
+        super(HeadsServer, self).__init__(daemon=True)
+        self.numbers = numbers
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.bind(('127.0.0.1', 0))
+        self.srv.listen(1)
+        self.port = self.srv.getsockname()[1]
+        self.request = None
+        self.pong = None
+
+
+    def run(self):
+        (s, addr) = self.srv.accept()
+        req = b''
+        while req.find(b'\r\n\r\n') == -1:
+            req += s.recv(4096)
+        for line in req.decode('utf-8').split('\r\n'):
+            if line.lower().startswith('sec-websocket-key:'):
+                key = line.split(':', 1)[1].strip()
+        s.sendall('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {}\r\n\r\n'.format(ws_accept_key(key)).encode('utf-8'))
+        (fin, opcode, payload) = ws_recv_frame(s)
+        self.request = json.loads(payload)
+        s.sendall(ws_frame(json.dumps({'jsonrpc': '2.0', 'id': 1, 'result': '0xabcd'}).encode('utf-8'), mask=False))
+        s.sendall(ws_frame(b'foo', opcode=WS_OP_PING, mask=False))
+        (fin, opcode, payload) = ws_recv_frame(s)
+        self.pong = (opcode, payload,)
+        for number in self.numbers:
+            o = {'jsonrpc': '2.0', 'method': 'eth_subscription', 'params': {'subscription': '0xabcd', 'result': {'number': hex(number), 'pad': 'ff' * 100}}}
+            s.sendall(ws_frame(json.dumps(o).encode('utf-8'), mask=False))
+        s.recv(1)
+        s.close()
+        self.srv.close()
+
+
+class TestHead(unittest.TestCase):
+
+    def test_delay(self):
+        follow = HeadFollow(block_time=10.0, min_interval=0.5, max_interval=10.0)
+        follow.observe(41, 1000)
+        self.assertAlmostEqual(follow.delay(now=1002), 7.0)
+        self.assertAlmostEqual(follow.delay(now=1009.5), 1.0)
+        self.assertAlmostEqual(follow.delay(now=1030), 10.0)
+        self.assertAlmostEqual(follow.delay(now=990), 10.0)
+
+        follow.observe(42, 1005)
+        self.assertAlmostEqual(follow.block_time, 9.0)
+        follow.observe(42, 1020)
+        self.assertAlmostEqual(follow.block_time, 9.0)
+        follow.observe(44, 1020)
+        self.assertAlmostEqual(follow.block_time, 9.0)
+        self.assertAlmostEqual(follow.delay(now=1029), 0.9)
+
+        follow.block_time = 1.0
+        self.assertAlmostEqual(follow.delay(now=1020.5), 0.5)
+
+
+    def test_driver(self):
+        conn = ChainConnection(3)
+        for (i, src) in enumerate(conn.chain):
+            src['timestamp'] = hex(1000 + i * 6)
+        follow = HeadFollow(block_time=10.0)
+        heads = Heads()
+        drv = EthChainInterfaceDriver(SyncMemStore(), EthChainInterface(), offset=0, follow=follow, heads=heads)
+        item = drv.store.next_item()
+        for i in range(4):
+            drv.get(conn, item)
+            item.next(advance_block=True)
+        self.assertEqual(follow.number, 3)
+        self.assertAlmostEqual(follow.block_time, 10.0 - 0.8 * 2.44)
+        with self.assertRaises(NoBlockForYou):
+            drv.get(conn, item)
+
+        drv.idle(1)
+        self.assertEqual(len(heads.waits), 1)
+        self.assertLessEqual(heads.waits[0], follow.max_interval)
+        drv.close()
+        self.assertTrue(heads.stopped)
+
+
+    def test_driver_sparse(self):
+        conn = LatestChainConnection(5, 3)
+        for (i, src) in enumerate(conn.chain):
+            src['timestamp'] = hex(1000 + i * 6)
+        follow = HeadFollow(block_time=10.0)
+        poller = StubPoller()
+        drv = EthChainInterfaceDriver(SyncMemStore(), EthChainInterface(), offset=0, poller=poller, follow=follow)
+        item = drv.store.next_item()
+        self.assertIsInstance(drv.get(conn, item), BlockStub)
+        # the latest block height has no timestamp, and must not hold back the fetched blocks
+        self.assertEqual(follow.number, -1)
+
+        poller.active = False
+        for i in range(1, 6):
+            item.next(advance_block=True)
+            drv.get(conn, item)
+        self.assertEqual(follow.number, 5)
+        self.assertEqual(follow.timestamp, 1030)
+        self.assertAlmostEqual(follow.block_time, 10.0 - 0.2 * 4)
+
+
+    def test_frame(self):
+        (a, b) = socket.socketpair()
+        payload = os.urandom(70000)
+        a.sendall(ws_frame(payload))
+        self.assertEqual(ws_recv_frame(b), (True, 1, payload,))
+        a.sendall(ws_frame(b'foo', mask=False))
+        self.assertEqual(ws_recv_frame(b), (True, 1, b'foo',))
+        a.close()
+        b.close()
+
+
+    def test_subscription(self):
+        srv = HeadsServer([42, 43])
+        srv.start()
+        heads = NewHeadsSubscription('ws://127.0.0.1:{}/'.format(srv.port))
+        heads.start()
+        while heads.notifications < 2:
+            self.assertTrue(heads.wait(5.0))
+        self.assertEqual(heads.number, 43)
+        self.assertEqual(srv.request['method'], 'eth_subscribe')
+        self.assertEqual(srv.request['params'], ['newHeads'])
+        self.assertEqual(srv.pong, (WS_OP_PONG, b'foo',))
+        heads.stop()
+        srv.join()
+
+
+    def test_subscription_retry(self):
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+
+        heads = NewHeadsSubscription('ws://127.0.0.1:{}/'.format(port))
+        attempts = []
+        connect = heads.connect
+        def connect_count():
+            attempts.append(time.monotonic())
+            connect()
+        heads.connect = connect_count
+
+        # a notification the syncer has not consumed yet
+        heads.event.set()
+        heads.start()
+        time.sleep(0.3)
+        self.assertEqual(len(attempts), 1)
+        heads.stop()
+        heads.join(timeout=1.0)
+        self.assertFalse(heads.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
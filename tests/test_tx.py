@@ -3,8 +3,11 @@ import os
 import tempfile
 import unittest
 import shutil
+import time
+import random
 import logging
 import hashlib
+import threading
 
 # external imports
 from chainlib.chain import ChainSpec
@@ -14,13 +17,30 @@ from chainlib.status import Status as TxStatus
 from chaind.unittest.fs import TestChaindFsBase
 from chaind.driver import QueueDriver
 from chaind.filter import StateFilter
+from chaind.adapters.fs import ChaindFsAdapter
 from chainlib.eth.gas import Gas
 from jsonrpc_std.parse import jsonrpc_validate_dict
 from hexathon import strip_0x
+from chainlib.eth.gas import OverrideGasOracle
+from chainlib.eth.nonce import OverrideNonceOracle
+from funga.eth.keystore.dict import DictKeystore
+from funga.eth.signer import EIP155Signer
 
 # local imports
-from chaind.eth.cache import EthCacheTx
-from chaind.eth.dispatch import EthDispatcher
+from chaind.eth.connection import EthMultiConnection
+from chaind.eth.cache import (
+        EthCacheTx,
+        EthLazyCacheTx,
+        DecodeCache,
+        )
+from chaind.eth.dispatch import (
+        EthDispatcher,
+        EthAsyncDispatcher,
+        DispatchWorker,
+        EthDispatchProcessor,
+        )
+from chaind.eth.error import HeldBackError
+from chaind.eth.adapter import EthSqliteAdapter
 
 logging.basicConfig(level=logging.DEBUG)
 logg = logging.getLogger()
@@ -31,13 +51,15 @@ class MockConn:
     def __init__(self):
         self.fails = []
         self.last = None
+        self.location = 'mock'
+        self.chain_spec = None
 
 
     def add_fail(self, v):
         self.fails.append(v)
 
 
-    def do(self, v):
+    def do(self, v, error_parser=None):
         if v in self.fails:
             raise RuntimeError(v)
         v = jsonrpc_validate_dict(v)
@@ -46,15 +68,95 @@ class MockConn:
         self.last = v['params'][0]
 
 
+def signed_txs(chain_spec, senders=2, nonces=3):
+    keystore = DictKeystore()
+    signer = EIP155Signer(keystore)
+    gas_oracle = OverrideGasOracle(price=1, limit=21000)
+    r = {}
+    for i in range(senders):
+        address = keystore.import_raw_key(os.urandom(32))
+        r[address] = []
+        for nonce in range(nonces):
+            c = Gas(chain_spec, signer=signer, gas_oracle=gas_oracle, nonce_oracle=OverrideNonceOracle(address, nonce))
+            (tx_hash, o) = c.create(address, '0x' + 'ee' * 20, 1024)
+            r[address].append(strip_0x(o['params'][0]))
+    return r
+
+
+class MockAsyncConn:
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.fails = []
+        self.sent = []
+        self.inflight = 0
+        self.inflight_max = 0
+        self.lock = threading.Lock()
+
+
+    def do(self, v, error_parser=None):
+        payload = strip_0x(v['params'][0])
+        with self.lock:
+            self.inflight += 1
+            self.inflight_max = max(self.inflight, self.inflight_max)
+        time.sleep(self.delay)
+        with self.lock:
+            self.inflight -= 1
+            if payload in self.fails:
+                raise RPCException('rejected')
+            self.sent.append(payload)
+
+
+class MockResultDispatcher:
+
+    def __init__(self, results):
+        self.results = results
+
+
+    def send_many(self, payloads):
+        return self.results
+
+
+class MockBatchConn(MockConn):
+
+    def __init__(self):
+        super(MockBatchConn, self).__init__()
+        self.batches = []
+
+
+    def do_batch(self, o):
+        self.batches.append(len(o))
+        r = []
+        for v in o:
+            if strip_0x(v['params'][0]) in self.fails:
+                r.append(RPCException(v['params'][0]))
+                continue
+            self.do(v)
+            r.append(v['params'][0])
+        return r
+
+
+class MockDeadConn(MockConn):
+
+    def do(self, v, error_parser=None):
+        raise RPCException('connection refused')
+
+
 class TestEthChaindFs(TestChaindFsBase):
 
     def setUp(self):
         self.cache_adapter = EthCacheTx
         self.conn = MockConn()
         self.dispatcher = EthDispatcher(self.conn)
+        self.decode_cache = EthCacheTx.decode_cache
         super(TestEthChaindFs, self).setUp()
 
 
+    def tearDown(self):
+        EthCacheTx.decode_cache = self.decode_cache
+        super(TestEthChaindFs, self).tearDown()
+
+
     def test_deserialize(self):
         data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
         hsh = self.adapter.put(data)
@@ -62,6 +164,68 @@ class TestEthChaindFs(TestChaindFsBase):
         self.assertEqual(data, v)
 
 
+    def test_deserialize_cache(self):
+        data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
+        EthCacheTx.decode_cache = DecodeCache(capacity=1)
+        tx = EthCacheTx(self.chain_spec)
+        tx.deserialize(data)
+        self.assertEqual(EthCacheTx.decode_cache.misses, 1)
+        self.assertEqual(EthCacheTx.decode_cache.hits, 0)
+
+        tx_again = EthCacheTx(self.chain_spec)
+        tx_again.deserialize(data)
+        self.assertEqual(EthCacheTx.decode_cache.hits, 1)
+        self.assertEqual(tx.hash, tx_again.hash)
+        self.assertEqual(tx.sender, tx_again.sender)
+        self.assertEqual(tx.nonce, tx_again.nonce)
+
+        EthCacheTx.decode_cache.put(self.chain_spec, b'\x00', None)
+        self.assertEqual(len(EthCacheTx.decode_cache), 1)
+        tx_again.deserialize(data)
+        self.assertEqual(EthCacheTx.decode_cache.misses, 2)
+
+        self.assertIsNotNone(EthCacheTx.decode_cache.get(self.chain_spec, bytes.fromhex(data)))
+        self.assertIsNone(EthCacheTx.decode_cache.get(ChainSpec('evm', 'bar', 1), bytes.fromhex(data)))
+
+
+    def test_deserialize_many(self):
+        data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
+        EthCacheTx.decode_cache = DecodeCache(capacity=0)
+        tx = EthCacheTx(self.chain_spec)
+        tx.deserialize(data)
+
+        txs = EthCacheTx.deserialize_many(self.chain_spec, [data, '0x' + data, data], processes=2)
+        self.assertEqual(len(txs), 3)
+        for tx_many in txs:
+            self.assertEqual(tx_many.hash, tx.hash)
+            self.assertEqual(tx_many.sender, tx.sender)
+        self.assertEqual(txs[1].src, '0x' + data)
+
+
+    def test_deserialize_lazy(self):
+        data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
+        EthCacheTx.decode_cache = DecodeCache()
+        tx_lazy = EthLazyCacheTx(self.chain_spec)
+        tx_lazy.deserialize(data)
+        tx = EthCacheTx(self.chain_spec)
+        tx.deserialize(data)
+        self.assertEqual(EthCacheTx.decode_cache.misses, 1)
+
+        tx_lazy = EthLazyCacheTx(self.chain_spec)
+        tx_lazy.deserialize(data)
+        self.assertEqual(tx_lazy.hash, tx.hash)
+        self.assertEqual(tx_lazy.nonce, tx.nonce)
+        self.assertEqual(tx_lazy.recipient, tx.recipient)
+        self.assertEqual(tx_lazy.value, tx.value)
+        self.assertEqual(tx_lazy.src, data)
+        self.assertEqual(EthCacheTx.decode_cache.hits, 0)
+        self.assertEqual(tx_lazy.sender, tx.sender)
+        self.assertEqual(EthCacheTx.decode_cache.hits, 1)
+
+        with self.assertRaises(AttributeError):
+            tx_lazy.foo = 42
+
+
     def test_dispatch(self):
         data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
         hsh = self.adapter.put(data)
@@ -69,5 +233,214 @@ class TestEthChaindFs(TestChaindFsBase):
         self.assertEqual(strip_0x(self.conn.last), strip_0x(data))
 
 
+    def test_dispatch_many(self):
+        conn = MockBatchConn()
+        dispatcher = EthDispatcher(conn, batch_size=2)
+        payloads = ['0xaa', '0xbb', '0xcc']
+        conn.add_fail('bb')
+        errors = dispatcher.send_many(payloads)
+        self.assertEqual(conn.batches, [2, 1])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], RPCException)
+        self.assertIsNone(errors[2])
+        self.assertEqual(strip_0x(conn.last), 'cc')
+
+
+    def test_dispatch_async(self):
+        data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
+        conn = MockConn()
+        dispatcher = EthAsyncDispatcher(conn, self.chain_spec, concurrency=2)
+        errors = dispatcher.send_many([data])
+        dispatcher.shutdown()
+        self.assertEqual(errors, [None])
+        self.assertEqual(strip_0x(conn.last), data)
+
+
+    def test_dispatch_async_senders(self):
+        txs = signed_txs(self.chain_spec, senders=3, nonces=3)
+        senders = list(txs.keys())
+        payloads = []
+        for v in txs.values():
+            payloads += v
+        random.shuffle(payloads)
+
+        conn = MockAsyncConn()
+        conn.fails.append(txs[senders[0]][1])
+        conn.fails.append(txs[senders[1]][2])
+        dispatcher = EthAsyncDispatcher(conn, self.chain_spec, concurrency=3)
+        errors = dispatcher.send_many(payloads)
+        dispatcher.shutdown()
+
+        r = {}
+        for (payload, err) in zip(payloads, errors):
+            r[payload] = err
+        self.assertIsNone(r[txs[senders[0]][0]])
+        self.assertIsInstance(r[txs[senders[0]][1]], RPCException)
+        self.assertIsInstance(r[txs[senders[0]][2]], HeldBackError)
+        self.assertIsNone(r[txs[senders[1]][0]])
+        self.assertIsNone(r[txs[senders[1]][1]])
+        self.assertIsInstance(r[txs[senders[1]][2]], RPCException)
+        for v in txs[senders[2]]:
+            self.assertIsNone(r[v])
+
+        self.assertEqual(len(conn.sent), 6)
+        for sender in senders:
+            sent = [v for v in conn.sent if v in txs[sender]]
+            self.assertEqual(sent, [v for v in txs[sender] if v in sent])
+        self.assertGreater(conn.inflight_max, 1)
+        self.assertLessEqual(conn.inflight_max, 3)
+
+
+    def test_dispatch_many_held_back(self):
+        txs = signed_txs(self.chain_spec, senders=1, nonces=4)
+        payloads = list(txs.values())[0]
+        tx_hashes = []
+        for payload in payloads:
+            tx_hashes.append(self.adapter.put(payload))
+            self.adapter.enqueue(tx_hashes[-1])
+
+        results = [None, RuntimeError('foo'), RPCException('bar'), HeldBackError('baz')]
+        processor = EthDispatchProcessor(self.chain_spec, self.path, MockResultDispatcher(results))
+        self.assertEqual(processor.dispatch_many(self.adapter, tx_hashes), 1)
+
+        self.assertEqual(self.adapter.store.upcoming(), [tx_hashes[3]])
+        self.assertEqual(sorted(self.adapter.store.failed()), sorted(tx_hashes[1:3]))
+
+
+    def test_dispatch_many_reserve_error(self):
+        txs = signed_txs(self.chain_spec, senders=1, nonces=3)
+        tx_hashes = []
+        for payload in list(txs.values())[0]:
+            tx_hashes.append(self.adapter.put(payload))
+            self.adapter.enqueue(tx_hashes[-1])
+
+        send_start = self.adapter.store.send_start
+        def send_start_fail(tx_hash):
+            if tx_hash == tx_hashes[2]:
+                raise RuntimeError('foo')
+            return send_start(tx_hash)
+        self.adapter.store.send_start = send_start_fail
+
+        processor = EthDispatchProcessor(self.chain_spec, self.path, MockResultDispatcher([None] * 3))
+        with self.assertRaises(RuntimeError):
+            processor.dispatch_many(self.adapter, tx_hashes)
+        self.assertEqual(sorted(self.adapter.store.upcoming()), sorted(tx_hashes))
+        self.assertFalse(processor.store_lock.locked())
+
+
+    def test_dispatch_failover(self):
+        data = "f8610d2a82520894eb3907ecad74a0013c259d5874ae7f22dcbcc95c8204008078a0ddbebd76701f6531e5ea42599f890268716e2bb38e3e125874f47595c2338049a00f5648d17b20efac8cb7ff275a510ebef6815e1599e29067821372b83eb1d28c" # valid RLP example data
+        conn_dead = MockDeadConn()
+        conn = MockConn()
+        multi_conn = EthMultiConnection([conn_dead, conn])
+        dispatcher = EthDispatcher(multi_conn)
+        dispatcher.send(data)
+        self.assertEqual(strip_0x(conn.last), data)
+        self.assertGreater(multi_conn.endpoints[0].error_rate, 0)
+        self.assertEqual(multi_conn.ranked()[0].conn, conn)
+
+
+    def test_dispatch_worker(self):
+        calls = []
+        def process(conn):
+            calls.append(conn)
+            return 0
+        worker = DispatchWorker(process, self.conn, interval=60.0)
+        worker.start()
+        worker.wake()
+        worker.stop()
+        worker.join(timeout=5.0)
+        self.assertFalse(worker.is_alive())
+        self.assertGreater(len(calls), 0)
+        self.assertEqual(calls[0], self.conn)
+
+
+    def test_dispatch_worker_error(self):
+        calls = []
+        def process(conn):
+            calls.append(conn)
+            if len(calls) == 1:
+                raise RuntimeError('foo')
+            return 0
+        worker = DispatchWorker(process, self.conn, interval=0.01)
+        worker.start()
+        timeout = time.monotonic() + 5.0
+        while len(calls) < 2 and time.monotonic() < timeout:
+            time.sleep(0.01)
+        self.assertTrue(worker.is_alive())
+        worker.stop()
+        worker.join(timeout=5.0)
+        self.assertGreater(len(calls), 1)
+
+
+    def test_dispatch_worker_ingest(self):
+        txs = signed_txs(self.chain_spec, senders=4, nonces=10)
+        payloads = []
+        for i in range(10):
+            for v in txs.values():
+                payloads.append(v[i])
+
+        conn = MockAsyncConn(delay=0.001)
+        processor = EthDispatchProcessor(self.chain_spec, self.path, EthDispatcher(conn), cache_adapter=EthCacheTx)
+        worker = DispatchWorker(processor.process, conn, interval=0.01, busy_interval=0.001)
+        worker.start()
+        for payload in payloads:
+            with processor.store_lock:
+                tx_hash = self.adapter.put(payload)
+                self.adapter.enqueue(tx_hash)
+            worker.wake()
+
+        timeout = time.monotonic() + 10.0
+        while len(conn.sent) < len(payloads) and time.monotonic() < timeout:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        worker.stop()
+        worker.join(timeout=5.0)
+
+        self.assertGreater(worker.cycles, 1)
+        self.assertEqual(sorted(conn.sent), sorted(payloads))
+        adapter = ChaindFsAdapter(self.chain_spec, self.path, EthCacheTx, None)
+        self.assertEqual(adapter.store.upcoming(), [])
+        self.assertEqual(len(adapter.store.pending()), 0)
+
+
+    def test_dispatch_worker_ingest_sqlite(self):
+        txs = signed_txs(self.chain_spec, senders=4, nonces=10)
+        payloads = []
+        for i in range(10):
+            for v in txs.values():
+                payloads.append(v[i])
+
+        path = os.path.join(self.path, 'sqlite')
+        adapter = EthSqliteAdapter(self.chain_spec, path, EthCacheTx, None, deferred_commit=True)
+        conn = MockAsyncConn(delay=0.001)
+        processor = EthDispatchProcessor(self.chain_spec, path, EthDispatcher(conn), cache_adapter=EthCacheTx, adapter_cls=EthSqliteAdapter)
+        worker = DispatchWorker(processor.process, conn, interval=0.01, busy_interval=0.001)
+        worker.start()
+        for i, payload in enumerate(payloads):
+            with processor.store_lock:
+                tx_hash = adapter.put(payload)
+                adapter.enqueue(tx_hash)
+            if i % 5 == 4:
+                with processor.store_lock:
+                    adapter.commit()
+                worker.wake()
+
+        timeout = time.monotonic() + 10.0
+        while len(conn.sent) < len(payloads) and time.monotonic() < timeout:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertTrue(worker.is_alive())
+        worker.stop()
+        worker.join(timeout=5.0)
+
+        self.assertEqual(sorted(conn.sent), sorted(payloads))
+        self.assertFalse(adapter.factory.db.in_transaction)
+        adapter = EthSqliteAdapter(self.chain_spec, path, EthCacheTx, None)
+        self.assertEqual(adapter.store.upcoming(), [])
+        self.assertEqual(len(adapter.store.pending()), 0)
+        adapter.factory.close()
+
+
 if __name__ == '__main__':
     unittest.main()